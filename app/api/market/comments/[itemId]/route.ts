@@ -6,9 +6,19 @@ export const dynamic = 'force-dynamic'
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
 
-export async function GET(_req: NextRequest, { params }: { params: { itemId: string } }) {
+export async function GET(req: NextRequest, { params }: { params: { itemId: string } }) {
   const backendUrl = `${API_BASE_URL}/market/items/${params.itemId}/comments`
-  const res = await fetch(backendUrl, { method: 'GET', cache: 'no-store' })
+
+  // いいね状態（is_liked）のために閲覧者のヘッダーを転送
+  const headers: HeadersInit = {}
+  const xUserId = req.headers.get('x-user-id')
+  const xDevEmail = req.headers.get('x-dev-email')
+  const authorization = req.headers.get('authorization')
+  if (xUserId) headers['X-User-Id'] = xUserId
+  if (xDevEmail) headers['X-Dev-Email'] = xDevEmail
+  if (authorization) headers['Authorization'] = authorization
+
+  const res = await fetch(backendUrl, { method: 'GET', headers, cache: 'no-store' })
   const text = await res.text()
   return new NextResponse(text, {
     status: res.status,
@@ -2,40 +2,28 @@ from fastapi import APIRouter, Depends, Request, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, not_, or_, extract
 from typing import Optional
-import re
 import models, database
+import identity
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
-ADMIN_EMAIL_PATTERN = re.compile(r"^(master|mster)(00|0?[1-9]|[1-2][0-9]|30)@(?:[\w.-]+\.)?ac\.jp$", re.IGNORECASE)
-
-def is_admin_email(email: Optional[str]) -> bool:
-    if not email:
-        return False
-    return ADMIN_EMAIL_PATTERN.match(email or "") is not None
+def viewer_fields(request: Request, viewer: Optional[identity.Viewer]):
+    """記録用の (user_id, email)。未登録の X-Dev-Email はメールだけ記録する"""
+    if viewer:
+        return viewer.id, (viewer.email or "").strip().lower() or None
+    return None, identity.header_dev_email(request)
 
 # （アクティブランキング機能は削除）
 
 @router.post("/track")
-async def track_page_view(request: Request, db: Session = Depends(database.get_db)):
-    """PVを1件記録する（誰でも可）。ヘッダーからuser_id/emailを拾う。"""
+async def track_page_view(
+    request: Request,
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
+    db: Session = Depends(database.get_db),
+):
+    """PVを1件記録する（誰でも可）。閲覧者からuser_id/emailを拾う。"""
     headers = request.headers
-    user_id = headers.get("X-User-Id")
-    dev_email = headers.get("X-Dev-Email")
-    try:
-        user_id_int = int(user_id) if user_id else None
-    except:
-        user_id_int = None
-
-    email = None
-    if dev_email:
-        email = dev_email.strip().lower()
-    else:
-        # user_idがあればDBからメールを取得
-        if user_id_int:
-            user = db.query(models.User).filter(models.User.id == user_id_int).first()
-            if user:
-                email = (user.email or "").strip().lower()
+    user_id_int, email = viewer_fields(request, viewer)
 
     body = await request.json() if request.headers.get("content-type", "").startswith("application/json") else {}
     path = (body.get("path") if isinstance(body, dict) else None) or request.url.path
@@ -47,23 +35,13 @@ async def track_page_view(request: Request, db: Session = Depends(database.get_d
     return {"message": "tracked"}
 
 @router.post("/event")
-async def track_event(request: Request, db: Session = Depends(database.get_db)):
+async def track_event(
+    request: Request,
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
+    db: Session = Depends(database.get_db),
+):
     """汎用イベント記録。master*@ac.jp は集計から除外するため、記録はするが集計側で除外。"""
-    headers = request.headers
-    user_id = headers.get("X-User-Id")
-    dev_email = headers.get("X-Dev-Email")
-    try:
-        user_id_int = int(user_id) if user_id else None
-    except:
-        user_id_int = None
-
-    email = None
-    if dev_email:
-        email = dev_email.strip().lower()
-    elif user_id_int:
-        user = db.query(models.User).filter(models.User.id == user_id_int).first()
-        if user:
-            email = (user.email or "").strip().lower()
+    user_id_int, email = viewer_fields(request, viewer)
 
     json = await request.json()
     event_name = (json.get("event_name") or "").strip()
@@ -95,27 +73,13 @@ async def track_event(request: Request, db: Session = Depends(database.get_db)):
     return {"message": "event_tracked"}
 
 @router.get("/summary")
-async def analytics_summary(request: Request, days: int = 7, db: Session = Depends(database.get_db)):
+async def analytics_summary(
+    request: Request,
+    days: int = 7,
+    admin: identity.Viewer = Depends(identity.require_admin_viewer),
+    db: Session = Depends(database.get_db),
+):
     """管理者専用: 直近days日分のPVと投稿動向（管理者以外）を返す。"""
-    # 管理者チェック（X-User-Id または X-Dev-Email）
-    user_id = request.headers.get("X-User-Id")
-    dev_email = request.headers.get("X-Dev-Email")
-
-    email = None
-    if dev_email:
-        email = dev_email.strip().lower()
-    elif user_id:
-        try:
-            uid = int(user_id)
-        except:
-            uid = None
-        if uid:
-            user = db.query(models.User).filter(models.User.id == uid).first()
-            email = (user.email or "").strip().lower() if user else None
-
-    if not is_admin_email(email):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者のみが閲覧できます")
-
     # 期間フィルタ
     from datetime import timedelta
     since = models.jst_now() - timedelta(days=days)
@@ -188,27 +152,12 @@ async def analytics_summary(request: Request, days: int = 7, db: Session = Depen
     }
 
 @router.post("/clear")
-async def clear_analytics(request: Request, db: Session = Depends(database.get_db)):
+async def clear_analytics(
+    request: Request,
+    admin: identity.Viewer = Depends(identity.require_admin_viewer),
+    db: Session = Depends(database.get_db),
+):
     """管理者専用: アナリティクス関連テーブル(PageView, AnalyticsEvent)を全削除"""
-    # 管理者チェック
-    user_id = request.headers.get("X-User-Id")
-    dev_email = request.headers.get("X-Dev-Email")
-
-    email = None
-    if dev_email:
-        email = dev_email.strip().lower()
-    elif user_id:
-        try:
-            uid = int(user_id)
-        except:
-            uid = None
-        if uid:
-            user = db.query(models.User).filter(models.User.id == uid).first()
-            email = (user.email or "").strip().lower() if user else None
-
-    if not is_admin_email(email):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者のみが実行できます")
-
     # 削除処理（存在チェックしつつ）
     db.query(models.PageView).delete()
     if hasattr(models, 'AnalyticsEvent'):
@@ -0,0 +1,107 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+import os
+import models, database
+import blob_store
+import identity
+
+router = APIRouter(prefix="/blobs", tags=["blobs"])
+
+# 内容が変わらない（URL = 内容のハッシュ）ため1年キャッシュさせる
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# サムネイル未生成で元画像を返す場合（後から生成されうるので短め）
+FALLBACK_CACHE = "public, max-age=86400"
+
+def blob_info(blob: models.Blob) -> dict:
+    ref = blob_store.ref_for(blob.sha256)
+    return {
+        "sha256": blob.sha256,
+        "url": blob_store.public_url(ref),
+        "thumbnail_url": blob_store.thumbnail_url(ref),
+        "ref": ref,
+        "content_type": blob.content_type,
+        "size": blob.size,
+    }
+
+def _parse_range(header: str, size: int):
+    """単一の bytes 範囲を (start, end) に解釈する（end は含む）。解釈できない指定は None（全体を返す）"""
+    if not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_s == "":
+            # 末尾 N バイト
+            length = int(end_s)
+            if length <= 0:
+                raise ValueError
+            return max(0, size - length), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="範囲が不正です",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, min(end, size - 1)
+
+def _serve(request: Request, blob: models.Blob, cache_control: str):
+    path = blob_store.path_for(blob.sha256)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ファイルが見つかりません")
+    etag = f'"{blob.sha256}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    range_header = request.headers.get("range")
+    byte_range = _parse_range(range_header, blob.size) if range_header else None
+    if byte_range is None:
+        return FileResponse(path, media_type=blob.content_type, headers=headers)
+    start, end = byte_range
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{blob.size}"
+    return Response(content=data, status_code=status.HTTP_206_PARTIAL_CONTENT, media_type=blob.content_type, headers=headers)
+
+def _get_blob(db: Session, sha256: str) -> models.Blob:
+    blob = db.get(models.Blob, sha256) if blob_store.SHA256_PATTERN.match(sha256) else None
+    if blob is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ファイルが見つかりません")
+    return blob
+
+@router.post("")
+def upload_blob(
+    file: UploadFile = File(...),
+    viewer: identity.Viewer = Depends(identity.require_viewer),
+    db: Session = Depends(database.get_db),
+):
+    """画像をアップロードして不変URLを返す（出品の images などに url をそのまま指定する）"""
+    data = file.file.read(blob_store.MAX_BYTES + 1)
+    try:
+        blob = blob_store.put_bytes(db, data, file.content_type or "")
+    except blob_store.BlobError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    db.commit()
+    return blob_info(blob)
+
+@router.get("/{sha256}")
+def get_blob(sha256: str, request: Request, db: Session = Depends(database.get_db)):
+    return _serve(request, _get_blob(db, sha256), IMMUTABLE_CACHE)
+
+@router.get("/{sha256}/thumb")
+def get_blob_thumbnail(sha256: str, request: Request, db: Session = Depends(database.get_db)):
+    """サムネイル（未生成なら生成を試み、作れなければ元画像を返す）"""
+    blob = _get_blob(db, sha256)
+    if not blob.thumb_sha256:
+        blob_store.ensure_thumbnail(db, blob)
+        if blob.thumb_sha256:
+            db.commit()
+    thumb = db.get(models.Blob, blob.thumb_sha256) if blob.thumb_sha256 else None
+    if thumb is None:
+        return _serve(request, blob, FALLBACK_CACHE)
+    return _serve(request, thumb, IMMUTABLE_CACHE)
@@ -0,0 +1,241 @@
+"""
+画像（出品画像・プロフィール画像）のコンテンツアドレス型ストア
+
+- 実体は BLOB_STORE_DIR 以下に内容の SHA-256 をファイル名にして保存する（同じ内容は1つにまとまる）
+- 種別・サイズ・サムネイルの対応は blobs テーブルに持つ
+- DB（market_items.images / users.profile_image）には参照 "/blobs/<sha256>" だけを保存し、
+  レスポンスでは public_url() で公開URLにする（PUBLIC_API_URL があれば前置）
+- 内容が変わらないため URL は不変。配信側は長期キャッシュ（immutable）と Range に対応する
+- サムネイルは Pillow（requirements.txt）で生成する。入っていない環境では起動時に警告し、元画像をそのまま返す
+
+旧形式の DataURL は保存時に from_data_url() で取り出し、既存データは起動時の extract_data_urls() で移行する。
+"""
+
+import base64
+import binascii
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+from typing import Optional
+from urllib.parse import urlsplit
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+
+try:
+    from PIL import Image
+except ImportError:  # サムネイル生成は任意
+    Image = None
+
+BLOB_DIR = os.getenv("BLOB_STORE_DIR", "./blobs")
+PUBLIC_BASE_URL = os.getenv("PUBLIC_API_URL", "").rstrip("/")
+
+URL_PREFIX = "/blobs/"
+MAX_BYTES = 5 * 1024 * 1024
+ALLOWED_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+THUMB_TYPES = {"image/jpeg", "image/png", "image/webp"}
+THUMB_MAX_PX = 320
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+DATA_URL_PATTERN = re.compile(r"^data:([\w.+-]+/[\w.+-]+);base64,(.*)$", re.DOTALL)
+
+class BlobError(ValueError):
+    """保存できない内容（種別違い・サイズ超過・壊れたDataURL）"""
+
+# -----------------------------
+# 参照とURL
+# -----------------------------
+
+def ref_for(sha256: str) -> str:
+    return f"{URL_PREFIX}{sha256}"
+
+def sha_of_ref(ref: Optional[str]) -> Optional[str]:
+    if ref and ref.startswith(URL_PREFIX):
+        sha = ref[len(URL_PREFIX):].split("/", 1)[0]
+        if SHA256_PATTERN.match(sha):
+            return sha
+    return None
+
+def normalize_ref(value: Optional[str]) -> Optional[str]:
+    """公開URL（http://host/blobs/<sha256>）で渡された値を保存用の参照に戻す"""
+    if not value or value.startswith(URL_PREFIX):
+        return value
+    path = urlsplit(value).path if value.startswith(("http://", "https://")) else ""
+    return path if sha_of_ref(path) else value
+
+def public_url(ref: Optional[str]) -> Optional[str]:
+    """保存済みの参照を公開URLにする（外部URLなど他の値はそのまま）"""
+    if ref and PUBLIC_BASE_URL and sha_of_ref(ref):
+        return PUBLIC_BASE_URL + ref
+    return ref
+
+def thumbnail_url(ref: Optional[str]) -> Optional[str]:
+    return public_url(f"{ref}/thumb") if sha_of_ref(ref) else ref
+
+def path_for(sha256: str) -> str:
+    return os.path.join(BLOB_DIR, sha256[:2], sha256)
+
+# -----------------------------
+# 保存
+# -----------------------------
+
+def _write_file(sha256: str, data: bytes) -> None:
+    path = path_for(sha256)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 一時ファイルに書いてから置き換える（途中までのファイルを配信しない）
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def _store(db: Session, data: bytes, content_type: str) -> models.Blob:
+    sha256 = hashlib.sha256(data).hexdigest()
+    _write_file(sha256, data)
+    blob = db.get(models.Blob, sha256)
+    if blob is not None:
+        return blob
+    try:
+        with db.begin_nested():
+            blob = models.Blob(sha256=sha256, content_type=content_type, size=len(data))
+            db.add(blob)
+    except IntegrityError:
+        # 同じ内容が並行して保存された
+        blob = db.get(models.Blob, sha256)
+    return blob
+
+def _make_thumbnail(data: bytes) -> Optional[tuple[bytes, str]]:
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if max(img.size) <= THUMB_MAX_PX:
+                return None
+            img.thumbnail((THUMB_MAX_PX, THUMB_MAX_PX))
+            out = io.BytesIO()
+            if img.mode in ("RGBA", "LA", "P"):
+                img.save(out, format="PNG", optimize=True)
+                return out.getvalue(), "image/png"
+            img.convert("RGB").save(out, format="JPEG", quality=80, optimize=True)
+            return out.getvalue(), "image/jpeg"
+    except Exception as e:
+        print(f"⚠️ サムネイル生成に失敗: {e}")
+        return None
+
+def check_thumbnail_support() -> bool:
+    """起動時に1回呼ぶ。Pillow がなければサムネイルを生成できないことをログに残す"""
+    if Image is None:
+        print("⚠️ Pillow がインストールされていないためサムネイルを生成しません（requirements.txt の Pillow を入れてください）")
+        return False
+    return True
+
+def ensure_thumbnail(db: Session, blob: models.Blob) -> None:
+    """サムネイルがなければ生成して紐づける（Pillow がない・小さい画像では何もしない）"""
+    if blob.thumb_sha256 or blob.content_type not in THUMB_TYPES or Image is None:
+        return
+    data = read_bytes(blob.sha256)
+    if data is None:
+        return
+    thumb = _make_thumbnail(data)
+    if thumb is not None:
+        blob.thumb_sha256 = _store(db, *thumb).sha256
+
+def put_bytes(db: Session, data: bytes, content_type: str) -> models.Blob:
+    """画像を保存して blobs の行を返す（同じ内容なら既存の行。コミットは呼び出し側）"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type not in ALLOWED_TYPES:
+        raise BlobError("対応していない画像形式です（JPEG/PNG/WebP/GIF）")
+    if not data:
+        raise BlobError("画像が空です")
+    if len(data) > MAX_BYTES:
+        raise BlobError(f"画像サイズが大きすぎます（最大{MAX_BYTES // (1024 * 1024)}MB）")
+    blob = _store(db, data, content_type)
+    ensure_thumbnail(db, blob)
+    return blob
+
+def from_data_url(db: Session, value: Optional[str]) -> Optional[str]:
+    """DataURL なら保存して参照に置き換える（それ以外の値はそのまま。不正なDataURLは BlobError）"""
+    if not value or not value.startswith("data:"):
+        return value
+    match = DATA_URL_PATTERN.match(value)
+    if not match:
+        raise BlobError("画像データの形式が不正です")
+    try:
+        data = base64.b64decode(match.group(2), validate=False)
+    except (binascii.Error, ValueError):
+        raise BlobError("画像データの形式が不正です")
+    return ref_for(put_bytes(db, data, match.group(1)).sha256)
+
+def read_bytes(sha256: str) -> Optional[bytes]:
+    try:
+        with open(path_for(sha256), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+# -----------------------------
+# 既存 DataURL の移行
+# -----------------------------
+
+def _extract_images(db: Session, raw: Optional[str]) -> Optional[str]:
+    try:
+        images = json.loads(raw) if raw else []
+    except ValueError:
+        return raw
+    converted = []
+    for value in images if isinstance(images, list) else []:
+        if not isinstance(value, str):
+            continue
+        try:
+            converted.append(from_data_url(db, value))
+        except BlobError as e:
+            print(f"⚠️ 出品画像を移行できませんでした（除外します）: {e}")
+    return json.dumps(converted)
+
+def extract_data_urls(session_factory, batch_size: int = 50) -> dict:
+    """market_items.images / users.profile_image に残る DataURL を blob に移して参照に置き換える（起動時）"""
+    moved = {"market_items": 0, "users": 0}
+    db = session_factory()
+    try:
+        last_id = 0
+        while True:
+            items = db.query(models.MarketItem).filter(
+                models.MarketItem.id > last_id,
+                models.MarketItem.images.like("%data:%"),
+            ).order_by(models.MarketItem.id).limit(batch_size).all()
+            if not items:
+                break
+            for item in items:
+                item.images = _extract_images(db, item.images)
+                moved["market_items"] += 1
+            last_id = items[-1].id
+            db.commit()
+
+        last_id = 0
+        while True:
+            users = db.query(models.User).filter(
+                models.User.id > last_id,
+                models.User.profile_image.like("data:%"),
+            ).order_by(models.User.id).limit(batch_size).all()
+            if not users:
+                break
+            for user in users:
+                try:
+                    user.profile_image = from_data_url(db, user.profile_image)
+                except BlobError as e:
+                    print(f"⚠️ プロフィール画像を移行できませんでした（user_id={user.id}）: {e}")
+                    user.profile_image = None
+                moved["users"] += 1
+            last_id = users[-1].id
+            db.commit()
+    finally:
+        db.close()
+    return moved
@@ -0,0 +1,233 @@
+"""
+掲示板の更新イベント（新規投稿/返信/いいね/編集/削除）の配信（/board/stream のSSE用）
+
+- 書き込み側（board_routes）はコミット後に publish() を呼ぶ
+- ブローカーがイベントに連番IDを付けて配り、各ワーカーのハブが接続中の購読者（asyncio.Queue）へ渡す
+- ブローカーは BOARD_EVENTS_BROKER 環境変数で切り替える
+    local  … プロセス内のみ（既定。ワーカー1つの構成向け）
+    sqlite … 共有のSQLiteファイル（BOARD_EVENTS_SQLITE_PATH）を介して複数ワーカーでイベントを共有
+- 直近のイベントはハブに保持し、再接続時の Last-Event-ID 以降を再送する
+
+配信は補助的な通知のため、失敗しても書き込みのリクエストは失敗させない。
+"""
+
+import abc
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+import models
+
+# 購読者ごとのキューの上限（溢れたら古いものから捨てる）
+SUBSCRIBER_QUEUE_SIZE = 256
+# 再接続時の再送用に保持する件数
+RECENT_EVENTS = 500
+# 無通信時のコメント行（プロキシのタイムアウト対策）の間隔（秒）
+KEEPALIVE_SECONDS = 15
+# クライアントの再接続待ち（ミリ秒）
+RETRY_MS = 3000
+
+# -----------------------------
+# ブローカー
+# -----------------------------
+
+class Broker(abc.ABC):
+    """publish されたイベントにIDを付けて、全ワーカーの deliver へ届ける"""
+
+    @abc.abstractmethod
+    def publish(self, event: dict) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def run(self, deliver) -> None:
+        """受信ループ（startup でタスクとして起動）。deliver はイベントループ上で呼ぶ"""
+
+class LocalBroker(Broker):
+    """プロセス内だけで配るブローカー"""
+
+    def __init__(self):
+        self._ids = itertools.count(int(time.time() * 1000))
+        self._ids_lock = threading.Lock()
+        self._deliver = None
+        self._loop = None
+
+    def publish(self, event: dict) -> None:
+        if self._deliver is None or self._loop is None:
+            return
+        with self._ids_lock:
+            event = {**event, "id": next(self._ids)}
+        self._loop.call_soon_threadsafe(self._deliver, event)
+
+    async def run(self, deliver) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._deliver = deliver
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self._deliver = None
+
+class SQLiteBroker(Broker):
+    """共有SQLiteファイルに追記し、各ワーカーがポーリングで読み出すブローカー"""
+
+    POLL_INTERVAL_SECONDS = 0.5
+    RETENTION_SECONDS = 600
+    FETCH_LIMIT = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS board_events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def publish(self, event: dict) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO board_events (payload, created_at) VALUES (?, ?)",
+                (json.dumps(event, ensure_ascii=False), time.time()),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _latest_id(self) -> int:
+        conn = self._connect()
+        try:
+            return int(conn.execute("SELECT COALESCE(MAX(id), 0) FROM board_events").fetchone()[0])
+        finally:
+            conn.close()
+
+    def _fetch(self, after_id: int, prune: bool) -> list[dict]:
+        conn = self._connect()
+        try:
+            if prune:
+                conn.execute("DELETE FROM board_events WHERE created_at < ?", (time.time() - self.RETENTION_SECONDS,))
+                conn.commit()
+            rows = conn.execute(
+                "SELECT id, payload FROM board_events WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, self.FETCH_LIMIT),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{**json.loads(payload), "id": event_id} for event_id, payload in rows]
+
+    async def run(self, deliver) -> None:
+        last_id = await asyncio.to_thread(self._latest_id)
+        last_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(self.POLL_INTERVAL_SECONDS)
+            prune = time.monotonic() - last_prune > self.RETENTION_SECONDS
+            if prune:
+                last_prune = time.monotonic()
+            try:
+                events = await asyncio.to_thread(self._fetch, last_id, prune)
+            except Exception as e:
+                print(f"⚠️ 掲示板イベントの読み出しに失敗: {e}")
+                continue
+            for event in events:
+                last_id = event["id"]
+                deliver(event)
+
+def create_broker() -> Broker:
+    kind = os.getenv("BOARD_EVENTS_BROKER", "local").lower()
+    if kind == "sqlite":
+        path = os.getenv("BOARD_EVENTS_SQLITE_PATH", "/tmp/urib_board_events.sqlite3")
+        return SQLiteBroker(path)
+    return LocalBroker()
+
+_broker: Broker = LocalBroker()
+
+# -----------------------------
+# ハブ（このワーカーの購読者へ配る。イベントループ上でのみ操作する）
+# -----------------------------
+
+class Subscriber:
+    def __init__(self, board_ids: set[str] | None):
+        self.board_ids = board_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def wants(self, event: dict) -> bool:
+        return not self.board_ids or event.get("board_id") in self.board_ids
+
+    def offer(self, event: dict) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+_subscribers: set[Subscriber] = set()
+_recent: deque = deque(maxlen=RECENT_EVENTS)
+
+def _deliver(event: dict) -> None:
+    _recent.append(event)
+    for subscriber in list(_subscribers):
+        if subscriber.wants(event):
+            subscriber.offer(event)
+
+def subscribe(board_ids=None, last_event_id=None) -> Subscriber:
+    subscriber = Subscriber({str(b) for b in board_ids} if board_ids else None)
+    if last_event_id is not None:
+        for event in _recent:
+            if event["id"] > last_event_id and subscriber.wants(event):
+                subscriber.offer(event)
+    _subscribers.add(subscriber)
+    return subscriber
+
+def unsubscribe(subscriber: Subscriber) -> None:
+    _subscribers.discard(subscriber)
+
+def subscriber_count() -> int:
+    return len(_subscribers)
+
+# -----------------------------
+# 公開API
+# -----------------------------
+
+def publish(event_type: str, board_id, **fields) -> None:
+    """コミット後に呼ぶ（例: publish("post_created", post.board_id, post_id=post.id)）"""
+    event = {"type": event_type, "board_id": str(board_id), "at": models.jst_now().isoformat(), **fields}
+    try:
+        _broker.publish(event)
+    except Exception as e:
+        print(f"⚠️ 掲示板イベントの配信に失敗: {e}")
+
+def start():
+    """startup で呼び、返したコルーチンをタスクとして起動する"""
+    global _broker
+    _broker = create_broker()
+    print(f"✅ 掲示板イベント配信を開始しました（{type(_broker).__name__}）")
+    return _broker.run(_deliver)
+
+def format_event(event: dict) -> str:
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+async def stream(request, board_ids=None, last_event_id=None):
+    """SSE 本文を生成する（切断まで続く）"""
+    subscriber = subscribe(board_ids, last_event_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            if await request.is_disconnected():
+                break
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        unsubscribe(subscriber)
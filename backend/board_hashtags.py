@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+掲示板ハッシュタグの正規化テーブル（hashtags / post_hashtags）とトレンド集計（hashtag_buckets）
+
+- 投稿の作成/編集/削除時に sync_post_hashtags / remove_post_hashtags を呼び、同一トランザクション内で同期する
+- 利用数は投稿作成時刻の1時間単位のバケットに加算し、トレンドは半減期付きの指数減衰で重み付けして合計する
+- 単体で実行すると投稿テーブルから全件再構築する（整合性の回復用）
+
+使い方: python board_hashtags.py
+"""
+
+import re
+import unicodedata
+from datetime import timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import database
+import models
+
+# トレンドの減衰: 経過時間がこの値に達すると重みが半分になる
+TRENDING_HALF_LIFE_HOURS = 24.0
+# トレンド集計で参照するバケットの範囲
+TRENDING_WINDOW_HOURS = 24 * 7
+# 掲示板統計の「人気のハッシュタグ」で参照する範囲と件数
+BOARD_POPULAR_WINDOW_HOURS = 24 * 30
+BOARD_POPULAR_LIMIT = 3
+
+MAX_TAG_LENGTH = 100
+TAG_SEPARATOR = re.compile(r"[\s,、，]+")
+
+def normalize_tag(raw: str | None) -> str:
+    """#の有無・全角半角・大文字小文字の揺れを吸収した検索キー"""
+    if not raw:
+        return ""
+    value = unicodedata.normalize("NFKC", raw).strip().lstrip("#").strip()
+    return value.lower()[:MAX_TAG_LENGTH]
+
+def parse_hashtags(value: str | None) -> dict[str, str]:
+    """ハッシュタグ文字列（空白/カンマ区切り）を {正規化名: 表示名} に分解（出現順）"""
+    tags: dict[str, str] = {}
+    for token in TAG_SEPARATOR.split(value or ""):
+        name = normalize_tag(token)
+        if name and name not in tags:
+            display = unicodedata.normalize("NFKC", token).strip().lstrip("#")[:MAX_TAG_LENGTH]
+            tags[name] = "#" + display
+    return tags
+
+def hour_bucket(dt):
+    """JSTの正時に切り捨て（タイムゾーンなしの値はJSTとみなす）"""
+    if dt is None:
+        dt = models.jst_now()
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=models.JST)
+    return dt.astimezone(models.JST).replace(minute=0, second=0, microsecond=0)
+
+def get_hashtag(db: Session, name: str):
+    return db.query(models.Hashtag).filter(models.Hashtag.name == name).first()
+
+def _get_or_create_hashtag(db: Session, name: str, display_name: str) -> models.Hashtag:
+    """タグ行を取得（なければ作成）。同じ新規タグの並行作成は一意制約で吸収する"""
+    tag = get_hashtag(db, name)
+    if tag:
+        return tag
+    insert = database.dialect_insert(db)
+    if insert is not None:
+        table = models.Hashtag.__table__
+        db.execute(insert(table).values(name=name, display_name=display_name, post_count=0).on_conflict_do_nothing(
+            index_elements=[table.c.name]
+        ))
+    else:
+        try:
+            with db.begin_nested():
+                db.add(models.Hashtag(name=name, display_name=display_name, post_count=0))
+        except IntegrityError:
+            pass
+    return get_hashtag(db, name)
+
+def _bump_bucket(db: Session, hashtag_id: int, board_id: str, bucket_start, delta: int) -> None:
+    """バケットの件数を加減算する（加算でバケットがなければ作成。並行した作成は upsert で吸収する）"""
+    bucket = models.HashtagBucket
+    insert = database.dialect_insert(db)
+    if delta > 0 and insert is not None:
+        table = bucket.__table__
+        stmt = insert(table).values(hashtag_id=hashtag_id, board_id=board_id, bucket_start=bucket_start, count=delta)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.hashtag_id, table.c.board_id, table.c.bucket_start],
+            set_={"count": table.c.count + delta},
+        ))
+        return
+    filters = (
+        bucket.hashtag_id == hashtag_id,
+        bucket.board_id == board_id,
+        bucket.bucket_start == bucket_start,
+    )
+    updated = db.query(bucket).filter(*filters).update(
+        {bucket.count: bucket.count + delta}, synchronize_session=False
+    )
+    if not updated and delta > 0:
+        try:
+            with db.begin_nested():
+                db.add(bucket(hashtag_id=hashtag_id, board_id=board_id, bucket_start=bucket_start, count=delta))
+        except IntegrityError:
+            db.query(bucket).filter(*filters).update({bucket.count: bucket.count + delta}, synchronize_session=False)
+
+def _attach(db: Session, post: models.BoardPost, tag: models.Hashtag) -> None:
+    db.add(models.PostHashtag(
+        post_id=post.id, hashtag_id=tag.id, board_id=str(post.board_id), created_at=post.created_at or models.jst_now()
+    ))
+    db.query(models.Hashtag).filter(models.Hashtag.id == tag.id).update(
+        {models.Hashtag.post_count: models.Hashtag.post_count + 1}, synchronize_session=False
+    )
+    _bump_bucket(db, tag.id, str(post.board_id), hour_bucket(post.created_at), 1)
+
+def _detach(db: Session, link: models.PostHashtag) -> None:
+    db.query(models.Hashtag).filter(models.Hashtag.id == link.hashtag_id).update(
+        {models.Hashtag.post_count: models.Hashtag.post_count - 1}, synchronize_session=False
+    )
+    _bump_bucket(db, link.hashtag_id, link.board_id, hour_bucket(link.created_at), -1)
+    db.delete(link)
+
+# -----------------------------
+# 書き込み時の同期
+# -----------------------------
+
+def sync_post_hashtags(db: Session, post: models.BoardPost) -> None:
+    """投稿の hashtags 文字列と post_hashtags を一致させる（差分のみ追加/削除。コミットは呼び出し側）"""
+    wanted = parse_hashtags(post.hashtags)
+    links = db.query(models.PostHashtag, models.Hashtag.name).join(
+        models.Hashtag, models.Hashtag.id == models.PostHashtag.hashtag_id
+    ).filter(models.PostHashtag.post_id == post.id).all()
+    current = {name: link for link, name in links}
+    for name, link in current.items():
+        if name not in wanted:
+            _detach(db, link)
+    for name, display in wanted.items():
+        if name not in current:
+            _attach(db, post, _get_or_create_hashtag(db, name, display))
+    db.flush()
+
+def remove_post_hashtags(db: Session, post_ids) -> None:
+    """投稿削除時: 対応行を外し、利用数とバケットを戻す"""
+    ids = [int(i) for i in post_ids]
+    if not ids:
+        return
+    for link in db.query(models.PostHashtag).filter(models.PostHashtag.post_id.in_(ids)).all():
+        _detach(db, link)
+    db.flush()
+
+# -----------------------------
+# トレンド
+# -----------------------------
+
+def _decayed_scores(db: Session, window_hours: float, board_ids=None) -> dict:
+    """{(board_id, hashtag_id): [減衰込みスコア, 期間内の件数]}"""
+    now = models.jst_now()
+    since = hour_bucket(now - timedelta(hours=window_hours))
+    q = db.query(
+        models.HashtagBucket.board_id,
+        models.HashtagBucket.hashtag_id,
+        models.HashtagBucket.bucket_start,
+        models.HashtagBucket.count,
+    ).filter(
+        models.HashtagBucket.bucket_start >= since,
+        models.HashtagBucket.count > 0,
+    )
+    if board_ids is not None:
+        q = q.filter(models.HashtagBucket.board_id.in_([str(b) for b in board_ids]))
+    scores: dict = {}
+    for board_id, hashtag_id, bucket_start, count in q.all():
+        age_hours = max(0.0, (now - hour_bucket(bucket_start)).total_seconds() / 3600.0)
+        weight = 0.5 ** (age_hours / TRENDING_HALF_LIFE_HOURS)
+        entry = scores.setdefault((board_id, hashtag_id), [0.0, 0])
+        entry[0] += count * weight
+        entry[1] += count
+    return scores
+
+def _display_names(db: Session, hashtag_ids) -> dict:
+    if not hashtag_ids:
+        return {}
+    rows = db.query(models.Hashtag.id, models.Hashtag.display_name, models.Hashtag.name).filter(
+        models.Hashtag.id.in_(list(hashtag_ids))
+    ).all()
+    return {i: (display, name) for i, display, name in rows}
+
+def trending(db: Session, board_id: str | None = None, limit: int = 10) -> list[dict]:
+    """減衰スコア順のトレンドタグ"""
+    scores = _decayed_scores(db, TRENDING_WINDOW_HOURS, [board_id] if board_id else None)
+    totals: dict[int, list] = {}
+    for (_board, hashtag_id), (score, count) in scores.items():
+        entry = totals.setdefault(hashtag_id, [0.0, 0])
+        entry[0] += score
+        entry[1] += count
+    ranked = sorted(totals.items(), key=lambda kv: (kv[1][0], kv[0]), reverse=True)[:limit]
+    names = _display_names(db, [hashtag_id for hashtag_id, _ in ranked])
+    return [
+        {
+            "tag": names[hashtag_id][0],
+            "name": names[hashtag_id][1],
+            "score": round(score, 4),
+            "recent_count": count,
+        }
+        for hashtag_id, (score, count) in ranked if hashtag_id in names
+    ]
+
+def popular_by_board(db: Session, board_ids, limit: int = BOARD_POPULAR_LIMIT) -> dict[str, list[str]]:
+    """掲示板ごとの人気タグ（表示名）。/board/stats 用にまとめて1回で集計する"""
+    scores = _decayed_scores(db, BOARD_POPULAR_WINDOW_HOURS, board_ids)
+    per_board: dict[str, list] = {}
+    for (board_id, hashtag_id), (score, _count) in scores.items():
+        per_board.setdefault(board_id, []).append((score, hashtag_id))
+    top = {b: [h for _s, h in sorted(items, reverse=True)[:limit]] for b, items in per_board.items()}
+    names = _display_names(db, {h for ids in top.values() for h in ids})
+    return {b: [names[h][0] for h in ids if h in names] for b, ids in top.items()}
+
+# -----------------------------
+# 再構築
+# -----------------------------
+
+def rebuild_hashtags(db: Session) -> int:
+    """投稿テーブルから hashtags / post_hashtags / hashtag_buckets を作り直す。対象投稿数を返す（コミットしない）"""
+    db.query(models.HashtagBucket).delete(synchronize_session=False)
+    db.query(models.PostHashtag).delete(synchronize_session=False)
+    db.query(models.Hashtag).delete(synchronize_session=False)
+    db.flush()
+    posts = db.query(models.BoardPost).filter(
+        models.BoardPost.hashtags.isnot(None),
+        models.BoardPost.hashtags != "",
+    ).order_by(models.BoardPost.id).all()
+    for post in posts:
+        sync_post_hashtags(db, post)
+    return len(posts)
+
+def ensure_hashtags(db: Session) -> None:
+    """起動時の初期化: 正規化テーブルが空でタグ付き投稿がある場合だけ構築する"""
+    if db.query(models.Hashtag.id).first() is not None:
+        return
+    has_tagged = db.query(models.BoardPost.id).filter(
+        models.BoardPost.hashtags.isnot(None),
+        models.BoardPost.hashtags != "",
+    ).first() is not None
+    if not has_tagged:
+        return
+    count = rebuild_hashtags(db)
+    db.commit()
+    print(f"✅ ハッシュタグ索引を初期構築しました（{count}投稿）")
+
+if __name__ == "__main__":
+    import database
+    models.Base.metadata.create_all(bind=database.engine)
+    session = database.SessionLocal()
+    try:
+        print("ハッシュタグ索引の再構築開始...")
+        count = rebuild_hashtags(session)
+        session.commit()
+        print(f"✅ ハッシュタグ索引を再構築しました（{count}投稿）")
+    finally:
+        session.close()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+全体フィードの「人気」「トレンド」用の時間減衰スコア（board_posts.popular_score / trending_score）
+
+score = log2(1 + いいね数×like_weight + 返信数×reply_weight) + 作成時刻(時間) / half_life_hours
+
+作成時刻の項が単調に増えるため、half_life_hours 新しい投稿と並ぶには反応が2倍必要になる
+（Reddit方式。HNの重力減衰と同じ順序を、時間経過で値を更新せずに保てる）。
+スコアはいいね/返信の変化時に投稿単位で更新し、定期スイープでパラメータ変更の反映と未計算行の補完を行う。
+
+パラメータは board_ranking_params テーブル（管理者API）で変更でき、再デプロイなしで反映される。
+
+使い方: python board_ranking.py   # 全投稿のスコアを再計算
+"""
+
+import asyncio
+import math
+from datetime import datetime
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+import models
+import http_cache
+
+MODES = ("popular", "trending")
+
+# 既定値（board_ranking_params に行がなければこれを使う）
+DEFAULT_PARAMS = {
+    "popular": {"like_weight": 1.0, "reply_weight": 0.5, "half_life_hours": 72.0},
+    "trending": {"like_weight": 0.5, "reply_weight": 1.0, "half_life_hours": 12.0},
+}
+# スコアの時刻基準（値を小さく保つためのオフセット）
+SCORE_EPOCH = datetime(2024, 1, 1, tzinfo=models.JST)
+# 定期スイープの間隔（秒）
+SWEEP_INTERVAL_SECONDS = 600
+RECOMPUTE_CHUNK = 1000
+
+# プロセス内にキャッシュしたパラメータ（スイープ時にDBから読み直す）
+_params: dict[str, dict] = {mode: dict(values) for mode, values in DEFAULT_PARAMS.items()}
+
+def get_params() -> dict[str, dict]:
+    return {mode: dict(values) for mode, values in _params.items()}
+
+def load_params(db: Session) -> bool:
+    """DBからパラメータを読み込む。値が変わった場合は True"""
+    global _params
+    loaded = {mode: dict(values) for mode, values in DEFAULT_PARAMS.items()}
+    for row in db.query(models.BoardRankingParams).all():
+        if row.mode in loaded:
+            loaded[row.mode] = {
+                "like_weight": float(row.like_weight),
+                "reply_weight": float(row.reply_weight),
+                "half_life_hours": float(row.half_life_hours),
+            }
+    changed = loaded != _params
+    _params = loaded
+    return changed
+
+def save_params(db: Session, mode: str, like_weight=None, reply_weight=None, half_life_hours=None) -> dict:
+    """パラメータを保存してキャッシュに反映（コミットは呼び出し側）"""
+    row = db.query(models.BoardRankingParams).filter(models.BoardRankingParams.mode == mode).first()
+    if not row:
+        defaults = DEFAULT_PARAMS[mode]
+        row = models.BoardRankingParams(mode=mode, **defaults)
+        db.add(row)
+    if like_weight is not None:
+        row.like_weight = like_weight
+    if reply_weight is not None:
+        row.reply_weight = reply_weight
+    if half_life_hours is not None:
+        row.half_life_hours = half_life_hours
+    row.updated_at = models.jst_now()
+    db.flush()
+    load_params(db)
+    return _params[mode]
+
+def _hours_since_epoch(created_at) -> float:
+    if created_at is None:
+        created_at = models.jst_now()
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=models.JST)
+    return (created_at - SCORE_EPOCH).total_seconds() / 3600.0
+
+def compute_score(mode: str, like_count, reply_count, created_at) -> float:
+    p = _params[mode]
+    engagement = max(0.0, (like_count or 0) * p["like_weight"] + (reply_count or 0) * p["reply_weight"])
+    return math.log2(1.0 + engagement) + _hours_since_epoch(created_at) / p["half_life_hours"]
+
+def score_values(like_count, reply_count, created_at) -> dict:
+    return {
+        "popular_score": compute_score("popular", like_count, reply_count, created_at),
+        "trending_score": compute_score("trending", like_count, reply_count, created_at),
+    }
+
+# -----------------------------
+# 更新
+# -----------------------------
+
+def refresh_post(db: Session, post: models.BoardPost) -> None:
+    """いいね/返信数が変わった投稿のスコアを更新（コミットは呼び出し側）"""
+    for column, value in score_values(post.like_count, post.reply_count, post.created_at).items():
+        setattr(post, column, value)
+
+def recompute(db: Session, only_missing: bool = False) -> int:
+    """スコアを一括再計算する。only_missing=True なら未計算の行だけ（コミットしない）"""
+    q = db.query(models.BoardPost.id, models.BoardPost.like_count, models.BoardPost.reply_count, models.BoardPost.created_at)
+    if only_missing:
+        q = q.filter(or_(models.BoardPost.popular_score.is_(None), models.BoardPost.trending_score.is_(None)))
+    count = 0
+    batch = []
+    for post_id, like_count, reply_count, created_at in q.order_by(models.BoardPost.id).all():
+        batch.append({"id": post_id, **score_values(like_count, reply_count, created_at)})
+        if len(batch) >= RECOMPUTE_CHUNK:
+            db.bulk_update_mappings(models.BoardPost, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.bulk_update_mappings(models.BoardPost, batch)
+        count += len(batch)
+    if count:
+        # bulk_update_mappings はセッションのイベントを通らないため、フィードのETagを明示的に更新
+        http_cache.mark(db, "board")
+    return count
+
+def sweep_once(session_factory) -> None:
+    """パラメータを読み直し、変わっていれば全件、そうでなければ未計算行だけ再計算する"""
+    db = session_factory()
+    try:
+        changed = load_params(db)
+        count = recompute(db, only_missing=not changed)
+        db.commit()
+        if count:
+            print(f"✅ 投稿スコアを再計算しました（{count}件{'、パラメータ変更' if changed else ''}）")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ 投稿スコアの再計算に失敗: {e}")
+    finally:
+        db.close()
+
+async def sweep_loop(session_factory) -> None:
+    """定期的に sweep_once を実行（起動時の1回目は呼び出し側で同期実行する。DB処理はスレッドで実行）"""
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+        await asyncio.to_thread(sweep_once, session_factory)
+
+if __name__ == "__main__":
+    import database
+    models.Base.metadata.create_all(bind=database.engine)
+    session = database.SessionLocal()
+    try:
+        load_params(session)
+        count = recompute(session)
+        session.commit()
+        print(f"✅ 投稿スコアを再計算しました（{count}件）")
+    finally:
+        session.close()
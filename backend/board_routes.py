@@ -1,9 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_, func
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy import desc, and_, or_, func, case
+from typing import List, Optional
 from datetime import datetime
 import models, schemas, database
+import board_stats
+import board_search
+import board_hashtags
+import board_ranking
+import read_markers
+import like_service
+import name_resolver
+import identity
+import ngram_index
+import profile_cache
+import http_cache
+import board_events
+import notifications
+import base64
 import random
 import string
 import re
@@ -22,6 +37,46 @@ def ensure_jst_aware(dt):
     # tz-aware はJSTへ変換（UTCなどからのズレを解消）
     return dt.astimezone(models.JST)
 
+# -----------------------------
+# カーソル（キーセット）ページング
+# -----------------------------
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(created_at, row_id: int) -> str:
+    """(created_at, id) を不透明なカーソル文字列に変換"""
+    raw = f"{created_at.isoformat()},{int(row_id)}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str):
+    """カーソル文字列を (created_at, id) に戻す。不正な値は400"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        created_part, id_part = raw.rsplit(",", 1)
+        return datetime.fromisoformat(created_part), int(id_part)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="カーソルが不正です")
+
+def apply_keyset(query, created_col, id_col, before: Optional[str]):
+    """created_at DESC, id DESC の並びで before カーソルより古い行に絞り込む"""
+    if before:
+        created_at, row_id = decode_cursor(before)
+        query = query.filter(or_(
+            created_col < created_at,
+            and_(created_col == created_at, id_col < row_id),
+        ))
+    return query.order_by(desc(created_col), desc(id_col))
+
+def set_next_cursor(response: Optional[Response], rows, limit: int, key=lambda r: (r.created_at, r.id)):
+    """取得件数が limit に達していれば次ページのカーソルをヘッダーで返す"""
+    if response is None or not rows or len(rows) < limit:
+        return None
+    created_at, row_id = key(rows[-1])
+    cursor = encode_cursor(created_at, row_id)
+    response.headers[NEXT_CURSOR_HEADER] = cursor
+    return cursor
+
 # -----------------------------
 # メンション検出と通知
 # -----------------------------
@@ -29,7 +84,10 @@ def ensure_jst_aware(dt):
 MENTION_TOKEN = re.compile(r"@([^\s,.:;!?()]+)")
 
 def notify_mentions_if_any(db: Session, content: str, actor_id: int, entity_type: str, entity_id: int):
-    """本文から @name を抽出し、該当ユーザーに通知を作成する。"""
+    """本文から @name を抽出し、該当ユーザーへの通知を一括で積む。
+
+    通知は呼び出し側（投稿/返信）のコミット後に notifications のアウトボックスから書き込まれる。
+    """
     if not content:
         return
     names = set()
@@ -39,90 +97,48 @@ def notify_mentions_if_any(db: Session, content: str, actor_id: int, entity_type
             names.add(name)
     if not names:
         return
-    mentioned_users = db.query(models.User).filter(models.User.anonymous_name.in_(list(names))).all()
-    for u in mentioned_users:
-        if u.id == actor_id:
-            continue
-        notif = models.Notification(
-            user_id=u.id,
-            actor_id=actor_id,
-            type="mention",
-            entity_type=entity_type,
-            entity_id=entity_id,
-            title="あなたがメンションされました",
-            message=(content[:120] if content else None),
-        )
-        db.add(notif)
-    if mentioned_users:
-        db.commit()
+    recipients = {user_id for user_id in name_resolver.resolve_names(db, names).values() if user_id != actor_id}
+    if not recipients:
+        return
+    notifications.enqueue_many(db, [
+        {
+            "user_id": user_id,
+            "actor_id": actor_id,
+            "type": "mention",
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "title": "あなたがメンションされました",
+            "message": content[:120],
+        }
+        for user_id in sorted(recipients)
+    ])
 
 # 掲示板統計情報を取得
 @router.get("/stats")
-def get_board_stats(db: Session = Depends(database.get_db)):
-    """各掲示板の統計情報（投稿数、コメント数、最終投稿時刻）を取得"""
-    board_ids = [1, 2, 3, 4, 5, 6]
+def get_board_stats(request: Request, response: Response, db: Session = Depends(database.get_db)):
+    """各掲示板の統計情報（投稿数、コメント数、最終投稿時刻）を取得（board_statsと時間別タグ集計を読むだけ）"""
+    not_modified = http_cache.conditional(request, response, db, ("board",), http_cache.PUBLIC_SHORT, per_viewer=False)
+    if not_modified is not None:
+        return not_modified
+    board_ids = board_stats.BOARD_IDS
+    rows = db.query(models.BoardStats).filter(
+        models.BoardStats.board_id.in_([str(b) for b in board_ids])
+    ).all()
+    by_board = {row.board_id: row for row in rows}
+    popular = board_hashtags.popular_by_board(db, board_ids)
+
     stats = []
-    
     for board_id in board_ids:
-        # 投稿数を取得
-        post_count = db.query(models.BoardPost).filter(
-            models.BoardPost.board_id == str(board_id)
-        ).count()
-        
-        # コメント数を取得（各投稿のreply_countの合計）
-        total_replies = db.query(func.sum(models.BoardPost.reply_count)).filter(
-            models.BoardPost.board_id == str(board_id)
-        ).scalar() or 0
-        
-        # いいね数を取得
-        total_likes = db.query(func.sum(models.BoardPost.like_count)).filter(
-            models.BoardPost.board_id == str(board_id)
-        ).scalar() or 0
-        
-        # 最終投稿時刻を取得
-        latest_post = db.query(models.BoardPost).filter(
-            models.BoardPost.board_id == str(board_id)
-        ).order_by(desc(models.BoardPost.created_at)).first()
-        
-        # 最終活動時刻をJSTのISO文字列に統一
-        last_activity = ensure_jst_aware(latest_post.created_at).isoformat() if latest_post else None
-
-        # 参加者数を取得（この掲示板を一度でも開いたユーザー数）
-        participant_count = db.query(func.count(models.BoardVisit.id)).filter(
-            models.BoardVisit.board_id == str(board_id)
-        ).scalar() or 0
-        
-        # 人気のハッシュタグを取得（この掲示板の最新3件の投稿から）
-        recent_posts_with_tags = db.query(models.BoardPost.hashtags).filter(
-            and_(
-                models.BoardPost.board_id == str(board_id),
-                models.BoardPost.hashtags.isnot(None),
-                models.BoardPost.hashtags != ""
-            )
-        ).order_by(desc(models.BoardPost.created_at)).limit(5).all()
-        
-        # ハッシュタグを抽出
-        all_tags = []
-        for (tags,) in recent_posts_with_tags:
-            if tags:
-                all_tags.extend([tag.strip() for tag in tags.split() if tag.strip()])
-        
-        # 重複を削除して最大3つまで
-        unique_tags = []
-        for tag in all_tags:
-            if tag not in unique_tags:
-                unique_tags.append(tag)
-            if len(unique_tags) >= 3:
-                break
-        
+        row = by_board.get(str(board_id))
         stats.append({
             "board_id": board_id,
-            "post_count": post_count,
-            "reply_count": int(total_replies),
-            "like_count": int(total_likes),
-            "last_activity": last_activity,
-            "popular_hashtags": unique_tags,
-            "participant_count": int(participant_count)
+            "post_count": int(row.post_count or 0) if row else 0,
+            "reply_count": int(row.reply_count or 0) if row else 0,
+            "like_count": int(row.like_count or 0) if row else 0,
+            # 最終活動時刻をJSTのISO文字列に統一
+            "last_activity": ensure_jst_aware(row.last_activity).isoformat() if row and row.last_activity else None,
+            "popular_hashtags": popular.get(str(board_id), []),
+            "participant_count": int(row.participant_count or 0) if row else 0,
         })
     
     return {"stats": stats}
@@ -133,23 +149,24 @@ def get_feed_posts(
     feed_type: str = Query("latest", description="latest, popular, trending"),
     limit: int = Query(10, description="取得件数"),
     request: Request = None,
+    response: Response = None,
+    current_user: Optional[identity.Viewer] = Depends(identity.get_viewer),
     db: Session = Depends(database.get_db)
 ):
     """全掲示板から人気投稿・最新投稿を取得"""
-    
-    # 現在のユーザーを取得
-    current_user_id = get_current_user_id(request) if request else None
-    current_user = get_user_by_id(db, current_user_id) if current_user_id else None
+    not_modified = http_cache.conditional(request, response, db, ("board",))
+    if not_modified is not None:
+        return not_modified
     
     # フィードタイプに応じてクエリを変更
     query = db.query(models.BoardPost)
     
     if feed_type == "popular":
-        # いいね数が多い順
-        query = query.order_by(desc(models.BoardPost.like_count), desc(models.BoardPost.created_at))
+        # いいね重視の時間減衰スコア順（idx_board_posts_popular_score の先頭N件）
+        query = query.order_by(desc(models.BoardPost.popular_score))
     elif feed_type == "trending":
-        # コメント数が多い順
-        query = query.order_by(desc(models.BoardPost.reply_count), desc(models.BoardPost.created_at))
+        # 返信重視で減衰の速いスコア順（idx_board_posts_trending_score の先頭N件）
+        query = query.order_by(desc(models.BoardPost.trending_score))
     elif feed_type == "no_comments":
         # 返信がまだついていない投稿（コメント一番乗り）
         query = query.filter(models.BoardPost.reply_count == 0).order_by(desc(models.BoardPost.created_at))
@@ -158,19 +175,14 @@ def get_feed_posts(
         query = query.order_by(desc(models.BoardPost.created_at))
     
     posts = query.limit(limit).all()
+    # フィードで使うのはいいね済みだけなので、返信状況・新着数の集計は行わない
+    liked_ids = load_liked_post_ids(db, [p.id for p in posts], current_user.id if current_user else None)
+    profiles = profile_cache.get_profiles(db, [p.author_id for p in posts])
     
     # レスポンス形式に変換
     result = []
     for post in posts:
-        # いいねしているかチェック
-        is_liked = False
-        if current_user:
-            is_liked = db.query(models.BoardPostLike).filter(
-                and_(
-                    models.BoardPostLike.post_id == post.id,
-                    models.BoardPostLike.user_id == current_user.id
-                )
-            ).first() is not None
+        is_liked = post.id in liked_ids
         can_edit = bool(current_user and post.author_id == current_user.id)
         result.append({
             "id": post.id,
@@ -178,8 +190,7 @@ def get_feed_posts(
             "content": post.content,
             "hashtags": post.hashtags,
             "author_name": post.author_name,
-            "author_year": post.author.year if post.author else None,
-            "author_department": post.author.department if post.author else None,
+            **profile_cache.author_fields(profiles.get(post.author_id)),
             "like_count": post.like_count,
             "reply_count": post.reply_count,
             "created_at": ensure_jst_aware(post.created_at).isoformat(),
@@ -191,40 +202,39 @@ def get_feed_posts(
 
 @router.get("/replies/feed")
 def get_feed_replies(
-    limit: int = Query(10, description="取得件数"),
+    response: Response,
+    limit: int = Query(10, ge=1, le=50, description="取得件数"),
+    before: Optional[str] = Query(None, description="次ページ用カーソル（next_cursor / X-Next-Cursorの値）"),
     request: Request = None,
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
     db: Session = Depends(database.get_db)
 ):
-    """全掲示板から最新の返信を取得（返信内容＋親投稿の要約）"""
-    current_user_id = get_current_user_id(request) if request else None
-    current_user = get_user_by_id(db, current_user_id) if current_user_id else None
+    """全掲示板から最新の返信を取得（返信内容＋親投稿の要約）
+
+    返信と親投稿は結合して1クエリ、各投稿者はプロフィールキャッシュ、閲覧者のいいね済み判定は1クエリでまとめて取得する。
+    """
+    viewer_id = viewer.id if viewer else None
+
+    query = db.query(models.BoardReply).join(
+        models.BoardPost, models.BoardPost.id == models.BoardReply.post_id
+    ).options(contains_eager(models.BoardReply.post))
+    replies = apply_keyset(query, models.BoardReply.created_at, models.BoardReply.id, before).limit(limit).all()
+    next_cursor = set_next_cursor(response, replies, limit)
+    liked_ids = load_liked_reply_ids(db, [r.id for r in replies], viewer_id)
+    profiles = profile_cache.get_profiles(db, [r.author_id for r in replies] + [r.post.author_id for r in replies])
 
-    replies = db.query(models.BoardReply).order_by(desc(models.BoardReply.created_at)).limit(limit).all()
     items = []
     for reply in replies:
-        post = db.query(models.BoardPost).filter(models.BoardPost.id == reply.post_id).first()
-        if not post:
-            continue
-        # 返信のいいね済み判定
-        is_liked = False
-        if current_user:
-            is_liked = db.query(models.BoardReplyLike).filter(
-                and_(
-                    models.BoardReplyLike.reply_id == reply.id,
-                    models.BoardReplyLike.user_id == current_user.id
-                )
-            ).first() is not None
-
+        post = reply.post
         items.append({
             "reply": {
                 "id": reply.id,
                 "post_id": reply.post_id,
                 "content": reply.content,
                 "author_name": reply.author_name,
-                "author_year": reply.author.year if reply.author else None,
-                "author_department": reply.author.department if reply.author else None,
+                **profile_cache.author_fields(profiles.get(reply.author_id)),
                 "like_count": reply.like_count,
-                "is_liked": is_liked,
+                "is_liked": reply.id in liked_ids,
                 "created_at": ensure_jst_aware(reply.created_at).isoformat(),
             },
             "post": {
@@ -233,262 +243,313 @@ def get_feed_replies(
                 "content": post.content,
                 "hashtags": post.hashtags,
                 "author_name": post.author_name,
-                "author_year": post.author.year if post.author else None,
-                "author_department": post.author.department if post.author else None,
+                **profile_cache.author_fields(profiles.get(post.author_id)),
                 "like_count": post.like_count,
                 "reply_count": post.reply_count,
                 "created_at": ensure_jst_aware(post.created_at).isoformat(),
             }
         })
 
-    return {"items": items}
+    return {"items": items, "next_cursor": next_cursor}
 
 # 全文検索API
 @router.get("/search")
 def search_posts_and_replies(
     query: str = Query(..., min_length=1, description="検索キーワード"),
+    limit: int = Query(20, ge=1, le=100, description="取得件数"),
+    cursor: Optional[str] = Query(None, description="次ページ用カーソル（next_cursorの値）"),
     db: Session = Depends(database.get_db)
 ):
-    """投稿とコメントを全文検索"""
+    """投稿とコメントを全文検索（関連度＋新しさで並べ替え、カーソルでページング）"""
     if not query or len(query.strip()) == 0:
         return {"results": []}
-    
-    search_term = f"%{query.strip()}%"
-    
-    # 投稿を検索（本文とハッシュタグの両方を検索）
-    matching_posts = db.query(models.BoardPost).filter(
-        (models.BoardPost.content.like(search_term)) | 
-        (models.BoardPost.hashtags.like(search_term))
-    ).order_by(desc(models.BoardPost.created_at)).all()
-    
-    # コメントを検索
-    matching_replies = db.query(models.BoardReply).filter(
-        models.BoardReply.content.like(search_term)
-    ).order_by(desc(models.BoardReply.created_at)).all()
-    
-    # コメントが見つかった場合、その投稿も含める
-    post_ids_from_replies = set([reply.post_id for reply in matching_replies])
-    posts_from_replies = db.query(models.BoardPost).filter(
-        models.BoardPost.id.in_(post_ids_from_replies)
-    ).all() if post_ids_from_replies else []
-    
-    # 重複を除いて投稿をマージ
-    all_post_ids = set([post.id for post in matching_posts])
-    for post in posts_from_replies:
-        if post.id not in all_post_ids:
-            matching_posts.append(post)
-            all_post_ids.add(post.id)
-    
-    # 結果を整形
+    query = query.strip()
+    try:
+        offset = board_search.decode_search_cursor(cursor)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="カーソルが不正です")
+
+    found = board_search.search(db, query, limit=limit, offset=offset)
+    hits = found["hits"]
+    post_ids = [h["post_id"] for h in hits]
+    reply_ids = [rid for h in hits for rid in h["reply_ids"]]
+
+    # 表示ページ分の投稿・返信と投稿者を一括取得
+    posts_by_id = {
+        p.id: p for p in db.query(models.BoardPost).filter(models.BoardPost.id.in_(post_ids)).all()
+    } if post_ids else {}
+    profiles = profile_cache.get_profiles(db, [p.author_id for p in posts_by_id.values()])
+    replies_by_id = {
+        r.id: r for r in db.query(models.BoardReply).filter(models.BoardReply.id.in_(reply_ids)).all()
+    } if reply_ids else {}
+    post_snips, reply_snips = board_search.snippets(db, query, post_ids, reply_ids, backend=found.get("backend"))
+
+    terms = [t.lower() for t in board_search.split_terms(query)]
     results = []
-    for post in matching_posts:
-        # この投稿に関連する検索マッチしたコメントを取得
-        post_matching_replies = [r for r in matching_replies if r.post_id == post.id]
-        
-        # 投稿者情報を取得
-        author = get_user_by_id(db, post.author_id)
-        
+    for hit in hits:
+        post = posts_by_id.get(hit["post_id"])
+        if not post:
+            continue
+        content_lower = (post.content or "").lower()
+        hashtags_lower = (post.hashtags or "").lower()
+        matched_replies = []
+        for rid in hit["reply_ids"]:
+            reply = replies_by_id.get(rid)
+            if not reply:
+                continue
+            matched_replies.append({
+                "id": reply.id,
+                "content": reply.content,
+                "snippet": reply_snips.get(reply.id) or board_search.highlight_plain(reply.content, terms),
+                "author_name": reply.author_name,
+                "created_at": ensure_jst_aware(reply.created_at).isoformat()
+            })
+        matched_replies.sort(key=lambda r: r["created_at"], reverse=True)
         results.append({
             "post_id": post.id,
             "board_id": post.board_id,
             "content": post.content,
+            "snippet": post_snips.get(post.id) or board_search.highlight_plain(post.content, terms),
             "hashtags": post.hashtags,
             "author_name": post.author_name,
-            "author_year": author.year if author else None,
-            "author_department": author.department if author else None,
+            **profile_cache.author_fields(profiles.get(post.author_id)),
             "like_count": post.like_count,
             "reply_count": post.reply_count,
-            "created_at": post.created_at,  # ソート用にdatetimeオブジェクトを保持
-            "matched_in_post": query.lower() in post.content.lower(),
-            "matched_in_hashtags": post.hashtags and query.lower() in post.hashtags.lower(),
-            "matched_replies": [
-                {
-                    "id": reply.id,
-                    "content": reply.content,
-                    "author_name": reply.author_name,
-                    "created_at": ensure_jst_aware(reply.created_at).isoformat()
-                }
-                for reply in post_matching_replies
-            ]
+            "created_at": ensure_jst_aware(post.created_at).isoformat(),
+            "score": round(hit["score"], 6),
+            "matched_in_post": all(t in content_lower for t in terms),
+            "matched_in_hashtags": bool(hashtags_lower) and all(t in hashtags_lower for t in terms),
+            "matched_replies": matched_replies,
         })
-    
-    # 作成日時の降順でソート
-    results.sort(key=lambda x: x["created_at"], reverse=True)
-    
-    # ソート後、created_atをISO形式の文字列に変換
-    for result in results:
-        result["created_at"] = ensure_jst_aware(result["created_at"]).isoformat()
-    
+
+    next_offset = found["next_offset"]
     return {
         "query": query,
-        "total_results": len(results),
-        "results": results
+        "total_results": found["total"],
+        "results": results,
+        "next_cursor": board_search.encode_search_cursor(next_offset) if next_offset is not None else None,
     }
 
-def get_current_user_id(request: Request):
-    """現在のユーザーのIDを取得"""
-    # X-User-Id ヘッダーから取得
-    user_id = request.headers.get("X-User-Id")
-    if user_id:
-        try:
-            return int(user_id)
-        except:
-            pass
-    
-    # 旧方式: X-Dev-Email ヘッダーから取得（後方互換性）
-    dev_email = request.headers.get("X-Dev-Email")
-    if dev_email:
-        if dev_email.startswith("dev:"):
-            dev_email = dev_email[4:]
-        user = get_user_by_email(None, dev_email)
-        if user:
-            return user.id
-    
-    return None
-
-def get_user_by_email(db: Session, email: str):
-    """emailでユーザーを取得"""
-    if not db:
-        # dbがNoneの場合は新しいセッションを作成
-        db = database.SessionLocal()
-        try:
-            return db.query(models.User).filter(models.User.email == email).first()
-        finally:
-            db.close()
-    return db.query(models.User).filter(models.User.email == email).first()
-
-def get_user_by_id(db: Session, user_id: int):
-    """IDでユーザーを取得"""
-    return db.query(models.User).filter(models.User.id == user_id).first()
-
 def generate_anonymous_name():
     """匿名表示名を生成（例: 匿名ユーザー #A1B2）"""
     return f"匿名ユーザー #{''.join(random.choices(string.ascii_uppercase + string.digits, k=4))}"
 
 def get_or_create_anonymous_name(user, db: Session):
-    """ユーザーの固定匿名名を取得または生成"""
-    if not user.anonymous_name:
+    """ユーザーの固定匿名名を取得または生成（user は ORMのユーザー/Viewerどちらでも可）"""
+    if user.anonymous_name:
+        return user.anonymous_name
+    row = identity.load_user(db, user) if isinstance(user, identity.Viewer) else user
+    if not row.anonymous_name:
         # 匿名名が未設定の場合は生成して保存
-        user.anonymous_name = generate_anonymous_name()
+        row.anonymous_name = generate_anonymous_name()
         db.commit()
-        db.refresh(user)
-    return user.anonymous_name
+        db.refresh(row)
+        name_resolver.invalidate(row.anonymous_name)
+        identity.invalidate(row.id)
+        profile_cache.invalidate(row.id)
+    return row.anonymous_name
 
 # -----------------------------
-# 管理者判定と保護ユーティリティ
+# 閲覧者ごとの投稿状態（いいね済み/返信済み/新着返信数）
+# -----------------------------
+
+def load_viewer_states(db: Session, post_ids, viewer_id: int | None) -> dict:
+    """投稿ID群に対する閲覧者の状態を一括取得する。
+
+    投稿数に関係なく固定回数（最大3回）のクエリで
+    {post_id: {"is_liked", "has_replied", "new_replies_since_my_last_reply"}} を返す。
+    """
+    ids = list({int(pid) for pid in post_ids if pid is not None})
+    states = {
+        pid: {"is_liked": False, "has_replied": False, "new_replies_since_my_last_reply": 0}
+        for pid in ids
+    }
+    if not ids or not viewer_id:
+        return states
+
+    # いいね済みの投稿
+    liked_rows = db.query(models.BoardPostLike.post_id).filter(
+        and_(models.BoardPostLike.user_id == viewer_id, models.BoardPostLike.post_id.in_(ids))
+    ).all()
+    for (pid,) in liked_rows:
+        states[pid]["is_liked"] = True
+
+    # 自分が返信したことのある投稿
+    replied_rows = db.query(models.BoardReply.post_id).filter(
+        and_(models.BoardReply.author_id == viewer_id, models.BoardReply.post_id.in_(ids))
+    ).distinct().all()
+    for (pid,) in replied_rows:
+        states[pid]["has_replied"] = True
+
+    # 最終閲覧以降の新着返信数（閲覧記録と結合して投稿ごとに集計）
+    # まだDBに書き込まれていない閲覧記録がある投稿は、その時刻を CASE で基準にして同じクエリで数える
+    pending = read_markers.pending_reply_views(viewer_id, ids)
+    threshold = models.BoardRepliesView.last_viewed_at
+    if pending:
+        threshold = case(pending, value=models.BoardReply.post_id, else_=models.BoardRepliesView.last_viewed_at)
+    new_rows = db.query(
+        models.BoardReply.post_id,
+        func.count(models.BoardReply.id)
+    ).outerjoin(
+        models.BoardRepliesView,
+        and_(
+            models.BoardRepliesView.post_id == models.BoardReply.post_id,
+            models.BoardRepliesView.user_id == viewer_id,
+        )
+    ).filter(
+        models.BoardReply.post_id.in_(ids),
+        models.BoardReply.created_at > threshold,
+    ).group_by(models.BoardReply.post_id).all()
+    for pid, cnt in new_rows:
+        states[pid]["new_replies_since_my_last_reply"] = int(cnt or 0)
+
+    return states
+
+def load_liked_post_ids(db: Session, post_ids, viewer_id: int | None) -> set[int]:
+    """閲覧者がいいね済みの投稿IDを1クエリで取得"""
+    return like_service.liked_ids(db, models.BoardPostLike, "post_id", post_ids, viewer_id)
+
+def load_liked_reply_ids(db: Session, reply_ids, viewer_id: int | None) -> set[int]:
+    """閲覧者がいいね済みの返信IDを1クエリで取得"""
+    ids = list({int(i) for i in reply_ids})
+    if not ids or not viewer_id:
+        return set()
+    rows = db.query(models.BoardReplyLike.reply_id).filter(
+        and_(models.BoardReplyLike.user_id == viewer_id, models.BoardReplyLike.reply_id.in_(ids))
+    ).all()
+    return {rid for (rid,) in rows}
+
+def build_post_response(
+    post: models.BoardPost,
+    state: dict | None,
+    can_edit: bool,
+    profile: profile_cache.Profile | None = None,
+) -> schemas.BoardPostResponse:
+    """BoardPost と閲覧者状態・投稿者プロフィール（profile_cache.get_profiles で一括取得）からレスポンスを組み立てる"""
+    state = state or {}
+    return schemas.BoardPostResponse(
+        id=post.id,
+        board_id=post.board_id,
+        content=post.content,
+        hashtags=post.hashtags,
+        author_name=post.author_name,
+        **profile_cache.author_fields(profile),
+        like_count=post.like_count,
+        reply_count=post.reply_count,
+        created_at=ensure_jst_aware(post.created_at).isoformat(),
+        is_liked=bool(state.get("is_liked", False)),
+        has_replied=bool(state.get("has_replied", False)),
+        new_replies_since_my_last_reply=int(state.get("new_replies_since_my_last_reply", 0)),
+        can_edit=can_edit,
+    )
+
+# -----------------------------
+# 管理者判定
 # -----------------------------
-# master00, master01-09 を含め、master1-30 を許可
-ADMIN_EMAIL_PATTERN = re.compile(r"^(master|mster)(00|0?[1-9]|[1-2][0-9]|30)@(?:[\w.-]+\.)?ac\.jp$", re.IGNORECASE)
 
 def is_admin_user(user) -> bool:
-    """メールが master1..master30@ac.jp のユーザーを管理者として扱う"""
-    if not user or not getattr(user, "email", None):
-        return False
-    return ADMIN_EMAIL_PATTERN.match(user.email or "") is not None
-
-def require_admin(request: Request, db: Session) -> models.User:
-    """管理者のみ許可。非管理者は403を返す。"""
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    user = get_user_by_id(db, current_user_id)
+    """メールが master1..master30@ac.jp のユーザーを管理者として扱う（ORMのユーザー/Viewerどちらでも可）"""
     if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
-    if not is_admin_user(user):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者のみが実行できます")
-    return user
+        return False
+    return identity.is_admin_email(getattr(user, "email", None))
 
 @router.get("/posts/{board_id}", response_model=List[schemas.BoardPostResponse])
 def get_board_posts(
     board_id: str,
     request: Request,
+    response: Response,
     limit: int = Query(50, description="取得件数"),
-    offset: int = Query(0, description="オフセット"),
+    offset: int = Query(0, description="オフセット（beforeがない場合のみ使用）"),
+    before: Optional[str] = Query(None, description="次ページ用カーソル（X-Next-Cursorの値）"),
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
     db: Session = Depends(database.get_db)
 ):
-    """掲示板の投稿一覧を取得"""
+    """掲示板の投稿一覧を取得（before指定時はキーセットページング）"""
     
     # 投稿を取得
-    posts = db.query(models.BoardPost).filter(
-        models.BoardPost.board_id == board_id
-    ).order_by(desc(models.BoardPost.created_at)).offset(offset).limit(limit).all()
-    
-    # 現在のユーザーを取得（X-User-Id優先、なければX-Dev-Email）
-    current_user_id = get_current_user_id(request)
-    current_user = get_user_by_id(db, current_user_id) if current_user_id else None
-    if not current_user:
-        dev_email = request.headers.get("X-Dev-Email")
-        if dev_email:
-            if dev_email.startswith("dev:"):
-                dev_email = dev_email[4:]
-            current_user = get_user_by_email(db, dev_email)
+    query = db.query(models.BoardPost).filter(models.BoardPost.board_id == board_id)
+    if before:
+        posts = apply_keyset(query, models.BoardPost.created_at, models.BoardPost.id, before).limit(limit).all()
+    else:
+        posts = query.order_by(desc(models.BoardPost.created_at), desc(models.BoardPost.id)).offset(offset).limit(limit).all()
+    set_next_cursor(response, posts, limit)
     
-    # 現在ユーザーの最終閲覧時刻（返信一覧を開いた時）をまとめて取得
-    user_last_view = {}
-    if current_user:
-        rows = db.query(models.BoardRepliesView.post_id, models.BoardRepliesView.last_viewed_at).filter(
-            models.BoardRepliesView.user_id == current_user.id
-        ).all()
-        for post_id, last_viewed_at in rows:
-            user_last_view[post_id] = last_viewed_at
-
-    result = []
-    for post in posts:
-        is_liked = False
-        if current_user:
-            is_liked = db.query(models.BoardPostLike).filter(
-                and_(
-                    models.BoardPostLike.post_id == post.id,
-                    models.BoardPostLike.user_id == current_user.id
-                )
-            ).first() is not None
-        has_replied = db.query(models.BoardReply.id).filter(
-            and_(models.BoardReply.post_id == post.id, models.BoardReply.author_id == (current_user.id if current_user else -1))
-        ).first() is not None
-        new_replies_count = 0
-        last_view = user_last_view.get(post.id)
-        if last_view:
-            new_replies_count = db.query(func.count(models.BoardReply.id)).filter(
-                and_(
-                    models.BoardReply.post_id == post.id,
-                    models.BoardReply.created_at > last_view
-                )
-            ).scalar() or 0
-
-        result.append(schemas.BoardPostResponse(
-            id=post.id,
-            board_id=post.board_id,
-            content=post.content,
-            hashtags=post.hashtags,
-            author_name=post.author_name,
-            author_year=post.author.year if post.author else None,
-            author_department=post.author.department if post.author else None,
-            like_count=post.like_count,
-            reply_count=post.reply_count,
-            created_at=ensure_jst_aware(post.created_at).isoformat(),
-            is_liked=is_liked,
-            has_replied=has_replied,
-            new_replies_since_my_last_reply=int(new_replies_count),
-            can_edit=bool(current_user and post.author_id == (current_user.id if current_user else -1))
-        ))
+    # 閲覧者の状態を一括取得
+    viewer_id = viewer.id if viewer else None
+    states = load_viewer_states(db, [p.id for p in posts], viewer_id)
+    profiles = profile_cache.get_profiles(db, [p.author_id for p in posts])
+
+    result = [
+        build_post_response(
+            post, states.get(post.id), can_edit=bool(viewer_id and post.author_id == viewer_id),
+            profile=profiles.get(post.author_id),
+        )
+        for post in posts
+    ]
     
     return result
 
+# -----------------------------
+# ハッシュタグ
+# -----------------------------
+
+@router.get("/hashtags/trending")
+def get_trending_hashtags(
+    board_id: Optional[str] = Query(None, description="掲示板ID（省略時は全体）"),
+    limit: int = Query(10, ge=1, le=50, description="取得件数"),
+    db: Session = Depends(database.get_db)
+):
+    """トレンドのハッシュタグ（時間別の利用数を半減期で減衰させた合計の順）"""
+    return {
+        "hashtags": board_hashtags.trending(db, board_id=board_id, limit=limit),
+        "window_hours": board_hashtags.TRENDING_WINDOW_HOURS,
+        "half_life_hours": board_hashtags.TRENDING_HALF_LIFE_HOURS,
+    }
+
+@router.get("/hashtags/{tag}/posts", response_model=List[schemas.BoardPostResponse])
+def get_hashtag_posts(
+    tag: str,
+    request: Request,
+    response: Response,
+    board_id: Optional[str] = Query(None, description="掲示板ID（省略時は全体）"),
+    limit: int = Query(20, ge=1, le=100, description="取得件数"),
+    before: Optional[str] = Query(None, description="次ページ用カーソル（X-Next-Cursorの値）"),
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
+    db: Session = Depends(database.get_db)
+):
+    """ハッシュタグが付いた投稿を新しい順に取得（post_hashtagsのインデックスを使用）"""
+    hashtag = board_hashtags.get_hashtag(db, board_hashtags.normalize_tag(tag))
+    if not hashtag:
+        return []
+
+    query = db.query(models.BoardPost).join(
+        models.PostHashtag, models.PostHashtag.post_id == models.BoardPost.id
+    ).filter(models.PostHashtag.hashtag_id == hashtag.id)
+    if board_id:
+        query = query.filter(models.PostHashtag.board_id == board_id)
+    posts = apply_keyset(query, models.PostHashtag.created_at, models.PostHashtag.post_id, before).limit(limit).all()
+    set_next_cursor(response, posts, limit)
+
+    viewer_id = viewer.id if viewer else None
+    states = load_viewer_states(db, [p.id for p in posts], viewer_id)
+    profiles = profile_cache.get_profiles(db, [p.author_id for p in posts])
+    return [
+        build_post_response(
+            post, states.get(post.id), can_edit=bool(viewer_id and post.author_id == viewer_id),
+            profile=profiles.get(post.author_id),
+        )
+        for post in posts
+    ]
+
 @router.put("/posts/{post_id}", response_model=schemas.BoardPostResponse)
 def update_board_post(
     post_id: int,
     post_data: schemas.BoardPostUpdate,
     request: Request,
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
     """投稿の内容/ハッシュタグを編集（投稿者本人のみ）"""
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    current_user = get_user_by_id(db, current_user_id)
-    if not current_user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
-
     post = db.query(models.BoardPost).filter(models.BoardPost.id == post_id).first()
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="投稿が見つかりません")
@@ -500,9 +561,12 @@ def update_board_post(
         post.content = post_data.content.strip()
     if post_data.hashtags is not None:
         post.hashtags = (post_data.hashtags or '').strip()
+        board_hashtags.sync_post_hashtags(db, post)
+    ngram_index.index_row(db, "board_post", post)
 
     db.commit()
     db.refresh(post)
+    board_events.publish("post_updated", post.board_id, post_id=post.id)
 
     return schemas.BoardPostResponse(
         id=post.id,
@@ -510,8 +574,7 @@ def update_board_post(
         content=post.content,
         hashtags=post.hashtags,
         author_name=post.author_name,
-        author_year=post.author.year if post.author else None,
-        author_department=post.author.department if post.author else None,
+        **profile_cache.author_fields(profile_cache.get_profile(db, post.author_id)),
         like_count=post.like_count,
         reply_count=post.reply_count,
         created_at=ensure_jst_aware(post.created_at).isoformat(),
@@ -522,54 +585,20 @@ def update_board_post(
     )
 
 @router.post("/posts/{post_id}/replies/view")
-def mark_replies_viewed(post_id: int, request: Request, db: Session = Depends(database.get_db)):
+def mark_replies_viewed(post_id: int, request: Request, current_user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(database.get_db)):
     """返信一覧を開いたタイミングで最終閲覧時刻を記録（バッジの基準）"""
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        # 旧方式のフォールバック
-        dev_email = request.headers.get("X-Dev-Email")
-        if dev_email:
-            if dev_email.startswith("dev:"):
-                dev_email = dev_email[4:]
-            user = get_user_by_email(db, dev_email)
-            current_user_id = user.id if user else None
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-
-    view = db.query(models.BoardRepliesView).filter(
-        and_(models.BoardRepliesView.user_id == current_user_id, models.BoardRepliesView.post_id == post_id)
-    ).first()
-    now = models.jst_now()
-    if view:
-        view.last_viewed_at = now
-    else:
-        db.add(models.BoardRepliesView(user_id=current_user_id, post_id=post_id, last_viewed_at=now))
-    db.commit()
+    read_markers.mark_replies_viewed(current_user.id, post_id)
     return {"message": "ok", "post_id": post_id}
 
 @router.post("/posts", response_model=schemas.BoardPostResponse)
 def create_board_post(
     post_data: schemas.BoardPostCreate,
     request: Request,
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
     """新しい投稿を作成"""
     
-    # 現在のユーザーを取得
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="ユーザーIDが見つかりません"
-        )
-    
-    current_user = get_user_by_id(db, current_user_id)
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="ユーザーが見つかりません"
-        )
-    
     # ユーザーの固定匿名名を取得または生成
     anonymous_name = get_or_create_anonymous_name(current_user, db)
     
@@ -583,11 +612,16 @@ def create_board_post(
     )
     
     db.add(new_post)
+    db.flush()
+    board_stats.record_post_created(db, new_post)
+    board_ranking.refresh_post(db, new_post)
+    board_hashtags.sync_post_hashtags(db, new_post)
+    ngram_index.index_row(db, "board_post", new_post)
+    # メンション通知（投稿のコミット後に配信）
+    notify_mentions_if_any(db, new_post.content, current_user.id, entity_type="board_post", entity_id=new_post.id)
     db.commit()
     db.refresh(new_post)
-    
-    # メンション通知
-    notify_mentions_if_any(db, new_post.content, current_user.id, entity_type="board_post", entity_id=new_post.id)
+    board_events.publish("post_created", new_post.board_id, post_id=new_post.id)
 
     return schemas.BoardPostResponse(
         id=new_post.id,
@@ -607,25 +641,11 @@ def create_board_post(
 def toggle_post_like(
     post_id: int,
     request: Request,
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
     """投稿のいいねを切り替え"""
     
-    # 現在のユーザーを取得
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="ユーザーIDが見つかりません"
-        )
-    
-    current_user = get_user_by_id(db, current_user_id)
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="ユーザーが見つかりません"
-        )
-    
     # 投稿を取得
     post = db.query(models.BoardPost).filter(models.BoardPost.id == post_id).first()
     if not post:
@@ -634,100 +654,122 @@ def toggle_post_like(
             detail="投稿が見つかりません"
         )
     
-    # 既存のいいねをチェック
-    existing_like = db.query(models.BoardPostLike).filter(
-        and_(
-            models.BoardPostLike.post_id == post_id,
-            models.BoardPostLike.user_id == current_user.id
-        )
-    ).first()
-    
-    if existing_like:
-        # いいねを削除
-        db.delete(existing_like)
-        post.like_count = max(0, post.like_count - 1)
-        is_liked = False
-    else:
-        # いいねを追加
-        new_like = models.BoardPostLike(
-            post_id=post_id,
-            user_id=current_user.id
-        )
-        db.add(new_like)
-        post.like_count += 1
-        is_liked = True
+    # いいねの追加/削除と like_count の加減算をDB側で行う
+    result = like_service.toggle_like(
+        db, models.BoardPostLike, "post_id", post_id, current_user.id,
+        target_model=models.BoardPost, target=post,
+    )
+    if result["delta"]:
+        board_stats.bump(db, post.board_id, likes=result["delta"])
+        board_ranking.refresh_post(db, post)
     
     db.commit()
+    if result["delta"]:
+        board_events.publish("post_liked", post.board_id, post_id=post.id, like_count=result["like_count"])
     
     return {
         "message": "いいねを更新しました",
-        "is_liked": is_liked,
-        "like_count": post.like_count
+        "is_liked": result["is_liked"],
+        "like_count": result["like_count"]
     }
 
+# 返信一覧の既定/最大の取得件数
+REPLY_PAGE_DEFAULT = 100
+REPLY_PAGE_MAX = 200
+PREV_CURSOR_HEADER = "X-Prev-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+def _reply_slice(db: Session, post_id: int, ascending: bool, cursor_key, limit: int, inclusive: bool = False):
+    """返信を (created_at, id) 順に cursor_key の先から limit 件取得"""
+    created_col, id_col = models.BoardReply.created_at, models.BoardReply.id
+    query = db.query(models.BoardReply).filter(models.BoardReply.post_id == post_id)
+    if cursor_key:
+        created_at, row_id = cursor_key
+        if ascending:
+            id_cond = id_col >= row_id if inclusive else id_col > row_id
+            query = query.filter(or_(created_col > created_at, and_(created_col == created_at, id_cond)))
+        else:
+            id_cond = id_col <= row_id if inclusive else id_col < row_id
+            query = query.filter(or_(created_col < created_at, and_(created_col == created_at, id_cond)))
+    if ascending:
+        query = query.order_by(created_col.asc(), id_col.asc())
+    else:
+        query = query.order_by(desc(created_col), desc(id_col))
+    return query.limit(limit).all()
+
 @router.get("/posts/{post_id}/replies", response_model=List[schemas.BoardReplyResponse])
 def get_post_replies(
     post_id: int,
     request: Request,
+    response: Response,
+    order: str = Query("asc", description="asc: 古い順 / desc: 新しい順"),
+    limit: int = Query(REPLY_PAGE_DEFAULT, ge=1, le=REPLY_PAGE_MAX, description="取得件数"),
+    cursor: Optional[str] = Query(None, description="続きのカーソル（X-Next-Cursor / X-Prev-Cursorの値）"),
+    around: Optional[int] = Query(None, description="この返信IDを中心に前後を取得（通知からのディープリンク用）"),
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
     db: Session = Depends(database.get_db)
 ):
-    """投稿への返信一覧を取得"""
-    
-    # 返信を取得
-    replies = db.query(models.BoardReply).filter(
-        models.BoardReply.post_id == post_id
-    ).order_by(models.BoardReply.created_at).all()
-    
-    # 現在のユーザーを取得
-    current_user_id = get_current_user_id(request)
-    current_user = get_user_by_id(db, current_user_id) if current_user_id else None
-    
-    result = []
-    for reply in replies:
-        # いいねしているかチェック
-        is_liked = False
-        if current_user:
-            is_liked = db.query(models.BoardReplyLike).filter(
-                and_(
-                    models.BoardReplyLike.reply_id == reply.id,
-                    models.BoardReplyLike.user_id == current_user.id
-                )
-            ).first() is not None
-        
-        result.append(schemas.BoardReplyResponse(
+    """投稿への返信一覧を取得（カーソルページング）
+
+    - X-Total-Count: 返信総数（BoardPost.reply_count）
+    - X-Next-Cursor: 同じ order で続きを取得するカーソル
+    - X-Prev-Cursor: around 指定時、逆向きの order で手前を取得するカーソル
+    """
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="orderは asc または desc を指定してください")
+    ascending = order == "asc"
+
+    post = db.query(models.BoardPost.reply_count).filter(models.BoardPost.id == post_id).first()
+    response.headers[TOTAL_COUNT_HEADER] = str(int(post.reply_count or 0) if post else 0)
+
+    if around is not None:
+        anchor = db.query(models.BoardReply.created_at, models.BoardReply.id, models.BoardReply.post_id).filter(
+            models.BoardReply.id == around
+        ).first()
+        if not anchor or anchor.post_id != post_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="返信が見つかりません")
+        anchor_key = (anchor.created_at, anchor.id)
+        # 基準の返信より前を最大半分、基準を含む後ろで残りを埋める（片側が足りなければもう片側で補う）
+        older = _reply_slice(db, post_id, False, anchor_key, limit + 1)
+        newer = _reply_slice(db, post_id, True, anchor_key, limit + 1, inclusive=True)
+        newer_count = min(len(newer), limit - min(len(older), limit // 2))
+        older_count = min(len(older), limit - newer_count)
+        has_older, has_newer = len(older) > older_count, len(newer) > newer_count
+        older, newer = older[:older_count], newer[:newer_count]
+        replies = list(reversed(older)) + newer
+        has_more_after, has_more_before = has_newer, has_older
+        if not ascending:
+            replies.reverse()
+            has_more_after, has_more_before = has_older, has_newer
+        if replies and has_more_before:
+            response.headers[PREV_CURSOR_HEADER] = encode_cursor(replies[0].created_at, replies[0].id)
+    else:
+        cursor_key = decode_cursor(cursor) if cursor else None
+        replies = _reply_slice(db, post_id, ascending, cursor_key, limit + 1)
+        has_more_after = len(replies) > limit
+        replies = replies[:limit]
+    if replies and has_more_after:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(replies[-1].created_at, replies[-1].id)
+
+    viewer_id = viewer.id if viewer else None
+    liked_ids = load_liked_reply_ids(db, [r.id for r in replies], viewer_id)
+    profiles = profile_cache.get_profiles(db, [r.author_id for r in replies])
+    result = [
+        schemas.BoardReplyResponse(
             id=reply.id,
             post_id=reply.post_id,
             content=reply.content,
             author_name=reply.author_name,
-            author_year=reply.author.year if reply.author else None,
-            author_department=reply.author.department if reply.author else None,
+            **profile_cache.author_fields(profiles.get(reply.author_id)),
             like_count=reply.like_count,
-            is_liked=is_liked,
+            is_liked=reply.id in liked_ids,
             created_at=ensure_jst_aware(reply.created_at).isoformat()
-        ))
+        )
+        for reply in replies
+    ]
     
-    # 閲覧記録を更新（バッジの基準）
-    try:
-        viewer_id = get_current_user_id(request)
-        if not viewer_id:
-            dev_email = request.headers.get("X-Dev-Email")
-            if dev_email:
-                if dev_email.startswith("dev:"):
-                    dev_email = dev_email[4:]
-                user = get_user_by_email(db, dev_email)
-                viewer_id = user.id if user else None
-        if viewer_id:
-            view = db.query(models.BoardRepliesView).filter(
-                and_(models.BoardRepliesView.user_id == viewer_id, models.BoardRepliesView.post_id == post_id)
-            ).first()
-            now = models.jst_now()
-            if view:
-                view.last_viewed_at = now
-            else:
-                db.add(models.BoardRepliesView(user_id=viewer_id, post_id=post_id, last_viewed_at=now))
-            db.commit()
-    except Exception:
-        pass
+    # 閲覧記録を更新（バッジの基準。書き込みはバッファ経由でまとめて反映）
+    read_markers.mark_replies_viewed(viewer_id, post_id)
 
     return result
 
@@ -744,25 +786,11 @@ def create_reply(
     post_id: int,
     reply_data: schemas.BoardReplyCreate,
     request: Request,
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
     """投稿に返信を追加"""
     
-    # 現在のユーザーを取得
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="ユーザーIDが見つかりません"
-        )
-    
-    current_user = get_user_by_id(db, current_user_id)
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="ユーザーが見つかりません"
-        )
-    
     # 投稿を取得
     post = db.query(models.BoardPost).filter(models.BoardPost.id == post_id).first()
     if not post:
@@ -786,14 +814,18 @@ def create_reply(
     
     # 投稿の返信数を更新
     post.reply_count += 1
+    board_stats.bump(db, post.board_id, replies=1)
+    board_ranking.refresh_post(db, post)
+    db.flush()
+    ngram_index.index_row(db, "board_reply", new_reply)
+    # メンション通知（返信のコミット後に配信）
+    notify_mentions_if_any(db, new_reply.content, current_user.id, entity_type="board_reply", entity_id=new_reply.id)
     
-    db.commit()
-    db.refresh(new_reply)
-    
-    # 通知: 投稿者に「返信がつきました」
+    # 通知: 投稿者に「返信がつきました」（返信のコミット後に配信）
     try:
         if post.author_id and post.author_id != current_user.id:
-            notif = models.Notification(
+            notifications.enqueue(
+                db,
                 user_id=post.author_id,
                 actor_id=current_user.id,
                 type="post_replied",
@@ -802,16 +834,12 @@ def create_reply(
                 title="あなたの投稿に返信がありました",
                 message=(new_reply.content[:120] + f"||post_id={post.id}")
             )
-            db.add(notif)
-            db.commit()
-    except Exception:
-        pass
-
-    # メンション通知（返信本文）
-    try:
-        notify_mentions_if_any(db, new_reply.content, current_user.id, entity_type="board_reply", entity_id=new_reply.id)
     except Exception:
         pass
+    
+    db.commit()
+    db.refresh(new_reply)
+    board_events.publish("reply_created", post.board_id, post_id=post.id, reply_id=new_reply.id, reply_count=post.reply_count)
 
     return schemas.BoardReplyResponse(
         id=new_reply.id,
@@ -829,25 +857,11 @@ def create_reply(
 def toggle_reply_like(
     reply_id: int,
     request: Request,
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
     """返信のいいねを切り替え"""
     
-    # 現在のユーザーを取得
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="ユーザーIDが見つかりません"
-        )
-    
-    current_user = get_user_by_id(db, current_user_id)
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="ユーザーが見つかりません"
-        )
-    
     # 返信を取得
     reply = db.query(models.BoardReply).filter(models.BoardReply.id == reply_id).first()
     if not reply:
@@ -856,83 +870,103 @@ def toggle_reply_like(
             detail="返信が見つかりません"
         )
     
-    # 既存のいいねをチェック
-    existing_like = db.query(models.BoardReplyLike).filter(
-        and_(
-            models.BoardReplyLike.reply_id == reply_id,
-            models.BoardReplyLike.user_id == current_user.id
-        )
-    ).first()
-    
-    if existing_like:
-        # いいねを削除
-        db.delete(existing_like)
-        reply.like_count = max(0, reply.like_count - 1)
-        is_liked = False
-    else:
-        # いいねを追加
-        new_like = models.BoardReplyLike(
-            reply_id=reply_id,
-            user_id=current_user.id
-        )
-        db.add(new_like)
-        reply.like_count += 1
-        is_liked = True
-    
-    db.commit()
+    # いいねの追加/削除と like_count の加減算をDB側で行う
+    result = like_service.toggle_like(
+        db, models.BoardReplyLike, "reply_id", reply_id, current_user.id,
+        target_model=models.BoardReply, target=reply,
+    )
+    board_id = db.query(models.BoardPost.board_id).filter(models.BoardPost.id == reply.post_id).scalar()
     
-    # 通知: 返信の作者に「いいねされました」
+    # 通知: 返信の作者に「いいねされました」（いいねした場合のみ。コミット後に配信）
     try:
-        if reply.author_id and reply.author_id != current_user.id:
-            parent_post = db.query(models.BoardPost).filter(models.BoardPost.id == reply.post_id).first()
-            notif = models.Notification(
+        if result["is_liked"] and reply.author_id and reply.author_id != current_user.id:
+            notifications.enqueue(
+                db,
                 user_id=reply.author_id,
                 actor_id=current_user.id,
                 type="reply_liked",
                 entity_type="board_post",
-                entity_id=int(parent_post.board_id) if parent_post else 1,
+                entity_id=int(board_id) if board_id is not None else 1,
                 title="あなたの返信がいいねされました",
-                message=(reply.content[:120] + (f"||post_id={reply.post_id}" if parent_post else ""))
+                message=(reply.content[:120] + (f"||post_id={reply.post_id}" if board_id is not None else ""))
             )
-            db.add(notif)
-            db.commit()
     except Exception:
         pass
+    
+    db.commit()
+    if result["delta"] and board_id is not None:
+        board_events.publish("reply_liked", board_id, post_id=reply.post_id, reply_id=reply.id, like_count=result["like_count"])
 
     return {
         "message": "いいねを更新しました",
-        "is_liked": is_liked,
-        "like_count": reply.like_count
+        "is_liked": result["is_liked"],
+        "like_count": result["like_count"]
     }
 
 @router.delete("/admin/posts/{post_id}")
 def admin_delete_post(
     post_id: int,
     request: Request,
+    admin: identity.Viewer = Depends(identity.require_admin_viewer),
     db: Session = Depends(database.get_db)
 ):
     """管理者専用: 投稿を物理削除"""
-    # 認可
-    require_admin(request, db)
-
     post = db.query(models.BoardPost).filter(models.BoardPost.id == post_id).first()
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="投稿が見つかりません")
 
+    board_id = post.board_id
+    board_stats.bump(db, board_id, posts=-1, replies=-int(post.reply_count or 0), likes=-int(post.like_count or 0))
+    reply_ids = [rid for (rid,) in db.query(models.BoardReply.id).filter(models.BoardReply.post_id == post_id).all()]
+    ngram_index.remove_documents(db, "board_reply", reply_ids)
+    ngram_index.remove_document(db, "board_post", post_id)
+    board_hashtags.remove_post_hashtags(db, [post_id])
     db.delete(post)
+    db.flush()
+    board_stats.refresh_board_derived(db, board_id)
     db.commit()
+    board_events.publish("post_deleted", board_id, post_id=post_id)
     return {"message": "投稿を削除しました", "post_id": post_id}
 
+@router.get("/admin/ranking-params")
+def get_ranking_params(request: Request, admin: identity.Viewer = Depends(identity.require_admin_viewer), db: Session = Depends(database.get_db)):
+    """管理者専用: フィードのランキングパラメータを取得"""
+    board_ranking.load_params(db)
+    return {"params": board_ranking.get_params(), "sweep_interval_seconds": board_ranking.SWEEP_INTERVAL_SECONDS}
+
+@router.put("/admin/ranking-params/{mode}")
+def update_ranking_params(
+    mode: str,
+    payload: schemas.BoardRankingParamsUpdate,
+    request: Request,
+    admin: identity.Viewer = Depends(identity.require_admin_viewer),
+    db: Session = Depends(database.get_db)
+):
+    """管理者専用: ランキングパラメータを変更して全投稿のスコアを再計算（他ワーカーは次回スイープで反映）"""
+    if mode not in board_ranking.MODES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="modeは popular または trending を指定してください")
+    if (payload.like_weight is not None and payload.like_weight < 0) or (payload.reply_weight is not None and payload.reply_weight < 0):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="重みは0以上を指定してください")
+    if payload.half_life_hours is not None and payload.half_life_hours <= 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="半減期は0より大きい値を指定してください")
+    params = board_ranking.save_params(
+        db, mode,
+        like_weight=payload.like_weight,
+        reply_weight=payload.reply_weight,
+        half_life_hours=payload.half_life_hours,
+    )
+    count = board_ranking.recompute(db)
+    db.commit()
+    return {"mode": mode, "params": params, "recomputed": count}
+
 @router.delete("/admin/replies/{reply_id}")
 def admin_delete_reply(
     reply_id: int,
     request: Request,
+    admin: identity.Viewer = Depends(identity.require_admin_viewer),
     db: Session = Depends(database.get_db)
 ):
     """管理者専用: 返信を物理削除（親投稿の返信数も調整）"""
-    # 認可
-    require_admin(request, db)
-
     reply = db.query(models.BoardReply).filter(models.BoardReply.id == reply_id).first()
     if not reply:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="返信が見つかりません")
@@ -941,21 +975,48 @@ def admin_delete_reply(
     parent_post = db.query(models.BoardPost).filter(models.BoardPost.id == reply.post_id).first()
     if parent_post and parent_post.reply_count and parent_post.reply_count > 0:
         parent_post.reply_count -= 1
+        board_stats.bump(db, parent_post.board_id, replies=-1)
+        board_ranking.refresh_post(db, parent_post)
 
+    post_id = reply.post_id
+    ngram_index.remove_document(db, "board_reply", reply_id)
     db.delete(reply)
     db.commit()
+    if parent_post:
+        board_events.publish("reply_deleted", parent_post.board_id, post_id=post_id, reply_id=reply_id, reply_count=parent_post.reply_count)
     return {"message": "返信を削除しました", "reply_id": reply_id}
 
+# -----------------------------
+# 更新イベントのストリーム（SSE）
+# -----------------------------
+
+@router.get("/stream")
+async def stream_board_events(
+    request: Request,
+    board_id: Optional[List[str]] = Query(None, description="対象の掲示板ID（複数指定可。省略時は全掲示板）"),
+):
+    """新規投稿/返信/いいね等のイベントを Server-Sent Events で配信（再接続時は Last-Event-ID 以降を再送）"""
+    last_event_id = None
+    raw_last_id = request.headers.get("last-event-id")
+    if raw_last_id:
+        try:
+            last_event_id = int(raw_last_id)
+        except ValueError:
+            last_event_id = None
+    return StreamingResponse(
+        board_events.stream(request, board_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # -----------------------------
 # 新着件数と訪問記録
 # -----------------------------
 
 @router.get("/new-counts")
-def get_new_counts(request: Request, db: Session = Depends(database.get_db)):
+def get_new_counts(request: Request, current_user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(database.get_db)):
     """ユーザーの最終訪問以降の新規投稿/コメント数を掲示板ごとに返す"""
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
+    current_user_id = current_user.id
 
     board_ids = [1, 2, 3, 4, 5, 6]
     results = []
@@ -963,7 +1024,10 @@ def get_new_counts(request: Request, db: Session = Depends(database.get_db)):
         visit = db.query(models.BoardVisit).filter(
             and_(models.BoardVisit.user_id == current_user_id, models.BoardVisit.board_id == str(board_id))
         ).first()
-        last_seen = visit.last_seen if visit else None
+        last_seen = read_markers.effective_time(
+            visit.last_seen if visit else None,
+            read_markers.pending_visit(current_user_id, board_id),
+        )
 
         # 新規投稿数
         post_query = db.query(func.count(models.BoardPost.id)).filter(models.BoardPost.board_id == str(board_id))
@@ -989,22 +1053,13 @@ def get_new_counts(request: Request, db: Session = Depends(database.get_db)):
     return {"counts": results}
 
 @router.post("/visit/{board_id}")
-def mark_board_visited(board_id: str, request: Request, db: Session = Depends(database.get_db)):
+def mark_board_visited(board_id: str, request: Request, current_user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(database.get_db)):
     """掲示板入室時に最終訪問時刻を現在時刻に更新する"""
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
+    current_user_id = current_user.id
 
-    visit = db.query(models.BoardVisit).filter(
-        and_(models.BoardVisit.user_id == current_user_id, models.BoardVisit.board_id == str(board_id))
-    ).first()
+    # 書き込みはバッファ経由（新規訪問の参加者数は flush 時に加算）
     now = models.jst_now()
-    if visit:
-        visit.last_seen = now
-    else:
-        visit = models.BoardVisit(user_id=current_user_id, board_id=str(board_id), last_seen=now)
-        db.add(visit)
-    db.commit()
+    read_markers.mark_board_visited(current_user_id, board_id, now)
     return {"message": "ok", "board_id": board_id, "last_seen": ensure_jst_aware(now).isoformat()}
 
 # =============================
@@ -1014,59 +1069,27 @@ def mark_board_visited(board_id: str, request: Request, db: Session = Depends(da
 @router.get("/my/posts", response_model=List[schemas.BoardPostResponse])
 def get_my_posts(
     request: Request,
+    response: Response,
     limit: int = Query(50, description="取得件数"),
-    offset: int = Query(0, description="オフセット"),
+    offset: int = Query(0, description="オフセット（beforeがない場合のみ使用）"),
+    before: Optional[str] = Query(None, description="次ページ用カーソル（X-Next-Cursorの値）"),
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    current_user = get_user_by_id(db, current_user_id)
-    if not current_user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
-
-    posts = db.query(models.BoardPost).filter(
-        models.BoardPost.author_id == current_user.id
-    ).order_by(desc(models.BoardPost.created_at)).offset(offset).limit(limit).all()
-
-    # 最終閲覧をまとめ取得
-    user_last_view = {}
-    rows = db.query(models.BoardRepliesView.post_id, models.BoardRepliesView.last_viewed_at).filter(
-        models.BoardRepliesView.user_id == current_user.id
-    ).all()
-    for post_id, last_viewed_at in rows:
-        user_last_view[post_id] = last_viewed_at
 
-    result: List[schemas.BoardPostResponse] = []
-    for post in posts:
-        is_liked = db.query(models.BoardPostLike.id).filter(
-            and_(models.BoardPostLike.post_id == post.id, models.BoardPostLike.user_id == current_user.id)
-        ).first() is not None
-        has_replied = db.query(models.BoardReply.id).filter(
-            and_(models.BoardReply.post_id == post.id, models.BoardReply.author_id == current_user.id)
-        ).first() is not None
-        new_replies_count = 0
-        last_view = user_last_view.get(post.id)
-        if last_view:
-            new_replies_count = db.query(func.count(models.BoardReply.id)).filter(
-                and_(models.BoardReply.post_id == post.id, models.BoardReply.created_at > last_view)
-            ).scalar() or 0
-        result.append(schemas.BoardPostResponse(
-            id=post.id,
-            board_id=post.board_id,
-            content=post.content,
-            hashtags=post.hashtags,
-            author_name=post.author_name,
-            author_year=post.author.year if post.author else None,
-            author_department=post.author.department if post.author else None,
-            like_count=post.like_count,
-            reply_count=post.reply_count,
-            created_at=ensure_jst_aware(post.created_at).isoformat(),
-            is_liked=is_liked,
-            has_replied=has_replied,
-            new_replies_since_my_last_reply=int(new_replies_count),
-            can_edit=True
-        ))
+    query = db.query(models.BoardPost).filter(models.BoardPost.author_id == current_user.id)
+    if before:
+        posts = apply_keyset(query, models.BoardPost.created_at, models.BoardPost.id, before).limit(limit).all()
+    else:
+        posts = query.order_by(desc(models.BoardPost.created_at), desc(models.BoardPost.id)).offset(offset).limit(limit).all()
+    set_next_cursor(response, posts, limit)
+
+    states = load_viewer_states(db, [p.id for p in posts], current_user.id)
+    profile = profile_cache.get_profile(db, current_user.id)
+    result: List[schemas.BoardPostResponse] = [
+        build_post_response(post, states.get(post.id), can_edit=True, profile=profile)
+        for post in posts
+    ]
     return result
 
 @router.get("/my/liked", response_model=List[schemas.BoardPostResponse])
@@ -1074,14 +1097,9 @@ def get_my_liked_posts(
     request: Request,
     limit: int = Query(50, description="取得件数"),
     offset: int = Query(0, description="オフセット"),
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    current_user = get_user_by_id(db, current_user_id)
-    if not current_user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
 
     # 自分がいいねした投稿を like 時刻の新しい順で取得
     liked = db.query(
@@ -1092,40 +1110,13 @@ def get_my_liked_posts(
     ).order_by(desc("liked_at"), desc(models.BoardPost.created_at)
     ).offset(offset).limit(limit).all()
 
-    # 最終閲覧をまとめ取得
-    user_last_view = {}
-    rows = db.query(models.BoardRepliesView.post_id, models.BoardRepliesView.last_viewed_at).filter(
-        models.BoardRepliesView.user_id == current_user.id
-    ).all()
-    for post_id, last_viewed_at in rows:
-        user_last_view[post_id] = last_viewed_at
-
+    states = load_viewer_states(db, [p.id for p, _ in liked], current_user.id)
+    profiles = profile_cache.get_profiles(db, [p.author_id for p, _ in liked])
     result: List[schemas.BoardPostResponse] = []
     for post, _liked_at in liked:
-        has_replied = db.query(models.BoardReply.id).filter(
-            and_(models.BoardReply.post_id == post.id, models.BoardReply.author_id == current_user.id)
-        ).first() is not None
-        new_replies_count = 0
-        last_view = user_last_view.get(post.id)
-        if last_view:
-            new_replies_count = db.query(func.count(models.BoardReply.id)).filter(
-                and_(models.BoardReply.post_id == post.id, models.BoardReply.created_at > last_view)
-            ).scalar() or 0
-        result.append(schemas.BoardPostResponse(
-            id=post.id,
-            board_id=post.board_id,
-            content=post.content,
-            hashtags=post.hashtags,
-            author_name=post.author_name,
-            author_year=post.author.year if post.author else None,
-            author_department=post.author.department if post.author else None,
-            like_count=post.like_count,
-            reply_count=post.reply_count,
-            created_at=ensure_jst_aware(post.created_at).isoformat(),
-            is_liked=True,
-            has_replied=has_replied,
-            new_replies_since_my_last_reply=int(new_replies_count),
-            can_edit=bool(post.author_id == current_user.id)
+        state = dict(states.get(post.id) or {}, is_liked=True)
+        result.append(build_post_response(
+            post, state, can_edit=bool(post.author_id == current_user.id), profile=profiles.get(post.author_id)
         ))
     return result
 
@@ -1134,14 +1125,9 @@ def get_my_replied_posts(
     request: Request,
     limit: int = Query(50, description="取得件数"),
     offset: int = Query(0, description="オフセット"),
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    current_user = get_user_by_id(db, current_user_id)
-    if not current_user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
 
     # 自分が返信した投稿の最新返信時刻をサブクエリで求めて並べる
     sub = db.query(
@@ -1159,41 +1145,13 @@ def get_my_replied_posts(
 
     rows = q.all()
 
-    # 最終閲覧まとめ
-    user_last_view = {}
-    views = db.query(models.BoardRepliesView.post_id, models.BoardRepliesView.last_viewed_at).filter(
-        models.BoardRepliesView.user_id == current_user.id
-    ).all()
-    for post_id, last_viewed_at in views:
-        user_last_view[post_id] = last_viewed_at
-
+    states = load_viewer_states(db, [p.id for p, _ in rows], current_user.id)
+    profiles = profile_cache.get_profiles(db, [p.author_id for p, _ in rows])
     result: List[schemas.BoardPostResponse] = []
     for post, _last_replied_at in rows:
-        is_liked = db.query(models.BoardPostLike.id).filter(
-            and_(models.BoardPostLike.post_id == post.id, models.BoardPostLike.user_id == current_user.id)
-        ).first() is not None
-        has_replied = True
-        new_replies_count = 0
-        last_view = user_last_view.get(post.id)
-        if last_view:
-            new_replies_count = db.query(func.count(models.BoardReply.id)).filter(
-                and_(models.BoardReply.post_id == post.id, models.BoardReply.created_at > last_view)
-            ).scalar() or 0
-        result.append(schemas.BoardPostResponse(
-            id=post.id,
-            board_id=post.board_id,
-            content=post.content,
-            hashtags=post.hashtags,
-            author_name=post.author_name,
-            author_year=post.author.year if post.author else None,
-            author_department=post.author.department if post.author else None,
-            like_count=post.like_count,
-            reply_count=post.reply_count,
-            created_at=ensure_jst_aware(post.created_at).isoformat(),
-            is_liked=is_liked,
-            has_replied=has_replied,
-            new_replies_since_my_last_reply=int(new_replies_count),
-            can_edit=bool(post.author_id == current_user.id)
+        state = dict(states.get(post.id) or {}, has_replied=True)
+        result.append(build_post_response(
+            post, state, can_edit=bool(post.author_id == current_user.id), profile=profiles.get(post.author_id)
         ))
     return result
 
@@ -1201,52 +1159,41 @@ def get_my_replied_posts(
 # 任意ユーザーの投稿/いいね/返信（閲覧用）
 # =============================
 
-def _compose_post_response_for_viewer(db: Session, post: models.BoardPost, viewer_id: int | None):
-    is_liked = False
-    has_replied = False
-    new_replies_count = 0
-    if viewer_id:
-        is_liked = db.query(models.BoardPostLike.id).filter(
-            and_(models.BoardPostLike.post_id == post.id, models.BoardPostLike.user_id == viewer_id)
-        ).first() is not None
-        has_replied = db.query(models.BoardReply.id).filter(
-            and_(models.BoardReply.post_id == post.id, models.BoardReply.author_id == viewer_id)
-        ).first() is not None
-        last_view = db.query(models.BoardRepliesView.last_viewed_at).filter(
-            and_(models.BoardRepliesView.user_id == viewer_id, models.BoardRepliesView.post_id == post.id)
-        ).scalar()
-        if last_view:
-            new_replies_count = db.query(func.count(models.BoardReply.id)).filter(
-                and_(models.BoardReply.post_id == post.id, models.BoardReply.created_at > last_view)
-            ).scalar() or 0
-    return schemas.BoardPostResponse(
-        id=post.id,
-        board_id=post.board_id,
-        content=post.content,
-        hashtags=post.hashtags,
-        author_name=post.author_name,
-        author_year=post.author.year if post.author else None,
-        author_department=post.author.department if post.author else None,
-        like_count=post.like_count,
-        reply_count=post.reply_count,
-        created_at=ensure_jst_aware(post.created_at).isoformat(),
-        is_liked=is_liked,
-        has_replied=has_replied,
-        new_replies_since_my_last_reply=int(new_replies_count),
-        can_edit=False,
-    )
+def _compose_post_response_for_viewer(
+    db: Session,
+    post: models.BoardPost,
+    viewer_id: int | None,
+    states: dict | None = None,
+    profiles: dict | None = None,
+):
+    """閲覧者視点の投稿レスポンス。states/profiles未指定時はこの投稿分だけ一括ローダーで取得する"""
+    if states is None:
+        states = load_viewer_states(db, [post.id], viewer_id)
+    if profiles is None:
+        profiles = profile_cache.get_profiles(db, [post.author_id])
+    return build_post_response(post, states.get(post.id), can_edit=False, profile=profiles.get(post.author_id))
 
 @router.get("/user/{user_id}/posts", response_model=List[schemas.BoardPostResponse])
 def get_user_posts(
     user_id: int = Path(..., description="対象ユーザーID"),
     request: Request = None,
+    response: Response = None,
     limit: int = Query(50, description="取得件数"),
-    offset: int = Query(0, description="オフセット"),
+    offset: int = Query(0, description="オフセット（beforeがない場合のみ使用）"),
+    before: Optional[str] = Query(None, description="次ページ用カーソル（X-Next-Cursorの値）"),
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
     db: Session = Depends(database.get_db)
 ):
-    viewer_id = get_current_user_id(request) if request else None
-    posts = db.query(models.BoardPost).filter(models.BoardPost.author_id == user_id).order_by(desc(models.BoardPost.created_at)).offset(offset).limit(limit).all()
-    return [_compose_post_response_for_viewer(db, p, viewer_id) for p in posts]
+    viewer_id = viewer.id if viewer else None
+    query = db.query(models.BoardPost).filter(models.BoardPost.author_id == user_id)
+    if before:
+        posts = apply_keyset(query, models.BoardPost.created_at, models.BoardPost.id, before).limit(limit).all()
+    else:
+        posts = query.order_by(desc(models.BoardPost.created_at), desc(models.BoardPost.id)).offset(offset).limit(limit).all()
+    set_next_cursor(response, posts, limit)
+    states = load_viewer_states(db, [p.id for p in posts], viewer_id)
+    profiles = profile_cache.get_profiles(db, [user_id])
+    return [_compose_post_response_for_viewer(db, p, viewer_id, states, profiles) for p in posts]
 
 @router.get("/user/{user_id}/liked", response_model=List[schemas.BoardPostResponse])
 def get_user_liked_posts(
@@ -1254,9 +1201,10 @@ def get_user_liked_posts(
     request: Request = None,
     limit: int = Query(50, description="取得件数"),
     offset: int = Query(0, description="オフセット"),
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
     db: Session = Depends(database.get_db)
 ):
-    viewer_id = get_current_user_id(request) if request else None
+    viewer_id = viewer.id if viewer else None
     rows = db.query(
         models.BoardPost,
         models.BoardPostLike.created_at.label("liked_at")
@@ -1264,7 +1212,9 @@ def get_user_liked_posts(
     ).filter(models.BoardPostLike.user_id == user_id
     ).order_by(desc("liked_at"), desc(models.BoardPost.created_at)
     ).offset(offset).limit(limit).all()
-    return [_compose_post_response_for_viewer(db, p, viewer_id) for (p, _at) in rows]
+    states = load_viewer_states(db, [p.id for p, _at in rows], viewer_id)
+    profiles = profile_cache.get_profiles(db, [p.author_id for p, _at in rows])
+    return [_compose_post_response_for_viewer(db, p, viewer_id, states, profiles) for (p, _at) in rows]
 
 @router.get("/user/{user_id}/replied", response_model=List[schemas.BoardPostResponse])
 def get_user_replied_posts(
@@ -1272,9 +1222,10 @@ def get_user_replied_posts(
     request: Request = None,
     limit: int = Query(50, description="取得件数"),
     offset: int = Query(0, description="オフセット"),
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
     db: Session = Depends(database.get_db)
 ):
-    viewer_id = get_current_user_id(request) if request else None
+    viewer_id = viewer.id if viewer else None
     sub = db.query(
         models.BoardReply.post_id,
         func.max(models.BoardReply.created_at).label("last_replied_at")
@@ -1284,4 +1235,6 @@ def get_user_replied_posts(
     ).order_by(desc(sub.c.last_replied_at), desc(models.BoardPost.created_at)
     ).offset(offset).limit(limit)
     rows = q.all()
-    return [_compose_post_response_for_viewer(db, p, viewer_id) for (p, _at) in rows]
+    states = load_viewer_states(db, [p.id for p, _at in rows], viewer_id)
+    profiles = profile_cache.get_profiles(db, [p.author_id for p, _at in rows])
+    return [_compose_post_response_for_viewer(db, p, viewer_id, states, profiles) for (p, _at) in rows]
@@ -0,0 +1,396 @@
+"""
+掲示板の全文検索（投稿本文・ハッシュタグ・返信本文）
+
+- SQLite: FTS5（trigramトークナイザ。日本語の部分一致に対応）＋トリガーで自動同期
+- PostgreSQL: to_tsvector の式インデックス（GIN）。インデックスは自動で同期される
+- trigramで引けない2文字の語や、PostgreSQLの 'simple' 設定では分割されない日本語の語は
+  文字バイグラム索引（ngram_index.py）で候補を絞り、LIKEで確認する
+- 索引で引けない1文字だけの検索は件数上限付きの LIKE にフォールバック
+
+関連度（bm25 / ts_rank）に新しさの減衰を掛け合わせて並べ、投稿単位でまとめて返す。
+"""
+
+import base64
+import html
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+import models
+import ngram_index
+
+# 関連度・新しさそれぞれで取得する候補数の上限（合算して並べ替える）
+CANDIDATE_LIMIT = 500
+# 新しさの減衰: 経過日数がこの値に達するとスコアが半分になる
+RECENCY_HALF_LIFE_DAYS = 30.0
+# trigramで検索できる最小文字数
+MIN_FTS_TERM_LENGTH = 3
+# スニペットの強調タグ
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+# DB側のスニペット関数に渡す区切り（本文をHTMLエスケープした後で強調タグに置き換える）
+_SNIPPET_START = "\ue000"
+_SNIPPET_END = "\ue001"
+SNIPPET_TOKENS = 24
+
+PG_POST_VECTOR = "to_tsvector('simple', coalesce(content, '') || ' ' || coalesce(hashtags, ''))"
+PG_REPLY_VECTOR = "to_tsvector('simple', coalesce(content, ''))"
+
+# setup_search_index() で決定する検索方式: 'fts5' | 'postgres' | 'like'
+_backend = "like"
+
+def get_backend() -> str:
+    return _backend
+
+def setup_search_index(engine) -> str:
+    """検索インデックスを用意する（冪等）。利用する検索方式を返す"""
+    global _backend
+    dialect = engine.dialect.name
+    try:
+        if dialect == "sqlite":
+            _backend = _setup_sqlite(engine)
+        elif dialect == "postgresql":
+            _setup_postgres(engine)
+            _backend = "postgres"
+        else:
+            _backend = "like"
+    except SQLAlchemyError as e:
+        print(f"⚠️ 全文検索インデックスを作成できませんでした（LIKE検索にフォールバック）: {e}")
+        _backend = "like"
+    print(f"✅ 掲示板検索バックエンド: {_backend}")
+    return _backend
+
+def _setup_sqlite(engine) -> str:
+    with engine.begin() as conn:
+        existing = {
+            row[0] for row in conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE name IN ('board_posts_fts', 'board_replies_fts')"
+            ))
+        }
+    tokenizer = "trigram"
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts_probe USING fts5(x, tokenize='trigram')"))
+            conn.execute(text("DROP TABLE IF EXISTS temp._fts_probe"))
+    except SQLAlchemyError:
+        # 古いSQLite（3.34未満）はtrigram非対応
+        tokenizer = "unicode61"
+
+    statements = [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS board_posts_fts USING fts5(
+            content, hashtags, content='board_posts', content_rowid='id', tokenize='{tokenizer}'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS board_posts_fts_ai AFTER INSERT ON board_posts BEGIN
+            INSERT INTO board_posts_fts(rowid, content, hashtags) VALUES (new.id, new.content, new.hashtags);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS board_posts_fts_ad AFTER DELETE ON board_posts BEGIN
+            INSERT INTO board_posts_fts(board_posts_fts, rowid, content, hashtags) VALUES ('delete', old.id, old.content, old.hashtags);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS board_posts_fts_au AFTER UPDATE OF content, hashtags ON board_posts BEGIN
+            INSERT INTO board_posts_fts(board_posts_fts, rowid, content, hashtags) VALUES ('delete', old.id, old.content, old.hashtags);
+            INSERT INTO board_posts_fts(rowid, content, hashtags) VALUES (new.id, new.content, new.hashtags);
+        END
+        """,
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS board_replies_fts USING fts5(
+            content, content='board_replies', content_rowid='id', tokenize='{tokenizer}'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS board_replies_fts_ai AFTER INSERT ON board_replies BEGIN
+            INSERT INTO board_replies_fts(rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS board_replies_fts_ad AFTER DELETE ON board_replies BEGIN
+            INSERT INTO board_replies_fts(board_replies_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS board_replies_fts_au AFTER UPDATE OF content ON board_replies BEGIN
+            INSERT INTO board_replies_fts(board_replies_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO board_replies_fts(rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+    ]
+    with engine.begin() as conn:
+        for sql in statements:
+            conn.execute(text(sql))
+        # 新規作成したインデックスには既存行を取り込む
+        if "board_posts_fts" not in existing:
+            conn.execute(text("INSERT INTO board_posts_fts(board_posts_fts) VALUES ('rebuild')"))
+        if "board_replies_fts" not in existing:
+            conn.execute(text("INSERT INTO board_replies_fts(board_replies_fts) VALUES ('rebuild')"))
+    return "fts5"
+
+def _setup_postgres(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_board_posts_fts ON board_posts USING GIN ({PG_POST_VECTOR})"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_board_replies_fts ON board_replies USING GIN ({PG_REPLY_VECTOR})"))
+
+def rebuild_search_index(db: Session) -> None:
+    """FTS5インデックスを投稿/返信テーブルから再構築（SQLiteのみ。PostgreSQLは式インデックスのため不要）"""
+    if _backend != "fts5":
+        return
+    db.execute(text("INSERT INTO board_posts_fts(board_posts_fts) VALUES ('rebuild')"))
+    db.execute(text("INSERT INTO board_replies_fts(board_replies_fts) VALUES ('rebuild')"))
+
+# -----------------------------
+# カーソル（ランキング順のため位置ベース）
+# -----------------------------
+
+def encode_search_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(f"o:{int(offset)}".encode("ascii")).decode("ascii").rstrip("=")
+
+def decode_search_cursor(cursor: str | None) -> int:
+    """不正なカーソルは ValueError"""
+    if not cursor:
+        return 0
+    padded = cursor + "=" * (-len(cursor) % 4)
+    raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii")
+    if not raw.startswith("o:"):
+        raise ValueError("invalid cursor")
+    return max(0, int(raw[2:]))
+
+# -----------------------------
+# 検索本体
+# -----------------------------
+
+def split_terms(query: str) -> list[str]:
+    return [t for t in (query or "").split() if t]
+
+def _fts5_match_expr(terms: list[str]) -> str:
+    # 各語をフレーズとして引用し、演算子として解釈されないようにする（AND検索）
+    return " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+def _recency_score(relevance: float, age_days) -> float:
+    age = max(0.0, float(age_days or 0.0))
+    return relevance / (1.0 + age / RECENCY_HALF_LIFE_DAYS)
+
+def _merge_candidates(*row_sets):
+    """(id, relevance, age_days, ...) の候補を id で重複排除"""
+    merged = {}
+    for rows in row_sets:
+        for row in rows:
+            merged.setdefault(row[0], row)
+    return list(merged.values())
+
+def _fts5_candidates(db: Session, terms: list[str]):
+    q = _fts5_match_expr(terms)
+    post_sql = """
+        SELECT f.rowid, -bm25(board_posts_fts) AS relevance, julianday(:now) - julianday(p.created_at) AS age_days
+        FROM board_posts_fts f JOIN board_posts p ON p.id = f.rowid
+        WHERE board_posts_fts MATCH :q
+        ORDER BY {order} LIMIT :cap
+    """
+    reply_sql = """
+        SELECT f.rowid, -bm25(board_replies_fts) AS relevance, julianday(:now) - julianday(r.created_at) AS age_days, r.post_id
+        FROM board_replies_fts f JOIN board_replies r ON r.id = f.rowid
+        WHERE board_replies_fts MATCH :q
+        ORDER BY {order} LIMIT :cap
+    """
+    # created_at はタイムゾーンなしの日本時間で保存されているので、経過日数も日本時間の現在時刻から求める
+    # （julianday('now') はUTCのため、LIKEフォールバックと9時間ずれる）
+    now = models.jst_now().replace(tzinfo=None).isoformat(sep=" ")
+    params = {"q": q, "cap": CANDIDATE_LIMIT, "now": now}
+    posts = _merge_candidates(
+        db.execute(text(post_sql.format(order="bm25(board_posts_fts)")), params).fetchall(),
+        db.execute(text(post_sql.format(order="f.rowid DESC")), params).fetchall(),
+    )
+    replies = _merge_candidates(
+        db.execute(text(reply_sql.format(order="bm25(board_replies_fts)")), params).fetchall(),
+        db.execute(text(reply_sql.format(order="f.rowid DESC")), params).fetchall(),
+    )
+    return posts, replies
+
+def _postgres_candidates(db: Session, terms: list[str]):
+    params = {"q": " ".join(terms), "cap": CANDIDATE_LIMIT}
+    post_sql = f"""
+        SELECT p.id, ts_rank({PG_POST_VECTOR}, plainto_tsquery('simple', :q)) AS relevance,
+               EXTRACT(EPOCH FROM (now() - p.created_at)) / 86400.0 AS age_days
+        FROM board_posts p
+        WHERE {PG_POST_VECTOR} @@ plainto_tsquery('simple', :q)
+        ORDER BY {{order}} LIMIT :cap
+    """
+    reply_sql = f"""
+        SELECT r.id, ts_rank({PG_REPLY_VECTOR}, plainto_tsquery('simple', :q)) AS relevance,
+               EXTRACT(EPOCH FROM (now() - r.created_at)) / 86400.0 AS age_days, r.post_id
+        FROM board_replies r
+        WHERE {PG_REPLY_VECTOR} @@ plainto_tsquery('simple', :q)
+        ORDER BY {{order}} LIMIT :cap
+    """
+    posts = _merge_candidates(
+        db.execute(text(post_sql.format(order="relevance DESC")), params).fetchall(),
+        db.execute(text(post_sql.format(order="p.id DESC")), params).fetchall(),
+    )
+    replies = _merge_candidates(
+        db.execute(text(reply_sql.format(order="relevance DESC")), params).fetchall(),
+        db.execute(text(reply_sql.format(order="r.id DESC")), params).fetchall(),
+    )
+    return posts, replies
+
+def _like_candidates(db: Session, terms: list[str], post_ids=None, reply_ids=None):
+    """上限付きLIKE検索（新しい順、関連度は一律）。post_ids/reply_ids を渡すとその中だけを確認する"""
+    post_q = db.query(models.BoardPost.id, models.BoardPost.created_at)
+    reply_q = db.query(models.BoardReply.id, models.BoardReply.created_at, models.BoardReply.post_id)
+    if post_ids is not None:
+        post_q = post_q.filter(models.BoardPost.id.in_(post_ids))
+    if reply_ids is not None:
+        reply_q = reply_q.filter(models.BoardReply.id.in_(reply_ids))
+    for term in terms:
+        like = f"%{term}%"
+        post_q = post_q.filter(models.BoardPost.content.like(like) | models.BoardPost.hashtags.like(like))
+        reply_q = reply_q.filter(models.BoardReply.content.like(like))
+    post_rows = post_q.order_by(models.BoardPost.id.desc()).limit(CANDIDATE_LIMIT).all()
+    reply_rows = reply_q.order_by(models.BoardReply.id.desc()).limit(CANDIDATE_LIMIT).all()
+    now = models.jst_now()
+
+    def age_days(dt):
+        if dt is None:
+            return 0.0
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=models.JST)
+        return (now - dt).total_seconds() / 86400.0
+
+    posts = [(pid, 1.0, age_days(created)) for pid, created in post_rows]
+    replies = [(rid, 1.0, age_days(created), post_id) for rid, created, post_id in reply_rows]
+    return posts, replies
+
+def _ngram_candidates(db: Session, terms: list[str]):
+    """バイグラム索引の積集合で候補を絞ってから LIKE で連続一致を確認する"""
+    query = " ".join(terms)
+    post_ids = ngram_index.candidate_ids(db, "board_post", query)
+    reply_ids = ngram_index.candidate_ids(db, "board_reply", query)
+    if post_ids is None or reply_ids is None:
+        return _like_candidates(db, terms)
+    # 新しい順に上限を設けて確認する（IDは作成順）
+    verify_cap = CANDIDATE_LIMIT * 4
+    return _like_candidates(
+        db, terms,
+        post_ids=sorted(post_ids, reverse=True)[:verify_cap],
+        reply_ids=sorted(reply_ids, reverse=True)[:verify_cap],
+    )
+
+def _has_cjk(term: str) -> bool:
+    return any(ord(ch) >= 0x2E80 for ch in term)
+
+def search(db: Session, query: str, limit: int, offset: int = 0) -> dict:
+    """投稿単位でランキングした検索結果のページを返す
+
+    戻り値: {"hits": [{"post_id", "score", "reply_ids"}], "total": 候補総数, "next_offset": 次ページ位置 or None}
+    """
+    terms = split_terms(query)
+    if not terms:
+        return {"hits": [], "total": 0, "next_offset": None}
+
+    backend = _backend
+    if backend == "fts5" and any(len(t) < MIN_FTS_TERM_LENGTH for t in terms):
+        backend = "ngram"
+    elif backend == "postgres" and any(_has_cjk(t) for t in terms):
+        backend = "ngram"
+    elif backend == "like":
+        backend = "ngram"
+    if backend == "fts5":
+        post_rows, reply_rows = _fts5_candidates(db, terms)
+    elif backend == "postgres":
+        post_rows, reply_rows = _postgres_candidates(db, terms)
+    else:
+        post_rows, reply_rows = _ngram_candidates(db, terms)
+
+    # 投稿ごとに集約（返信のみヒットした投稿も含める）
+    hits: dict[int, dict] = {}
+    for pid, relevance, age in post_rows:
+        hits[pid] = {"post_id": pid, "score": _recency_score(relevance, age), "reply_ids": []}
+    for rid, relevance, age, post_id in reply_rows:
+        score = _recency_score(relevance, age)
+        hit = hits.get(post_id)
+        if hit is None:
+            hit = hits[post_id] = {"post_id": post_id, "score": score, "reply_ids": []}
+        else:
+            hit["score"] = max(hit["score"], score)
+        hit["reply_ids"].append(rid)
+
+    ranked = sorted(hits.values(), key=lambda h: (h["score"], h["post_id"]), reverse=True)
+    page = ranked[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(ranked) else None
+    return {"hits": page, "total": len(ranked), "next_offset": next_offset, "backend": backend}
+
+def _render_snippet(raw: str | None) -> str:
+    """本文をHTMLエスケープしてから区切り文字を強調タグに置き換える"""
+    escaped = html.escape(raw or "")
+    return escaped.replace(_SNIPPET_START, HIGHLIGHT_START).replace(_SNIPPET_END, HIGHLIGHT_END)
+
+def snippets(db: Session, query: str, post_ids, reply_ids, backend: str | None = None) -> tuple[dict, dict]:
+    """表示ページ分だけ強調付きスニペットを作る。({post_id: snippet}, {reply_id: snippet})"""
+    terms = split_terms(query)
+    backend = backend or _backend
+    post_ids = [int(i) for i in post_ids]
+    reply_ids = [int(i) for i in reply_ids]
+    post_snips: dict[int, str] = {}
+    reply_snips: dict[int, str] = {}
+    if not terms:
+        return post_snips, reply_snips
+
+    if backend == "fts5":
+        q = _fts5_match_expr(terms)
+        if post_ids:
+            rows = db.execute(text(
+                f"SELECT rowid, snippet(board_posts_fts, 0, :s, :e, '…', {SNIPPET_TOKENS}) FROM board_posts_fts "
+                f"WHERE board_posts_fts MATCH :q AND rowid IN ({','.join(str(i) for i in post_ids)})"
+            ), {"q": q, "s": _SNIPPET_START, "e": _SNIPPET_END}).fetchall()
+            post_snips = {rid: _render_snippet(snip) for rid, snip in rows}
+        if reply_ids:
+            rows = db.execute(text(
+                f"SELECT rowid, snippet(board_replies_fts, 0, :s, :e, '…', {SNIPPET_TOKENS}) FROM board_replies_fts "
+                f"WHERE board_replies_fts MATCH :q AND rowid IN ({','.join(str(i) for i in reply_ids)})"
+            ), {"q": q, "s": _SNIPPET_START, "e": _SNIPPET_END}).fetchall()
+            reply_snips = {rid: _render_snippet(snip) for rid, snip in rows}
+    elif backend == "postgres":
+        options = f"StartSel={_SNIPPET_START}, StopSel={_SNIPPET_END}, MaxWords={SNIPPET_TOKENS}, MinWords=8"
+        params = {"q": " ".join(terms), "opts": options}
+        if post_ids:
+            rows = db.execute(text(
+                "SELECT id, ts_headline('simple', content, plainto_tsquery('simple', :q), :opts) FROM board_posts "
+                f"WHERE id IN ({','.join(str(i) for i in post_ids)})"
+            ), params).fetchall()
+            post_snips = {rid: _render_snippet(snip) for rid, snip in rows}
+        if reply_ids:
+            rows = db.execute(text(
+                "SELECT id, ts_headline('simple', content, plainto_tsquery('simple', :q), :opts) FROM board_replies "
+                f"WHERE id IN ({','.join(str(i) for i in reply_ids)})"
+            ), params).fetchall()
+            reply_snips = {rid: _render_snippet(snip) for rid, snip in rows}
+    return post_snips, reply_snips
+
+def highlight_plain(content: str, terms: list[str], width: int = 60) -> str:
+    """インデックス外（LIKEフォールバック等）のスニペット。最初の一致箇所の周辺を強調して返す（本文はHTMLエスケープ）"""
+    if not content:
+        return ""
+    # 本文中の区切り文字は強調タグと紛れないよう取り除く
+    content = content.replace(_SNIPPET_START, "").replace(_SNIPPET_END, "")
+    lower = content.lower()
+    first = min((lower.find(t.lower()) for t in terms if lower.find(t.lower()) >= 0), default=-1)
+    if first < 0:
+        return html.escape(content[:width * 2])
+    start = max(0, first - width)
+    end = min(len(content), first + width)
+    fragment = content[start:end]
+    # 重ならない一致区間を集めてから強調タグを挿入
+    spans = []
+    lower_fragment = fragment.lower()
+    for t in sorted(set(terms), key=len, reverse=True):
+        t_lower = t.lower()
+        idx = lower_fragment.find(t_lower)
+        while idx >= 0:
+            if all(idx + len(t) <= s or idx >= e for s, e in spans):
+                spans.append((idx, idx + len(t)))
+            idx = lower_fragment.find(t_lower, idx + len(t))
+    for s, e in sorted(spans, reverse=True):
+        fragment = fragment[:s] + _SNIPPET_START + fragment[s:e] + _SNIPPET_END + fragment[e:]
+    return ("…" if start > 0 else "") + _render_snippet(fragment) + ("…" if end < len(content) else "")
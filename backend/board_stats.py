@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+掲示板統計ロールアップ（board_stats）の更新・再構築
+
+書き込み処理（投稿/返信/いいね/訪問）から呼び出して同一トランザクション内で差分更新する。
+単体で実行すると全掲示板の統計をゼロから再構築する（整合性の回復用）。
+
+使い方: python board_stats.py
+"""
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+import models
+
+# 統計を返す掲示板ID
+BOARD_IDS = [1, 2, 3, 4, 5, 6]
+
+def ensure_stats_row(db: Session, board_id) -> None:
+    """統計行がなければ作成（差分更新の前提）"""
+    board_id = str(board_id)
+    exists = db.query(models.BoardStats.board_id).filter(models.BoardStats.board_id == board_id).first()
+    if not exists:
+        db.add(models.BoardStats(board_id=board_id, post_count=0, reply_count=0, like_count=0, participant_count=0))
+        db.flush()
+
+def bump(db: Session, board_id, posts: int = 0, replies: int = 0, likes: int = 0, participants: int = 0) -> None:
+    """カウンタをDB側で加算する（コミットは呼び出し側のトランザクションに任せる）"""
+    values = {}
+    if posts:
+        values[models.BoardStats.post_count] = models.BoardStats.post_count + posts
+    if replies:
+        values[models.BoardStats.reply_count] = models.BoardStats.reply_count + replies
+    if likes:
+        values[models.BoardStats.like_count] = models.BoardStats.like_count + likes
+    if participants:
+        values[models.BoardStats.participant_count] = models.BoardStats.participant_count + participants
+    if not values:
+        return
+    ensure_stats_row(db, board_id)
+    db.query(models.BoardStats).filter(models.BoardStats.board_id == str(board_id)).update(values, synchronize_session=False)
+
+def record_post_created(db: Session, post: models.BoardPost) -> None:
+    """投稿作成時: 投稿数・最終活動時刻を更新（ハッシュタグは board_hashtags で管理）"""
+    bump(db, post.board_id, posts=1)
+    stats = db.query(models.BoardStats).filter(models.BoardStats.board_id == str(post.board_id)).first()
+    stats.last_activity = post.created_at or models.jst_now()
+
+def refresh_board_derived(db: Session, board_id) -> None:
+    """最終活動時刻を投稿テーブルから再計算（削除時）"""
+    board_id = str(board_id)
+    ensure_stats_row(db, board_id)
+    stats = db.query(models.BoardStats).filter(models.BoardStats.board_id == board_id).first()
+    stats.last_activity = db.query(func.max(models.BoardPost.created_at)).filter(
+        models.BoardPost.board_id == board_id
+    ).scalar()
+
+def rebuild_board_stats(db: Session) -> int:
+    """投稿/返信/訪問テーブルから board_stats を全件再構築する。再構築した掲示板数を返す"""
+    post_rows = db.query(
+        models.BoardPost.board_id,
+        func.count(models.BoardPost.id),
+        func.coalesce(func.sum(models.BoardPost.reply_count), 0),
+        func.coalesce(func.sum(models.BoardPost.like_count), 0),
+    ).group_by(models.BoardPost.board_id).all()
+    visit_rows = db.query(
+        models.BoardVisit.board_id,
+        func.count(models.BoardVisit.id),
+    ).group_by(models.BoardVisit.board_id).all()
+
+    board_ids = {str(b) for b in BOARD_IDS}
+    board_ids.update(str(r[0]) for r in post_rows)
+    board_ids.update(str(r[0]) for r in visit_rows)
+    posts_by_board = {str(b): (c, r, l) for b, c, r, l in post_rows}
+    visits_by_board = {str(b): c for b, c in visit_rows}
+
+    db.query(models.BoardStats).delete(synchronize_session=False)
+    for board_id in sorted(board_ids):
+        post_count, reply_count, like_count = posts_by_board.get(board_id, (0, 0, 0))
+        db.add(models.BoardStats(
+            board_id=board_id,
+            post_count=int(post_count or 0),
+            reply_count=int(reply_count or 0),
+            like_count=int(like_count or 0),
+            participant_count=int(visits_by_board.get(board_id, 0) or 0),
+        ))
+    db.flush()
+    for board_id in board_ids:
+        refresh_board_derived(db, board_id)
+    return len(board_ids)
+
+def ensure_board_stats(db: Session) -> None:
+    """起動時の初期化: board_stats が空なら再構築し、既定の掲示板の行を用意しておく"""
+    has_stats = db.query(models.BoardStats.board_id).first() is not None
+    if not has_stats:
+        count = rebuild_board_stats(db)
+        print(f"✅ board_statsを初期構築しました（{count}掲示板）")
+    for board_id in BOARD_IDS:
+        ensure_stats_row(db, board_id)
+    db.commit()
+
+if __name__ == "__main__":
+    import database
+    models.Base.metadata.create_all(bind=database.engine)
+    session = database.SessionLocal()
+    try:
+        print("board_stats再構築開始...")
+        count = rebuild_board_stats(session)
+        session.commit()
+        print(f"✅ board_statsを再構築しました（{count}掲示板）")
+    finally:
+        session.close()
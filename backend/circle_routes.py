@@ -1,21 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
-from typing import List
+from typing import List, Optional
 import models, schemas, database
-from board_routes import get_current_user_id, get_user_by_id, get_or_create_anonymous_name, ensure_jst_aware, is_admin_user
+import ngram_index
+import http_cache
+import identity
+import notifications
+from board_routes import get_or_create_anonymous_name, ensure_jst_aware
 
 router = APIRouter(prefix="/circles", tags=["circles"])
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# 閲覧者の解決（identity.get_viewer）と同じセッションを共有する
+get_db = database.get_db
 
 @router.get("/summaries", response_model=List[schemas.CircleSummaryResponse])
-def list_summaries(category: str = "", q: str = "", limit: int = 50, request: Request = None, db: Session = Depends(get_db)):
+def list_summaries(category: str = "", q: str = "", limit: int = 50, request: Request = None, response: Response = None, viewer: Optional[identity.Viewer] = Depends(identity.get_viewer), db: Session = Depends(get_db)):
+    not_modified = http_cache.conditional(request, response, db, ("circles",))
+    if not_modified is not None:
+        return not_modified
     try:
         # データベース接続確認
         print(f"🔍 CircleSummary データベース接続確認: {db}")
@@ -38,6 +41,10 @@ def list_summaries(category: str = "", q: str = "", limit: int = 50, request: Re
         if category:
             query = query.filter(models.CircleSummary.category == category)
         if q:
+            # バイグラム索引で候補を絞ってから LIKE で確認する（1文字の検索は LIKE のみ）
+            candidates = ngram_index.candidate_filter(db, "circle_summary", q, models.CircleSummary.id)
+            if candidates is not None:
+                query = query.filter(candidates)
             like = f"%{q}%"
             query = query.filter((models.CircleSummary.title.like(like)) | (models.CircleSummary.circle_name.like(like)))
         
@@ -55,7 +62,7 @@ def list_summaries(category: str = "", q: str = "", limit: int = 50, request: Re
             for r in rows:
                 try:
                     # can_edit 判定
-                    current_user_id = get_current_user_id(request) if request else None
+                    current_user_id = viewer.id if viewer else None
                     can_edit = bool(current_user_id and r.author_id == current_user_id)
                     summary_response = schemas.CircleSummaryResponse(
                         id=r.id,
@@ -93,13 +100,7 @@ def list_summaries(category: str = "", q: str = "", limit: int = 50, request: Re
         raise HTTPException(status_code=500, detail=f"サークルまとめの取得に失敗しました: {str(e)}")
 
 @router.post("/summaries", response_model=schemas.CircleSummaryResponse)
-def create_summary(payload: schemas.CircleSummaryCreate, request: Request, db: Session = Depends(get_db)):
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    user = get_user_by_id(db, current_user_id)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
+def create_summary(payload: schemas.CircleSummaryCreate, request: Request, user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     anon = get_or_create_anonymous_name(user, db)
     row = models.CircleSummary(
         title=payload.title or (payload.circle_name or "サークルまとめ"),
@@ -115,6 +116,8 @@ def create_summary(payload: schemas.CircleSummaryCreate, request: Request, db: S
         author_name=anon,
     )
     db.add(row)
+    db.flush()
+    ngram_index.index_row(db, "circle_summary", row)
     db.commit()
     db.refresh(row)
     return schemas.CircleSummaryResponse(
@@ -136,11 +139,9 @@ def create_summary(payload: schemas.CircleSummaryCreate, request: Request, db: S
     )
 
 @router.put("/summaries/{summary_id}", response_model=schemas.CircleSummaryResponse)
-def update_circle_summary(summary_id: int, payload: schemas.CircleSummaryCreate, request: Request, db: Session = Depends(get_db)):
+def update_circle_summary(summary_id: int, payload: schemas.CircleSummaryCreate, request: Request, user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     """サークルまとめの編集（作者のみ）"""
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
+    current_user_id = user.id
     row = db.query(models.CircleSummary).filter(models.CircleSummary.id == summary_id).first()
     if not row:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="まとめが見つかりません")
@@ -157,6 +158,7 @@ def update_circle_summary(summary_id: int, payload: schemas.CircleSummaryCreate,
     row.tags = payload.tags if payload.tags is not None else row.tags
     row.content = payload.content or row.content
     row.updated_at = models.jst_now()
+    ngram_index.index_row(db, "circle_summary", row)
     db.commit()
     db.refresh(row)
     return schemas.CircleSummaryResponse(
@@ -191,13 +193,7 @@ def list_summary_comments(summary_id: int, db: Session = Depends(get_db)):
     ]
 
 @router.post("/summaries/{summary_id}/comments", response_model=schemas.CircleSummaryCommentResponse)
-def add_summary_comment(summary_id: int, payload: schemas.CircleSummaryCommentCreate, request: Request, db: Session = Depends(get_db)):
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    user = get_user_by_id(db, current_user_id)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
+def add_summary_comment(summary_id: int, payload: schemas.CircleSummaryCommentCreate, request: Request, user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     summary = db.query(models.CircleSummary).filter(models.CircleSummary.id == summary_id).first()
     if not summary:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="まとめが見つかりません")
@@ -208,7 +204,8 @@ def add_summary_comment(summary_id: int, payload: schemas.CircleSummaryCommentCr
     # 通知: まとめ作者へ（自分以外）
     try:
         if summary.author_id and summary.author_id != user.id:
-            notif = models.Notification(
+            notifications.enqueue(
+                db,
                 user_id=summary.author_id,
                 actor_id=user.id,
                 type="circle_commented",
@@ -217,7 +214,6 @@ def add_summary_comment(summary_id: int, payload: schemas.CircleSummaryCommentCr
                 title="サークルまとめにコメントがありました",
                 message=payload.content[:120],
             )
-            db.add(notif)
     except Exception:
         pass
     db.commit()
@@ -235,29 +231,18 @@ def add_summary_comment(summary_id: int, payload: schemas.CircleSummaryCommentCr
 # =====================
 
 @router.delete("/admin/summaries/{summary_id}")
-def admin_delete_summary(summary_id: int, request: Request, db: Session = Depends(get_db)):
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    user = get_user_by_id(db, current_user_id)
-    if not is_admin_user(user):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者のみが実行できます")
+def admin_delete_summary(summary_id: int, request: Request, admin: identity.Viewer = Depends(identity.require_admin_viewer), db: Session = Depends(get_db)):
     row = db.query(models.CircleSummary).filter(models.CircleSummary.id == summary_id).first()
     if not row:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="まとめが見つかりません")
     db.query(models.CircleSummaryComment).filter(models.CircleSummaryComment.summary_id == summary_id).delete(synchronize_session=False)
+    ngram_index.remove_document(db, "circle_summary", summary_id)
     db.delete(row)
     db.commit()
     return {"message": "deleted", "id": summary_id}
 
 @router.delete("/admin/comments/{comment_id}")
-def admin_delete_summary_comment(comment_id: int, request: Request, db: Session = Depends(get_db)):
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    user = get_user_by_id(db, current_user_id)
-    if not is_admin_user(user):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者のみが実行できます")
+def admin_delete_summary_comment(comment_id: int, request: Request, admin: identity.Viewer = Depends(identity.require_admin_viewer), db: Session = Depends(get_db)):
     c = db.query(models.CircleSummaryComment).filter(models.CircleSummaryComment.id == comment_id).first()
     if not c:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="コメントが見つかりません")
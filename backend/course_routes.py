@@ -1,18 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, or_
-from typing import List
+from typing import List, Optional
 import models, schemas, database
-from board_routes import get_current_user_id, get_user_by_id, get_or_create_anonymous_name, ensure_jst_aware, is_admin_user
+import ngram_index
+import like_service
+import http_cache
+import identity
+import notifications
+from board_routes import get_or_create_anonymous_name, ensure_jst_aware
 
 router = APIRouter(prefix="/courses", tags=["courses"])
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# 閲覧者の解決（identity.get_viewer）と同じセッションを共有する
+get_db = database.get_db
 
 def normalize_university(value: str | None) -> str | None:
     if not value:
@@ -27,6 +28,7 @@ def normalize_university(value: str | None) -> str | None:
 @router.get("/summaries", response_model=List[schemas.CourseSummaryResponse])
 def list_summaries(
     request: Request,
+    response: Response,
     university: str = "",
     department: str = "", 
     year_semester: str = "", 
@@ -35,8 +37,12 @@ def list_summaries(
     difficulty_level: str = "",
     q: str = "", 
     limit: int = 50, 
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
     db: Session = Depends(get_db)
 ):
+    not_modified = http_cache.conditional(request, response, db, ("courses",))
+    if not_modified is not None:
+        return not_modified
     try:
         # データベース接続確認
         print(f"🔍 データベース接続確認: {db}")
@@ -95,6 +101,10 @@ def list_summaries(
         if difficulty_level and hasattr(models.CourseSummary, 'difficulty_level'):
             query = query.filter(models.CourseSummary.difficulty_level == difficulty_level)
         if q:
+            # バイグラム索引で候補を絞ってから LIKE で確認する（1文字の検索は LIKE のみ）
+            candidates = ngram_index.candidate_filter(db, "course_summary", q, models.CourseSummary.id)
+            if candidates is not None:
+                query = query.filter(candidates)
             like = f"%{q}%"
             query = query.filter((models.CourseSummary.title.like(like)) | (models.CourseSummary.course_name.like(like)) | (models.CourseSummary.instructor.like(like)))
         
@@ -109,7 +119,7 @@ def list_summaries(
         # 現在のユーザーを取得（いいね状態の確認用）
         current_user_id = None
         try:
-            current_user_id = get_current_user_id(request) if request else None
+            current_user_id = viewer.id if viewer else None
             print(f"✅ ユーザーID取得成功: {current_user_id}")
         except Exception as e:
             print(f"⚠️ ユーザーID取得エラー: {e}")
@@ -172,13 +182,7 @@ def list_summaries(
         raise HTTPException(status_code=500, detail=f"授業まとめの取得に失敗しました: {str(e)}")
 
 @router.post("/summaries", response_model=schemas.CourseSummaryResponse)
-def create_summary(payload: schemas.CourseSummaryCreate, request: Request, db: Session = Depends(get_db)):
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    user = get_user_by_id(db, current_user_id)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
+def create_summary(payload: schemas.CourseSummaryCreate, request: Request, user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     anon = get_or_create_anonymous_name(user, db)
     uni_norm = normalize_university(getattr(payload, 'university', None))
     row = models.CourseSummary(
@@ -198,6 +202,8 @@ def create_summary(payload: schemas.CourseSummaryCreate, request: Request, db: S
         author_name=anon,
     )
     db.add(row)
+    db.flush()
+    ngram_index.index_row(db, "course_summary", row)
     db.commit()
     db.refresh(row)
     return schemas.CourseSummaryResponse(
@@ -223,11 +229,9 @@ def create_summary(payload: schemas.CourseSummaryCreate, request: Request, db: S
     )
 
 @router.put("/summaries/{summary_id}", response_model=schemas.CourseSummaryResponse)
-def update_summary(summary_id: int, payload: schemas.CourseSummaryCreate, request: Request, db: Session = Depends(get_db)):
+def update_summary(summary_id: int, payload: schemas.CourseSummaryCreate, request: Request, user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     """授業まとめの編集（作者のみ）"""
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
+    current_user_id = user.id
     row = db.query(models.CourseSummary).filter(models.CourseSummary.id == summary_id).first()
     if not row:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="まとめが見つかりません")
@@ -254,6 +258,7 @@ def update_summary(summary_id: int, payload: schemas.CourseSummaryCreate, reques
     if hasattr(row, 'difficulty_level'):
         row.difficulty_level = payload.difficulty_level if payload.difficulty_level is not None else row.difficulty_level
     row.updated_at = models.jst_now()
+    ngram_index.index_row(db, "course_summary", row)
     db.commit()
     db.refresh(row)
     return schemas.CourseSummaryResponse(
@@ -292,13 +297,7 @@ def list_summary_comments(summary_id: int, db: Session = Depends(get_db)):
     ]
 
 @router.post("/summaries/{summary_id}/comments", response_model=schemas.CourseSummaryCommentResponse)
-def add_summary_comment(summary_id: int, payload: schemas.CourseSummaryCommentCreate, request: Request, db: Session = Depends(get_db)):
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    user = get_user_by_id(db, current_user_id)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
+def add_summary_comment(summary_id: int, payload: schemas.CourseSummaryCommentCreate, request: Request, user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     summary = db.query(models.CourseSummary).filter(models.CourseSummary.id == summary_id).first()
     if not summary:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="まとめが見つかりません")
@@ -309,7 +308,8 @@ def add_summary_comment(summary_id: int, payload: schemas.CourseSummaryCommentCr
     # 通知: まとめ作者へ（自分以外）
     try:
         if summary.author_id and summary.author_id != user.id:
-            notif = models.Notification(
+            notifications.enqueue(
+                db,
                 user_id=summary.author_id,
                 actor_id=user.id,
                 type="course_commented",
@@ -318,7 +318,6 @@ def add_summary_comment(summary_id: int, payload: schemas.CourseSummaryCommentCr
                 title="授業まとめにコメントがありました",
                 message=payload.content[:120],
             )
-            db.add(notif)
     except Exception:
         pass
     db.commit()
@@ -336,29 +335,18 @@ def add_summary_comment(summary_id: int, payload: schemas.CourseSummaryCommentCr
 # =====================
 
 @router.delete("/admin/summaries/{summary_id}")
-def admin_delete_summary(summary_id: int, request: Request, db: Session = Depends(get_db)):
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    user = get_user_by_id(db, current_user_id)
-    if not is_admin_user(user):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者のみが実行できます")
+def admin_delete_summary(summary_id: int, request: Request, admin: identity.Viewer = Depends(identity.require_admin_viewer), db: Session = Depends(get_db)):
     row = db.query(models.CourseSummary).filter(models.CourseSummary.id == summary_id).first()
     if not row:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="まとめが見つかりません")
     db.query(models.CourseSummaryComment).filter(models.CourseSummaryComment.summary_id == summary_id).delete(synchronize_session=False)
+    ngram_index.remove_document(db, "course_summary", summary_id)
     db.delete(row)
     db.commit()
     return {"message": "deleted", "id": summary_id}
 
 @router.delete("/admin/comments/{comment_id}")
-def admin_delete_summary_comment(comment_id: int, request: Request, db: Session = Depends(get_db)):
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
-    user = get_user_by_id(db, current_user_id)
-    if not is_admin_user(user):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者のみが実行できます")
+def admin_delete_summary_comment(comment_id: int, request: Request, admin: identity.Viewer = Depends(identity.require_admin_viewer), db: Session = Depends(get_db)):
     c = db.query(models.CourseSummaryComment).filter(models.CourseSummaryComment.id == comment_id).first()
     if not c:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="コメントが見つかりません")
@@ -374,45 +362,28 @@ def admin_delete_summary_comment(comment_id: int, request: Request, db: Session
 # =====================
 
 @router.post("/summaries/{summary_id}/like")
-def toggle_summary_like(summary_id: int, request: Request, db: Session = Depends(get_db)):
+def toggle_summary_like(summary_id: int, request: Request, user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     """授業まとめのいいねをトグル"""
-    current_user_id = get_current_user_id(request)
-    if not current_user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
+    current_user_id = user.id
     
     # まとめの存在確認
     summary = db.query(models.CourseSummary).filter(models.CourseSummary.id == summary_id).first()
     if not summary:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="まとめが見つかりません")
     
-    # 既存のいいねを確認
-    existing_like = db.query(models.CourseSummaryLike).filter(
-        models.CourseSummaryLike.summary_id == summary_id,
-        models.CourseSummaryLike.user_id == current_user_id
-    ).first()
-    
-    if existing_like:
-        # いいねを削除
-        db.delete(existing_like)
-        summary.like_count = max(0, summary.like_count - 1)
-        is_liked = False
-    else:
-        # いいねを追加
-        new_like = models.CourseSummaryLike(
-            summary_id=summary_id,
-            user_id=current_user_id
-        )
-        db.add(new_like)
-        summary.like_count += 1
-        is_liked = True
+    # いいねの追加/削除と like_count の加減算をDB側で行う
+    result = like_service.toggle_like(
+        db, models.CourseSummaryLike, "summary_id", summary_id, current_user_id,
+        target_model=models.CourseSummary, target=summary,
+    )
     
     db.commit()
     
     return {
         "message": "いいねを更新しました",
         "summary_id": summary_id,
-        "like_count": summary.like_count,
-        "is_liked": is_liked
+        "like_count": result["like_count"],
+        "is_liked": result["is_liked"]
     }
 
 
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.exc import SQLAlchemyError
 import models
@@ -26,6 +26,21 @@ def get_db() -> Session:
     finally:
         db.close()
 
+def dialect_insert(db: Session):
+    """ON CONFLICT（upsert）を使える insert を返す（PostgreSQL / SQLite 以外は None。呼び出し側で別の方法にする）"""
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+def dialect_greatest(db: Session):
+    """引数の最大値を返すSQL関数（PostgreSQL は greatest、SQLite は複数引数の max）"""
+    return func.greatest if db.get_bind().dialect.name == "postgresql" else func.max
+
 def get_user_by_email(db: Session, email: str):
     """メールアドレスでユーザーを取得"""
     return db.query(models.User).filter(models.User.email == email).first()
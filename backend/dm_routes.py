@@ -1,36 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 from typing import List, Optional
 import models, schemas, database
+import identity
+import notifications
 
 router = APIRouter(prefix="/dm", tags=["dm"])
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def resolve_current_user(request: Request, db: Session) -> models.User:
-    user = None
-    user_id = request.headers.get("X-User-Id")
-    if user_id:
-        try:
-            uid = int(user_id)
-            user = db.query(models.User).filter(models.User.id == uid).first()
-        except Exception:
-            user = None
-    if not user:
-        dev_email = request.headers.get("X-Dev-Email")
-        if dev_email and dev_email.startswith("dev:"):
-            dev_email = dev_email[4:]
-        if dev_email:
-            user = database.get_user_by_email(db, (dev_email or "").strip().lower())
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーが見つかりません")
-    return user
+# 閲覧者の解決（identity.require_viewer）と同じセッションを共有する
+get_db = database.get_db
 
 def get_or_create_conversation(db: Session, a: int, b: int) -> models.DMConversation:
     u1, u2 = (a, b) if a < b else (b, a)
@@ -53,8 +32,7 @@ def is_blocked(db: Session, blocker_id: int, blocked_id: int) -> bool:
     ).first() is not None
 
 @router.get("/conversations", response_model=List[schemas.DMConversationResponse])
-def list_conversations(request: Request, db: Session = Depends(get_db)):
-    me = resolve_current_user(request, db)
+def list_conversations(request: Request, me: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     convs = db.query(models.DMConversation).filter(
         (models.DMConversation.user1_id == me.id) | (models.DMConversation.user2_id == me.id)
     ).order_by(desc(models.DMConversation.updated_at)).limit(100).all()
@@ -76,8 +54,7 @@ def list_conversations(request: Request, db: Session = Depends(get_db)):
     return responses
 
 @router.get("/conversations/{conversation_id}/messages", response_model=List[schemas.DMMessageResponse])
-def list_messages(conversation_id: int, request: Request, db: Session = Depends(get_db), limit: int = 50):
-    me = resolve_current_user(request, db)
+def list_messages(conversation_id: int, request: Request, me: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db), limit: int = 50):
     conv = db.query(models.DMConversation).filter(models.DMConversation.id == conversation_id).first()
     if not conv:
         raise HTTPException(status_code=404, detail="会話が見つかりません")
@@ -101,8 +78,7 @@ def list_messages(conversation_id: int, request: Request, db: Session = Depends(
     return res
 
 @router.post("/conversations", response_model=schemas.DMConversationResponse)
-def create_conversation(payload: schemas.DMConversationCreate, request: Request, db: Session = Depends(get_db)):
-    me = resolve_current_user(request, db)
+def create_conversation(payload: schemas.DMConversationCreate, request: Request, me: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     target_user: Optional[models.User] = None
     if payload.partner_user_id:
         target_user = db.query(models.User).filter(models.User.id == payload.partner_user_id).first()
@@ -132,8 +108,7 @@ def create_conversation(payload: schemas.DMConversationCreate, request: Request,
     )
 
 @router.post("/messages", response_model=schemas.DMMessageResponse)
-def send_message(payload: schemas.DMMessageCreate, request: Request, db: Session = Depends(get_db)):
-    me = resolve_current_user(request, db)
+def send_message(payload: schemas.DMMessageCreate, request: Request, me: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     conv = db.query(models.DMConversation).filter(models.DMConversation.id == payload.conversation_id).first()
     if not conv:
         raise HTTPException(status_code=404, detail="会話が見つかりません")
@@ -160,7 +135,8 @@ def send_message(payload: schemas.DMMessageCreate, request: Request, db: Session
     else:
         conv.u1_unread = (conv.u1_unread or 0) + 1
 
-    notif = models.Notification(
+    notifications.enqueue(
+        db,
         user_id=partner_id,
         actor_id=me.id,
         type="dm_message",
@@ -169,7 +145,6 @@ def send_message(payload: schemas.DMMessageCreate, request: Request, db: Session
         title="新しいDM",
         message=content[:120],
     )
-    db.add(notif)
 
     db.commit()
     db.refresh(msg)
@@ -184,8 +159,7 @@ def send_message(payload: schemas.DMMessageCreate, request: Request, db: Session
     )
 
 @router.post("/conversations/{conversation_id}/read")
-def mark_read(conversation_id: int, request: Request, db: Session = Depends(get_db)):
-    me = resolve_current_user(request, db)
+def mark_read(conversation_id: int, request: Request, me: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     conv = db.query(models.DMConversation).filter(models.DMConversation.id == conversation_id).first()
     if not conv:
         raise HTTPException(status_code=404, detail="会話が見つかりません")
@@ -199,8 +173,7 @@ def mark_read(conversation_id: int, request: Request, db: Session = Depends(get_
     return {"message": "ok"}
 
 @router.post("/block")
-def block_user(payload: dict, request: Request, db: Session = Depends(get_db)):
-    me = resolve_current_user(request, db)
+def block_user(payload: dict, request: Request, me: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(get_db)):
     user_id = int(payload.get("user_id")) if payload and payload.get("user_id") is not None else None
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id is required")
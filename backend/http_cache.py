@@ -0,0 +1,215 @@
+"""
+公開一覧系APIの条件付きGET（ETag / If-None-Match → 304）と Cache-Control
+
+- リソース（board / market / courses / circles）ごとのバージョン番号を resource_versions に持つ
+- セッションのイベントで対象テーブルへの書き込みを検知し、コミットの後に別の短いトランザクションで加算する
+  （ORMの追加/変更/削除、db.query().update()/delete()、Core の insert/update/delete のいずれも対象）
+  書き込みのトランザクションでリソースごとの共有行をロックしないため、投稿・いいね同士が直列にならない。
+  コミットから加算までの短い間は古い ETag のまま（次の加算で一致しなくなる）
+- ETag = パス・クエリ・閲覧者ヘッダ・バージョン番号のハッシュ。一致すれば本体のクエリを実行せずに 304 を返す
+
+bulk_update_mappings など Session.execute を通らない一括更新は mark() で明示的に加算対象にする。
+一覧の内容が変わらない書き込み（閲覧数の一括反映など）は execution_options(SKIP_OPTION=True) で対象外にする。
+users は一覧に出るプロフィール列（USER_PROFILE_COLUMNS）の変更と削除だけを対象にする。
+"""
+
+import hashlib
+from fastapi import Request, Response
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session
+import models
+
+# テーブル → 影響するリソース
+RESOURCE_TABLES = {
+    "board": {
+        "board_posts", "board_replies", "board_post_likes", "board_reply_likes", "board_stats",
+        "board_ranking_params", "hashtags", "post_hashtags", "hashtag_buckets",
+    },
+    "market": {"market_items", "market_item_likes", "market_item_comments"},
+    "courses": {"course_summaries", "course_summary_likes", "course_summary_comments"},
+    "circles": {"circle_summaries", "circle_summary_comments"},
+}
+RESOURCES = tuple(RESOURCE_TABLES)
+
+# 一覧の投稿者欄に出る users の列（profile_cache.Profile）。これ以外の列の更新（ログイン情報など）では加算しない
+USER_PROFILE_COLUMNS = ("anonymous_name", "university", "year", "department")
+
+# このオプションを付けた insert/update/delete はバージョンを加算しない
+SKIP_OPTION = "http_cache_skip"
+
+_TABLE_RESOURCES: dict[str, set[str]] = {}
+for _resource, _tables in RESOURCE_TABLES.items():
+    for _table in _tables:
+        _TABLE_RESOURCES.setdefault(_table, set()).add(_resource)
+
+# Cache-Control（閲覧者によらない集計は短時間共有キャッシュ可、閲覧者ごとの一覧は毎回再検証）
+PUBLIC_SHORT = "public, max-age=10, stale-while-revalidate=30"
+PUBLIC_STATS = "public, max-age=30, stale-while-revalidate=60"
+PRIVATE_REVALIDATE = "private, no-cache"
+
+# 閲覧者ごとに結果が変わる（is_liked / can_edit）ため ETag に含めるヘッダ
+VIEWER_HEADERS = ("Authorization", "X-User-Id", "X-Dev-Email")
+
+_INFO_KEY = "http_cache_dirty"
+_COMMITTED_KEY = "http_cache_committed"
+_BUMP_KEY = "http_cache_bump"
+
+# -----------------------------
+# 書き込みの検知とバージョン加算
+# -----------------------------
+
+def _dirty(session: Session) -> set:
+    return session.info.setdefault(_INFO_KEY, set())
+
+def _mark_table(session: Session, table_name: str | None) -> None:
+    resources = _TABLE_RESOURCES.get(table_name or "")
+    if resources:
+        _dirty(session).update(resources)
+
+def _profile_changed(obj) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[c].history.has_changes() for c in USER_PROFILE_COLUMNS if c in attrs)
+
+def _mark_instances(session: Session, instances, kind: str) -> None:
+    """kind: 'new' | 'dirty' | 'deleted'"""
+    for obj in instances:
+        table = getattr(obj, "__table__", None)
+        if table is None:
+            continue
+        if table.name == models.User.__tablename__:
+            # 新規ユーザーは投稿するまで一覧に出ない
+            if kind == "deleted" or (kind == "dirty" and _profile_changed(obj)):
+                _dirty(session).update(RESOURCES)
+            continue
+        _mark_table(session, table.name)
+
+def _mark_pending(session: Session) -> None:
+    _mark_instances(session, session.new, "new")
+    _mark_instances(session, session.dirty, "dirty")
+    _mark_instances(session, session.deleted, "deleted")
+
+def mark(session: Session, *resources) -> None:
+    """ORMイベントを通らない一括更新の後に呼ぶ（コミット時に加算される）"""
+    _dirty(session).update(resources)
+
+def _after_flush(session, flush_context):
+    _mark_pending(session)
+
+def _do_orm_execute(state):
+    if state.execution_options.get(SKIP_OPTION):
+        return
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        _mark_table(state.session, getattr(table, "name", None))
+
+def bump(bind, resources) -> None:
+    """リソースのバージョンを独立した短いトランザクションで加算する（失敗してもコミット済みの書き込みには影響しない）"""
+    try:
+        with bind.begin() as conn:
+            conn.execute(
+                update(models.ResourceVersion.__table__)
+                .where(models.ResourceVersion.resource.in_(sorted(resources)))
+                .values(version=models.ResourceVersion.version + 1, updated_at=models.jst_now())
+            )
+    except Exception as e:
+        print(f"⚠️ リソースバージョンの加算に失敗: {e}")
+
+def _before_commit(session):
+    # 未フラッシュの変更もこのコミットで書き込まれる
+    _mark_pending(session)
+    resources = session.info.pop(_INFO_KEY, None)
+    if resources:
+        session.info.setdefault(_COMMITTED_KEY, set()).update(resources)
+
+def _after_commit(session):
+    # セーブポイントの解放でも呼ばれるため、外側のトランザクションのコミットだけを扱う
+    if session.in_nested_transaction():
+        return
+    resources = session.info.pop(_COMMITTED_KEY, None)
+    if resources:
+        session.info[_BUMP_KEY] = resources
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_INFO_KEY, None)
+        session.info.pop(_COMMITTED_KEY, None)
+        # after_commit の時点ではまだセッションの接続を返していないため、接続を返した後で加算する
+        # （同時に2本の接続を使うとプールが尽きたときに待ち合わせになる）
+        resources = session.info.pop(_BUMP_KEY, None)
+        if resources:
+            bump(session.get_bind(), resources)
+
+def install(session_factory) -> None:
+    """sessionmaker にイベントを登録する"""
+    event.listen(session_factory, "after_flush", _after_flush)
+    event.listen(session_factory, "do_orm_execute", _do_orm_execute)
+    event.listen(session_factory, "before_commit", _before_commit)
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_transaction_end", _after_transaction_end)
+
+def ensure_versions(db: Session) -> None:
+    """各リソースのバージョン行を用意する（起動時）"""
+    existing = {r for (r,) in db.query(models.ResourceVersion.resource).all()}
+    for resource in RESOURCES:
+        if resource not in existing:
+            db.add(models.ResourceVersion(resource=resource, version=0))
+    db.commit()
+
+# -----------------------------
+# 条件付きGET
+# -----------------------------
+
+def _etag(request: Request, versions: dict, per_viewer: bool) -> str:
+    parts = [request.url.path, str(request.url.query)]
+    if per_viewer:
+        parts.extend(request.headers.get(h, "") for h in VIEWER_HEADERS)
+    parts.extend(f"{r}={versions[r]}" for r in sorted(versions))
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # 弱い比較（W/ の有無は無視）
+    tag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == tag:
+            return True
+    return False
+
+def conditional(
+    request: Request,
+    response: Response,
+    db: Session,
+    resources,
+    cache_control: str = PRIVATE_REVALIDATE,
+    per_viewer: bool = True,
+):
+    """ETag と Cache-Control を設定し、If-None-Match が一致すれば 304 の Response を返す（それ以外は None）
+
+    使い方:
+        not_modified = http_cache.conditional(request, response, db, ("board",))
+        if not_modified is not None:
+            return not_modified
+    """
+    rows = db.query(models.ResourceVersion.resource, models.ResourceVersion.version).filter(
+        models.ResourceVersion.resource.in_(list(resources))
+    ).all()
+    versions = {resource: int(version or 0) for resource, version in rows}
+    if len(versions) < len(set(resources)):
+        # バージョン行がない（初期化前）場合はキャッシュさせない
+        response.headers["Cache-Control"] = "no-store"
+        return None
+
+    headers = {"ETag": _etag(request, versions, per_viewer), "Cache-Control": cache_control}
+    if per_viewer:
+        headers["Vary"] = ", ".join(VIEWER_HEADERS)
+    if _matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
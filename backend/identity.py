@@ -0,0 +1,182 @@
+"""
+リクエストの閲覧者（ログインユーザー）の解決
+
+Authorization: Bearer（JWT） → X-User-Id → X-Dev-Email の順にユーザーを特定する。
+- 結果は request.state.viewer に保存し、同じリクエスト内では再解決しない
+- ユーザーの基本情報（Viewer）はプロセス内のTTLキャッシュに保持し、リクエストごとの users 問い合わせを省く
+- プロフィール変更・匿名名の付与・アカウント削除時は invalidate() を呼ぶ（他ワーカーの分は TTL で期限切れ）
+
+ルーターでは Depends(get_viewer)（未ログインは None）または Depends(require_viewer)（未ログインは 401）を使う。
+ORMのユーザー行が必要な更新処理だけ load_user() で読み込む。
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Optional
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy.orm import Session
+import models, database
+from ttl_cache import TTLCache
+
+# 管理者判定（master/mster 00,01-09,1-30 @ *.ac.jp）
+ADMIN_EMAIL_PATTERN = re.compile(r"^(master|mster)(00|0?[1-9]|[1-2][0-9]|30)@(?:[\w.-]+\.)?ac\.jp$", re.IGNORECASE)
+
+MAX_ENTRIES = 10000
+TTL_SECONDS = 60
+
+def is_admin_email(email: Optional[str]) -> bool:
+    if not email:
+        return False
+    return ADMIN_EMAIL_PATTERN.match(email.strip()) is not None
+
+@dataclass(frozen=True)
+class Viewer:
+    """キャッシュするユーザーの基本情報（ORMから切り離したスナップショット）"""
+    id: int
+    email: Optional[str]
+    anonymous_name: Optional[str]
+    university: Optional[str]
+    year: Optional[str]
+    department: Optional[str]
+
+    @property
+    def is_admin(self) -> bool:
+        return is_admin_email(self.email)
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Viewer":
+        return cls(
+            id=user.id,
+            email=user.email,
+            anonymous_name=user.anonymous_name,
+            university=user.university,
+            year=user.year,
+            department=user.department,
+        )
+
+# -----------------------------
+# TTLキャッシュ
+# -----------------------------
+
+_id_by_email: dict[str, int] = {}
+
+def _forget_email(user_id: int, viewer: Viewer) -> None:
+    if viewer.email:
+        _id_by_email.pop(viewer.email.lower(), None)
+
+_by_id = TTLCache(MAX_ENTRIES, TTL_SECONDS, on_evict=_forget_email)  # user_id -> Viewer
+
+def remember(user: models.User) -> Viewer:
+    viewer = Viewer.from_user(user)
+    _by_id.put(viewer.id, viewer)
+    if viewer.email:
+        _id_by_email[viewer.email.lower()] = viewer.id
+    return viewer
+
+def invalidate(user_id: Optional[int]) -> None:
+    if user_id is None:
+        return
+    _by_id.pop(int(user_id))
+
+def clear() -> None:
+    _by_id.clear()
+    _id_by_email.clear()
+
+def viewer_by_id(db: Session, user_id: int) -> Optional[Viewer]:
+    viewer = _by_id.get(user_id)
+    if viewer is not None:
+        return viewer
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    return remember(user) if user else None
+
+def viewer_by_email(db: Session, email: str) -> Optional[Viewer]:
+    email = email.strip().lower()
+    user_id = _id_by_email.get(email)
+    if user_id is not None:
+        viewer = _by_id.get(user_id)
+        if viewer is not None and viewer.email and viewer.email.lower() == email:
+            return viewer
+    user = database.get_user_by_email(db, email)
+    return remember(user) if user else None
+
+# -----------------------------
+# ヘッダからの解決
+# -----------------------------
+
+def _bearer_email(request: Request) -> Optional[str]:
+    auth_header = request.headers.get("Authorization")
+    if not (auth_header and auth_header.startswith("Bearer ")):
+        return None
+    try:
+        from auth import verify_token
+        return verify_token(auth_header.split(" ", 1)[1])
+    except Exception:
+        return None  # トークン検証失敗時は他のヘッダで判定
+
+def header_user_id(request: Request) -> Optional[int]:
+    raw = request.headers.get("X-User-Id")
+    if raw:
+        try:
+            return int(raw)
+        except ValueError:
+            return None
+    return None
+
+def header_dev_email(request: Request) -> Optional[str]:
+    """X-Dev-Email（旧方式。"dev:" 接頭辞付きも可）"""
+    dev_email = (request.headers.get("X-Dev-Email") or "").strip()
+    if dev_email.startswith("dev:"):
+        dev_email = dev_email[4:]
+    return dev_email.strip().lower() or None
+
+def has_credentials(request: Request) -> bool:
+    return bool(request.headers.get("Authorization") or request.headers.get("X-User-Id") or request.headers.get("X-Dev-Email"))
+
+def resolve_viewer(request: Request, db: Session) -> Optional[Viewer]:
+    """閲覧者を解決する（リクエスト内で1回だけ。見つからなければ None）"""
+    if hasattr(request.state, "viewer"):
+        return request.state.viewer
+    viewer = None
+    email = _bearer_email(request)
+    if email:
+        viewer = viewer_by_email(db, email)
+    if viewer is None:
+        user_id = header_user_id(request)
+        if user_id:
+            viewer = viewer_by_id(db, user_id)
+    if viewer is None:
+        dev_email = header_dev_email(request)
+        if dev_email:
+            viewer = viewer_by_email(db, dev_email)
+    request.state.viewer = viewer
+    return viewer
+
+# -----------------------------
+# FastAPI 依存関数
+# -----------------------------
+
+def get_viewer(request: Request, db: Session = Depends(database.get_db)) -> Optional[Viewer]:
+    """閲覧者（未ログインなら None）"""
+    return resolve_viewer(request, db)
+
+def require_viewer(request: Request, viewer: Optional[Viewer] = Depends(get_viewer)) -> Viewer:
+    """ログイン必須の閲覧者"""
+    if viewer is None:
+        if has_credentials(request):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ユーザーIDが見つかりません")
+    return viewer
+
+def require_admin_viewer(viewer: Viewer = Depends(require_viewer)) -> Viewer:
+    """管理者のみ許可（非管理者は403）"""
+    if not viewer.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者のみが実行できます")
+    return viewer
+
+def load_user(db: Session, viewer: Viewer) -> models.User:
+    """更新処理などでORMのユーザー行が必要な場合に読み込む（削除済みなら404）"""
+    user = db.get(models.User, viewer.id)
+    if user is None:
+        invalidate(viewer.id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
+    return user
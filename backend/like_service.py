@@ -0,0 +1,117 @@
+"""
+いいねの切り替えとカウンタ更新の共通処理（投稿/返信/商品/商品コメント/授業まとめ）
+
+- いいね行の追加は INSERT ... ON CONFLICT DO NOTHING（一意制約で重複を吸収）
+- 追加できなかった場合（既にいいね済み）は DELETE し、削除できた行数で状態を確定する
+- 一覧の is_liked は liked_ids で、件数カラムのない対象の件数は count_likes で、ページ分を1クエリずつ求める
+- like_count は UPDATE ... SET like_count = like_count ± 1 RETURNING like_count でDB側で加減算し、
+  新しい値を追加の SELECT なしで返す（bump_counter は他の件数カラムにも使える）
+いずれも呼び出し側のトランザクション内で行い、コミットは呼び出し側に任せる。
+"""
+
+from sqlalchemy import case, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+import database
+
+def _insert_like(db: Session, like_model, target_column: str, target_id: int, user_id: int) -> bool:
+    """いいね行を追加。既に存在した場合は False"""
+    insert = database.dialect_insert(db)
+    table = like_model.__table__
+    values = {target_column: target_id, "user_id": user_id}
+    if insert is not None:
+        stmt = insert(table).values(**values).on_conflict_do_nothing(
+            index_elements=[table.c[target_column], table.c.user_id]
+        ).returning(table.c.id)
+        return db.execute(stmt).first() is not None
+    # その他のDB: セーブポイント内で追加し、一意制約違反なら既存とみなす
+    try:
+        with db.begin_nested():
+            db.add(like_model(**values))
+        return True
+    except IntegrityError:
+        return False
+
+def _delete_like(db: Session, like_model, target_column: str, target_id: int, user_id: int) -> bool:
+    deleted = db.query(like_model).filter(
+        getattr(like_model, target_column) == target_id,
+        like_model.user_id == user_id,
+    ).delete(synchronize_session=False)
+    return deleted > 0
+
+def bump_counter(db: Session, target_model, target_id: int, column_name: str, delta: int, target=None) -> int:
+    """件数カラム（like_count / comment_count など）をDB側で加減算（0未満にはしない）して新しい値を返す
+
+    target（読み込み済みのインスタンス）を渡すと、変更扱いにせずに値だけ同期する。
+    """
+    column = getattr(target_model, column_name)
+    current = func.coalesce(column, 0)
+    if delta >= 0:
+        new_value = current + delta
+    else:
+        new_value = case((current + delta < 0, 0), else_=current + delta)
+    stmt = update(target_model).where(target_model.id == target_id).values({column_name: new_value})
+    if database.dialect_insert(db) is not None:
+        row = db.execute(stmt.returning(column)).first()
+        count = int(row[0] or 0) if row else 0
+    else:
+        db.execute(stmt)
+        count = int(db.query(column).filter(target_model.id == target_id).scalar() or 0)
+    if target is not None:
+        set_committed_value(target, column_name, count)
+    return count
+
+def bump_like_count(db: Session, target_model, target_id: int, delta: int, target=None) -> int:
+    """like_count をDB側で加減算（0未満にはしない）して新しい値を返す"""
+    return bump_counter(db, target_model, target_id, "like_count", delta, target=target)
+
+def toggle_like(
+    db: Session,
+    like_model,
+    target_column: str,
+    target_id: int,
+    user_id: int,
+    target_model=None,
+    target=None,
+) -> dict:
+    """いいねを切り替える
+
+    戻り値: {"is_liked": 切り替え後の状態, "like_count": 新しい件数（target_model なしは None）, "delta": +1 / -1}
+    """
+    # 並行した切り替えで追加/削除がどちらも空振りした場合に備えて1回だけやり直す
+    for _attempt in range(2):
+        if _insert_like(db, like_model, target_column, target_id, user_id):
+            delta = 1
+            break
+        if _delete_like(db, like_model, target_column, target_id, user_id):
+            delta = -1
+            break
+    else:
+        delta = 0
+
+    like_count = None
+    if target_model is not None:
+        if delta:
+            like_count = bump_like_count(db, target_model, target_id, delta, target=target)
+        else:
+            like_count = int(db.query(target_model.like_count).filter(target_model.id == target_id).scalar() or 0)
+    return {"is_liked": delta > 0, "like_count": like_count, "delta": delta}
+
+def liked_ids(db: Session, like_model, target_column: str, target_ids, user_id: int | None) -> set[int]:
+    """閲覧者がいいね済みの対象IDを1クエリで取得（未ログインは空）"""
+    ids = list({int(i) for i in target_ids})
+    if not ids or not user_id:
+        return set()
+    column = getattr(like_model, target_column)
+    rows = db.query(column).filter(like_model.user_id == user_id, column.in_(ids)).all()
+    return {target_id for (target_id,) in rows}
+
+def count_likes(db: Session, like_model, target_column: str, target_ids) -> dict[int, int]:
+    """対象ごとのいいね数を1回の GROUP BY で取得（いいねのない対象は含まない）"""
+    ids = list({int(i) for i in target_ids})
+    if not ids:
+        return {}
+    column = getattr(like_model, target_column)
+    rows = db.query(column, func.count(like_model.id)).filter(column.in_(ids)).group_by(column).all()
+    return {target_id: int(count) for target_id, count in rows}
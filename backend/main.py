@@ -1,5 +1,6 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, HTTPException, Depends, status, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 import models, schemas, database, utils, univ_domains
 import market_routes
@@ -7,13 +8,37 @@ import dm_routes
 import course_routes
 import circle_routes
 import board_routes
+import board_stats
+import board_search
+import board_hashtags
+import board_ranking
+import read_markers
+import market_views
+import ngram_index
+import name_resolver
+import http_cache
+import identity
+import profile_cache
+import blob_store
+import market_stats
+import notifications
+import blob_routes
+import board_events
 import analytics_routes
 import os
-import re
+import asyncio
 from typing import Optional
 
 app = FastAPI()
 
+# 公開一覧系APIのETag用バージョン番号を、書き込みのコミット時に加算する
+http_cache.install(database.SessionLocal)
+# 通知はコミットされた分だけアウトボックスへ送る
+notifications.install(database.SessionLocal)
+
+# 起動時に開始したバックグラウンドタスク（終了時にキャンセル）
+background_tasks: list[asyncio.Task] = []
+
 async def run_migrations():
     """データベースマイグレーションを実行（各DDLを個別トランザクションで実行）"""
     try:
@@ -99,6 +124,18 @@ async def run_migrations():
         # index for university
         exec_tx("CREATE INDEX IF NOT EXISTS idx_course_summaries_university ON course_summaries(university)", "✅ idx_course_summaries_universityインデックスを追加しました", warn_phrases=("already exists",))
 
+        # board_posts: ユーザー別タイムライン（キーセットページング）用
+        exec_tx("CREATE INDEX IF NOT EXISTS idx_board_posts_author_created ON board_posts(author_id, created_at)", "✅ idx_board_posts_author_createdインデックスを追加しました", warn_phrases=("already exists",))
+
+        # board_posts: 全体フィードの時間減衰スコア（値は起動後の board_ranking スイープで補完）
+        for col in ("popular_score", "trending_score"):
+            if not column_exists('board_posts', col):
+                if dialect == 'postgresql':
+                    exec_tx(f"ALTER TABLE board_posts ADD COLUMN IF NOT EXISTS {col} DOUBLE PRECISION", f"✅ board_posts.{col} を追加しました")
+                else:
+                    exec_tx(f"ALTER TABLE board_posts ADD COLUMN {col} REAL", f"✅ board_posts.{col} を追加しました")
+            exec_tx(f"CREATE INDEX IF NOT EXISTS idx_board_posts_{col} ON board_posts({col})", f"✅ idx_board_posts_{col}インデックスを追加しました", warn_phrases=("already exists",))
+
         # indexes
         exec_tx("CREATE INDEX IF NOT EXISTS idx_course_summaries_grade_level ON course_summaries(grade_level)", "✅ idx_course_summaries_grade_levelインデックスを追加しました", warn_phrases=("already exists",))
         exec_tx("CREATE INDEX IF NOT EXISTS idx_course_summaries_grade_score ON course_summaries(grade_score)", "✅ idx_course_summaries_grade_scoreインデックスを追加しました", warn_phrases=("already exists",))
@@ -208,6 +245,29 @@ async def run_migrations():
             )
         exec_tx(circle_comments_sql, "✅ CircleSummaryCommentテーブルを作成（または既存）")
 
+        # market_items.comment_count（一覧で商品ごとにコメントを数えないための件数カラム）
+        if not column_exists('market_items', 'comment_count'):
+            if dialect == 'postgresql':
+                exec_tx("ALTER TABLE market_items ADD COLUMN IF NOT EXISTS comment_count INTEGER DEFAULT 0", "✅ market_items.comment_count を追加しました")
+            else:
+                exec_tx("ALTER TABLE market_items ADD COLUMN comment_count INTEGER DEFAULT 0", "✅ market_items.comment_count を追加しました")
+            exec_tx(
+                "UPDATE market_items SET comment_count = (SELECT COUNT(*) FROM market_item_comments c WHERE c.item_id = market_items.id)",
+                "✅ market_items.comment_count をバックフィルしました",
+            )
+
+        # market_items.university（出品者の大学の複製。大学での絞り込みを users を参照せずに行う）
+        if not column_exists('market_items', 'university'):
+            if dialect == 'postgresql':
+                exec_tx("ALTER TABLE market_items ADD COLUMN IF NOT EXISTS university VARCHAR(100)", "✅ market_items.university を追加しました")
+            else:
+                exec_tx("ALTER TABLE market_items ADD COLUMN university VARCHAR(100)", "✅ market_items.university を追加しました")
+            exec_tx(
+                "UPDATE market_items SET university = (SELECT u.university FROM users u WHERE u.id = market_items.author_id)",
+                "✅ market_items.university をバックフィルしました",
+            )
+        exec_tx("CREATE INDEX IF NOT EXISTS idx_market_items_university_available_created ON market_items(university, is_available, created_at)", "✅ idx_market_items_university_available_createdインデックスを追加しました", warn_phrases=("already exists",))
+
         # users テーブルの拡張カラム（profile_image, bio）を追加
         try:
             need_cols = [("profile_image", "TEXT"), ("bio", "VARCHAR(200)")]
@@ -235,6 +295,80 @@ async def startup_event():
         
         # マイグレーション実行
         await run_migrations()
+
+        # ETag用のバージョン行
+        versions_db = database.SessionLocal()
+        try:
+            http_cache.ensure_versions(versions_db)
+        except Exception as e:
+            print(f"⚠️ resource_versionsの初期化に失敗: {e}")
+        finally:
+            versions_db.close()
+
+        # 掲示板の全文検索インデックス（SQLite: FTS5 / PostgreSQL: GIN）
+        board_search.setup_search_index(database.engine)
+
+        # 掲示板統計ロールアップの初期構築（空の場合のみ）
+        stats_db = database.SessionLocal()
+        try:
+            board_stats.ensure_board_stats(stats_db)
+        except Exception as e:
+            print(f"⚠️ board_stats初期構築に失敗: {e}")
+        finally:
+            stats_db.close()
+
+        # 未読通知数カウンタの初期構築（空の場合のみ）
+        counters_db = database.SessionLocal()
+        try:
+            notifications.ensure_counters(counters_db)
+        except Exception as e:
+            print(f"⚠️ 未読通知数の初期構築に失敗: {e}")
+        finally:
+            counters_db.close()
+
+        # ハッシュタグ正規化テーブルの初期構築（空の場合のみ）
+        tags_db = database.SessionLocal()
+        try:
+            board_hashtags.ensure_hashtags(tags_db)
+        except Exception as e:
+            print(f"⚠️ ハッシュタグ索引の初期構築に失敗: {e}")
+        finally:
+            tags_db.close()
+
+        # 部分一致検索用のバイグラム索引の初期構築（空のスコープのみ）
+        ngram_db = database.SessionLocal()
+        try:
+            ngram_index.ensure_index(ngram_db)
+        except Exception as e:
+            print(f"⚠️ n-gram索引の初期構築に失敗: {e}")
+        finally:
+            ngram_db.close()
+
+        blob_store.check_thumbnail_support()
+
+        # 出品画像・プロフィール画像に残る DataURL を blob ストアへ移行（移行済みなら対象なし）
+        try:
+            moved = blob_store.extract_data_urls(database.SessionLocal)
+            if moved["market_items"] or moved["users"]:
+                print(f"✅ DataURL を blob ストアへ移行しました（出品 {moved['market_items']} 件 / ユーザー {moved['users']} 件）")
+        except Exception as e:
+            print(f"⚠️ DataURL の移行に失敗: {e}")
+
+        # フィードの時間減衰スコア: パラメータ読込と未計算行の補完、以後は定期スイープ
+        board_ranking.sweep_once(database.SessionLocal)
+        background_tasks.append(asyncio.create_task(board_ranking.sweep_loop(database.SessionLocal)))
+
+        # 既読マーカーの書き込み遅延バッファ（一定間隔でまとめて反映）
+        background_tasks.append(asyncio.create_task(read_markers.flush_loop(database.SessionLocal)))
+
+        # フリマ商品の閲覧数の書き込み遅延バッファ
+        background_tasks.append(asyncio.create_task(market_views.flush_loop(database.SessionLocal)))
+
+        # 通知のアウトボックス（コミット済みの通知をまとめて書き込む）
+        background_tasks.append(asyncio.create_task(notifications.flush_loop(database.SessionLocal)))
+
+        # 掲示板の更新イベント配信（/board/stream）
+        background_tasks.append(asyncio.create_task(board_events.start()))
         
         # デモユーザーを作成（開発モード用）
         db = database.SessionLocal()
@@ -274,6 +408,16 @@ async def startup_event():
         time.sleep(5)
         models.Base.metadata.create_all(bind=database.engine)
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    # 未反映の既読マーカー・閲覧数・通知を書き出す
+    read_markers.flush(database.SessionLocal)
+    market_views.flush(database.SessionLocal)
+    notifications.flush(database.SessionLocal)
+
 # CORS設定（包括的設定）
 ENV = os.getenv("ENV", "development")
 ALLOWED_ORIGINS_ENV = os.getenv("ALLOWED_ORIGINS", "")
@@ -304,15 +448,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "X-Total-Count", "ETag"],
 )
 
-# DBセッションを取得する依存関数
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# DBセッションを取得する依存関数（閲覧者の解決 identity.get_viewer と同じセッションを共有する）
+get_db = database.get_db
 
 # メールアドレスチェックAPI
 @app.get("/users/check-email")
@@ -376,7 +516,7 @@ def resolve_user(anonymous_name: str, db: Session = Depends(get_db)):
 # ユーザーIDで公開情報を取得
 @app.get("/users/public/{user_id}")
 def get_user_public(user_id: int, db: Session = Depends(get_db)):
-    u = db.query(models.User).filter(models.User.id == user_id).first()
+    u = profile_cache.get_profile(db, user_id)
     if not u:
         raise HTTPException(status_code=404, detail="ユーザーが見つかりません")
     return {
@@ -385,8 +525,8 @@ def get_user_public(user_id: int, db: Session = Depends(get_db)):
         "university": u.university,
         "year": u.year,
         "department": u.department,
-        "profile_image": getattr(u, "profile_image", None),
-        "bio": getattr(u, "bio", None),
+        "profile_image": blob_store.public_url(profile_cache.profile_image(db, u)),
+        "bio": u.bio,
     }
 
 # 簡易ユーザー登録API（認証なし）
@@ -430,6 +570,7 @@ def quick_register(user: schemas.UserQuickRegister, db: Session = Depends(get_db
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    name_resolver.invalidate(new_user.anonymous_name)
     
     return schemas.UserRegisterResponse(
         user_id=new_user.id,
@@ -521,53 +662,58 @@ app.include_router(dm_routes.router)
 app.include_router(course_routes.router)
 app.include_router(circle_routes.router)
 
+# 画像（blob）のルーターを追加
+app.include_router(blob_routes.router)
+
 # =========================
 # 管理者専用: アカウント削除
 # =========================
 
-ADMIN_EMAIL_PATTERN = re.compile(r"^(master|mster)(00|0?[1-9]|[1-2][0-9]|30)@(?:[\w.-]+\.)?ac\.jp$", re.IGNORECASE)
-
-def is_admin_email(email: Optional[str]) -> bool:
-    if not email:
-        return False
-    return ADMIN_EMAIL_PATTERN.match(email or "") is not None
-
-def resolve_email_from_headers(request: Request, db: Session) -> Optional[str]:
-    dev_email = request.headers.get("X-Dev-Email")
-    if dev_email:
-        return (dev_email or "").strip().lower()
-    user_id = request.headers.get("X-User-Id")
-    if user_id:
-        try:
-            uid = int(user_id)
-        except Exception:
-            uid = None
-        if uid:
-            user = db.query(models.User).filter(models.User.id == uid).first()
-            if user and user.email:
-                return (user.email or "").strip().lower()
-    return None
-
-def resolve_user_from_headers(request: Request, db: Session) -> Optional[models.User]:
-    user_id = request.headers.get("X-User-Id")
-    if user_id:
-        try:
-            uid = int(user_id)
-        except Exception:
-            uid = None
-        if uid:
-            user = db.query(models.User).filter(models.User.id == uid).first()
-            if user:
-                return user
-    # Fallback: email
-    email = resolve_email_from_headers(request, db)
-    if email:
-        return database.get_user_by_email(db, email)
-    return None
+def _unwind_board_counts(db: Session, uid: int) -> set[str]:
+    """削除するユーザーの投稿・返信・いいね・訪問の分だけ投稿の件数と掲示板統計を差し引く（全件再構築はしない）
+
+    投稿を削除した掲示板IDを返す（削除後に最終活動時刻を更新する）。
+    """
+    deltas: dict[str, dict[str, int]] = {}
+
+    def subtract(board_id, **counts):
+        board = deltas.setdefault(str(board_id), {})
+        for key, count in counts.items():
+            board[key] = board.get(key, 0) - count
+
+    own_posts = db.query(
+        models.BoardPost.id, models.BoardPost.board_id, models.BoardPost.reply_count, models.BoardPost.like_count
+    ).filter(models.BoardPost.author_id == uid).all()
+    for post in own_posts:
+        subtract(post.board_id, posts=1, replies=int(post.reply_count or 0), likes=int(post.like_count or 0))
+
+    # 他人の投稿への返信・いいねは、その投稿の件数も減らす
+    replies_by_post = dict(db.query(models.BoardReply.post_id, func.count(models.BoardReply.id)).filter(
+        models.BoardReply.author_id == uid
+    ).group_by(models.BoardReply.post_id).all())
+    liked_post_ids = {pid for (pid,) in db.query(models.BoardPostLike.post_id).filter(models.BoardPostLike.user_id == uid).all()}
+    other_post_ids = (set(replies_by_post) | liked_post_ids) - {post.id for post in own_posts}
+    if other_post_ids:
+        for post in db.query(models.BoardPost).filter(models.BoardPost.id.in_(other_post_ids)).all():
+            replies = min(replies_by_post.get(post.id, 0), int(post.reply_count or 0))
+            likes = min(1 if post.id in liked_post_ids else 0, int(post.like_count or 0))
+            post.reply_count = int(post.reply_count or 0) - replies
+            post.like_count = int(post.like_count or 0) - likes
+            board_ranking.refresh_post(db, post)
+            subtract(post.board_id, replies=replies, likes=likes)
+
+    for (board_id,) in db.query(models.BoardVisit.board_id).filter(models.BoardVisit.user_id == uid).all():
+        subtract(board_id, participants=1)
+
+    for board_id, counts in deltas.items():
+        board_stats.bump(db, board_id, **counts)
+    return {str(post.board_id) for post in own_posts}
 
 def delete_user_deep(db: Session, target: models.User):
-    """参照整合性エラーを避けるため、ユーザー関連データを順に削除"""
+    """参照整合性エラーを避けるため、ユーザー関連データを順に削除（コミット後に invalidate_deleted_user を呼ぶ）"""
     uid = target.id
+    # 掲示板統計は削除する分だけ差し引く
+    post_board_ids = _unwind_board_counts(db, uid)
     # いいね類
     db.query(models.BoardReplyLike).filter(models.BoardReplyLike.user_id == uid).delete(synchronize_session=False)
     db.query(models.BoardPostLike).filter(models.BoardPostLike.user_id == uid).delete(synchronize_session=False)
@@ -575,30 +721,56 @@ def delete_user_deep(db: Session, target: models.User):
     if hasattr(models, 'MarketItemCommentLike'):
         db.query(models.MarketItemCommentLike).filter(models.MarketItemCommentLike.user_id == uid).delete(synchronize_session=False)
     # 通知（受信者/行為者）
-    db.query(models.Notification).filter(models.Notification.user_id == uid).delete(synchronize_session=False)
-    db.query(models.Notification).filter(models.Notification.actor_id == uid).delete(synchronize_session=False)
+    notifications.delete_matching(db, models.Notification.user_id == uid)
+    notifications.delete_matching(db, models.Notification.actor_id == uid)
+    db.query(models.NotificationCounter).filter(models.NotificationCounter.user_id == uid).delete(synchronize_session=False)
     # コメント/返信
     if hasattr(models, 'MarketItemComment'):
+        commented_item_ids = [iid for (iid,) in db.query(models.MarketItemComment.item_id).filter(models.MarketItemComment.author_id == uid).distinct().all()]
         db.query(models.MarketItemComment).filter(models.MarketItemComment.author_id == uid).delete(synchronize_session=False)
+        market_routes.recount_comments(db, commented_item_ids)
+    # 部分一致検索の索引（削除対象の本文分）
+    for scope, model in (("board_reply", models.BoardReply), ("board_post", models.BoardPost), ("market_item", models.MarketItem)):
+        doc_ids = [doc_id for (doc_id,) in db.query(model.id).filter(model.author_id == uid).all()]
+        ngram_index.remove_documents(db, scope, doc_ids)
     db.query(models.BoardReply).filter(models.BoardReply.author_id == uid).delete(synchronize_session=False)
     # 投稿/出品
+    board_hashtags.remove_post_hashtags(db, [pid for (pid,) in db.query(models.BoardPost.id).filter(models.BoardPost.author_id == uid).all()])
     db.query(models.BoardPost).filter(models.BoardPost.author_id == uid).delete(synchronize_session=False)
     db.query(models.MarketItem).filter(models.MarketItem.author_id == uid).delete(synchronize_session=False)
+    # 既読マーカー・訪問記録
+    db.query(models.BoardRepliesView).filter(models.BoardRepliesView.user_id == uid).delete(synchronize_session=False)
+    db.query(models.BoardVisit).filter(models.BoardVisit.user_id == uid).delete(synchronize_session=False)
     # アナリティクス
     db.query(models.PageView).filter(models.PageView.user_id == uid).delete(synchronize_session=False)
     if hasattr(models, 'AnalyticsEvent'):
         db.query(models.AnalyticsEvent).filter(models.AnalyticsEvent.user_id == uid).delete(synchronize_session=False)
     # 最後にユーザー
     db.delete(target)
+    db.flush()
+    for board_id in post_board_ids:
+        board_stats.refresh_board_derived(db, board_id)
+
+def invalidate_deleted_user(user_id: int, anonymous_name: str | None) -> None:
+    """削除をコミットした後でユーザーのキャッシュを捨てる（コミット前に捨てると、その間の読み込みで古い行が再びキャッシュされる）"""
+    name_resolver.invalidate(anonymous_name)
+    identity.invalidate(user_id)
+    profile_cache.invalidate(user_id)
 
 @app.put("/users/me")
-def update_my_profile(payload: schemas.UserUpdate, request: Request, db: Session = Depends(get_db)):
+def update_my_profile(
+    payload: schemas.UserUpdate,
+    request: Request,
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
+    db: Session = Depends(get_db),
+):
     """現在のユーザーのプロフィールを更新する（表示名/大学/学年/学部/画像/ひと言）"""
-    user = resolve_user_from_headers(request, db)
-    if not user:
+    if viewer is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="認証が必要です")
+    user = identity.load_user(db, viewer)
 
     # 匿名名の重複チェック（変更時のみ）
+    renamed_from = None
     if payload.anonymous_name is not None:
         new_name = (payload.anonymous_name or "").strip()
         if len(new_name) < 2:
@@ -607,6 +779,7 @@ def update_my_profile(payload: schemas.UserUpdate, request: Request, db: Session
             exists = db.query(models.User).filter(models.User.anonymous_name == new_name).first()
             if exists:
                 raise HTTPException(status_code=400, detail="この表示名は既に使用されています")
+            renamed_from = user.anonymous_name
             user.anonymous_name = new_name
 
     if payload.year is not None:
@@ -615,52 +788,92 @@ def update_my_profile(payload: schemas.UserUpdate, request: Request, db: Session
         user.department = payload.department
     if payload.university is not None:
         user.university = (payload.university or "").strip()
+        market_routes.sync_seller_university(db, user.id, user.university)
     if payload.profile_image is not None:
-        user.profile_image = payload.profile_image
+        # DataURL は blob に保存して参照に置き換える
+        try:
+            user.profile_image = blob_store.from_data_url(db, blob_store.normalize_ref(payload.profile_image))
+        except blob_store.BlobError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     if payload.bio is not None:
         user.bio = (payload.bio or "").strip()[:200]
 
     db.commit()
+    identity.invalidate(user.id)
+    profile_cache.invalidate(user.id)
+    if renamed_from is not None:
+        # メンション解決キャッシュから旧名・新名を外す
+        name_resolver.invalidate(renamed_from, user.anonymous_name)
+    return profile_response(user)
+
+def profile_response(user: models.User) -> dict:
     return {
         "id": user.id,
         "anonymous_name": user.anonymous_name,
         "university": user.university,
         "year": user.year,
         "department": user.department,
-        "profile_image": getattr(user, "profile_image", None),
+        "profile_image": blob_store.public_url(getattr(user, "profile_image", None)),
         "bio": getattr(user, "bio", None),
     }
 
+@app.put("/users/me/profile-image")
+def upload_my_profile_image(
+    file: UploadFile = File(...),
+    viewer: identity.Viewer = Depends(identity.require_viewer),
+    db: Session = Depends(get_db),
+):
+    """プロフィール画像をアップロードして設定する（multipart/form-data の file）"""
+    user = identity.load_user(db, viewer)
+    try:
+        blob = blob_store.put_bytes(db, file.file.read(blob_store.MAX_BYTES + 1), file.content_type or "")
+    except blob_store.BlobError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    user.profile_image = blob_store.ref_for(blob.sha256)
+    db.commit()
+    identity.invalidate(user.id)
+    profile_cache.invalidate(user.id)
+    return profile_response(user)
+
 # 互換: POSTでも同じ更新を受け付ける（古いフロント対応）
 @app.post("/users/me")
-def update_my_profile_post(payload: schemas.UserUpdate, request: Request, db: Session = Depends(get_db)):
-    return update_my_profile(payload, request, db)
+def update_my_profile_post(
+    payload: schemas.UserUpdate,
+    request: Request,
+    viewer: Optional[identity.Viewer] = Depends(identity.get_viewer),
+    db: Session = Depends(get_db),
+):
+    return update_my_profile(payload, request, viewer, db)
 
 @app.delete("/users/me")
-def delete_my_account(request: Request, db: Session = Depends(get_db)):
+def delete_my_account(
+    request: Request,
+    admin: identity.Viewer = Depends(identity.require_admin_viewer),
+    db: Session = Depends(get_db),
+):
     """管理者専用: 自分のアカウントを削除"""
-    email = resolve_email_from_headers(request, db)
-    if not is_admin_email(email):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者のみが実行できます")
-
-    current = resolve_user_from_headers(request, db)
-    if not current:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
-
+    current = identity.load_user(db, admin)
+    user_id, anonymous_name = current.id, current.anonymous_name
     delete_user_deep(db, current)
     db.commit()
-    return {"message": "アカウントを削除しました", "user_id": current.id}
+    invalidate_deleted_user(user_id, anonymous_name)
+    market_stats.invalidate()
+    return {"message": "アカウントを削除しました", "user_id": user_id}
 
 @app.delete("/admin/users/{user_id}")
-def admin_delete_user(user_id: int, request: Request, db: Session = Depends(get_db)):
+def admin_delete_user(
+    user_id: int,
+    request: Request,
+    admin: identity.Viewer = Depends(identity.require_admin_viewer),
+    db: Session = Depends(get_db),
+):
     """管理者専用: 任意のユーザーを削除"""
-    email = resolve_email_from_headers(request, db)
-    if not is_admin_email(email):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者のみが実行できます")
-
     target = db.query(models.User).filter(models.User.id == user_id).first()
     if not target:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
+    anonymous_name = target.anonymous_name
     delete_user_deep(db, target)
     db.commit()
+    invalidate_deleted_user(user_id, anonymous_name)
+    market_stats.invalidate()
     return {"message": "ユーザーを削除しました", "user_id": user_id}
\ No newline at end of file
@@ -1,89 +1,113 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, asc, func
+from sqlalchemy import and_, desc, asc, func, select
 from typing import List, Optional
 from datetime import datetime
-import re
 import json
 import models, schemas, database, utils
-import random
-import string
+import ngram_index
+import market_search
+import market_stats
+import market_views
+import blob_store
+import like_service
+import http_cache
+import identity
+import notifications
+from board_routes import get_or_create_anonymous_name, NEXT_CURSOR_HEADER, apply_keyset, set_next_cursor
 
 router = APIRouter(prefix="/market", tags=["market"])
 
-def get_current_user_email(request: Request):
-    """現在のユーザーのemailを取得（JWTトークン or 開発用フォールバック）"""
-    # 本番環境ではJWTトークンから取得
-    auth_header = request.headers.get("Authorization")
-    if auth_header and auth_header.startswith("Bearer "):
-        token = auth_header.split(" ", 1)[1]
-        try:
-            from auth import verify_token
-            email = verify_token(token)
-            if email:
-                return email
-        except Exception:
-            pass  # トークン検証失敗時はフォールバック
-    
-    # X-User-Id から取得（存在すれば優先）
-    user_id = request.headers.get("X-User-Id")
-    if user_id:
-        try:
-            uid = int(user_id)
-            db = database.SessionLocal()
+def recount_comments(db: Session, item_ids) -> None:
+    """コメントの一括削除後に comment_count を数え直す（アカウント削除など）"""
+    ids = list({int(i) for i in item_ids})
+    if not ids:
+        return
+    counts = select(func.count(models.MarketItemComment.id)).where(
+        models.MarketItemComment.item_id == models.MarketItem.id
+    ).scalar_subquery()
+    db.query(models.MarketItem).filter(models.MarketItem.id.in_(ids)).update(
+        {models.MarketItem.comment_count: counts}, synchronize_session=False
+    )
+
+ALLOWED_IMAGE_EXT = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+MAX_IMAGES = 3
+
+def store_images(db: Session, urls) -> list[str]:
+    """出品画像を検証して保存用の値にする（最大3枚。DataURLは blob に保存して参照に置き換え、不正なものは除外）"""
+    stored: list[str] = []
+    for url in (urls or [])[:MAX_IMAGES]:
+        ref = blob_store.normalize_ref(url)
+        if blob_store.sha_of_ref(ref):
+            stored.append(ref)
+        elif ref.startswith("data:image/"):
             try:
-                user = db.query(models.User).filter(models.User.id == uid).first()
-                if user and user.email:
-                    return user.email
-            finally:
-                db.close()
-        except Exception:
-            pass
+                stored.append(blob_store.from_data_url(db, ref))
+            except blob_store.BlobError:
+                continue
+        elif ref.lower().endswith(ALLOWED_IMAGE_EXT):
+            stored.append(ref)
+    return stored
 
-    # 開発用フォールバック: X-Dev-Email ヘッダー
-    dev_email = request.headers.get("X-Dev-Email")
-    if dev_email:
-        if dev_email.startswith("dev:"):
-            dev_email = dev_email[4:]
-        return dev_email
-    
-    # 開発環境ではテストユーザーを使用
-    test_users = [
-        "test1@hokudai.ac.jp",
-        "test2@u-tokyo.ac.jp", 
-        "test3@kyoto-u.ac.jp"
-    ]
-    return random.choice(test_users)
-
-def get_user_by_email(db: Session, email: str):
-    """emailでユーザーを取得"""
-    return db.query(models.User).filter(models.User.email == email).first()
-
-def generate_anonymous_name():
-    """匿名表示名を生成（例: 匿名ユーザー #A1B2）"""
-    return f"匿名ユーザー #{''.join(random.choices(string.ascii_uppercase + string.digits, k=4))}"
-
-def get_or_create_anonymous_name(user, db: Session):
-    """ユーザーの固定匿名名を取得または生成"""
-    if not user.anonymous_name:
-        # 匿名名が未設定の場合は生成して保存
-        user.anonymous_name = generate_anonymous_name()
-        db.commit()
-        db.refresh(user)
-    return user.anonymous_name
-
-# 管理者判定（master/mster 00,01-09,1-30）
-ADMIN_EMAIL_PATTERN = re.compile(r"^(master|mster)(00|0?[1-9]|[1-2][0-9]|30)@(?:[\w.-]+\.)?ac\.jp$", re.IGNORECASE)
-
-def require_admin(request: Request):
-    email = get_current_user_email(request)
-    if not (email and ADMIN_EMAIL_PATTERN.match(email.strip().lower())):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者のみが実行できます")
-    return email
+def item_images(item: models.MarketItem, thumbnails: bool = False) -> list[str]:
+    """保存されている画像の参照を公開URL（thumbnails=True ならサムネイルURL）の配列にする"""
+    try:
+        images = json.loads(item.images) if item.images else []
+    except ValueError:
+        images = []
+    to_url = blob_store.thumbnail_url if thumbnails else blob_store.public_url
+    return [to_url(url) for url in images if isinstance(url, str)]
+
+def load_liked_item_ids(db: Session, item_ids, current_user: Optional[identity.Viewer]) -> set[int]:
+    """閲覧者がいいね済みの商品IDを1クエリで取得"""
+    return like_service.liked_ids(db, models.MarketItemLike, "item_id", item_ids, current_user.id if current_user else None)
+
+def build_item_response(
+    item: models.MarketItem,
+    current_user: Optional[identity.Viewer],
+    pending_views: Optional[dict] = None,
+    liked_ids: Optional[set] = None,
+) -> schemas.MarketItemResponse:
+    """一覧用の商品レスポンス
+
+    pending_views: market_views.pending() の結果（未反映の閲覧数を加える）
+    liked_ids: load_liked_item_ids() の結果（ページ分をまとめて取得して渡す）
+    """
+    images = item_images(item)
+    thumbnails = item_images(item, thumbnails=True)
+    return schemas.MarketItemResponse(
+        id=str(item.id),
+        title=item.title,
+        description=item.description,
+        type=item.type,
+        price=item.price,
+        condition=item.condition,
+        category=item.category,
+        images=images,
+        thumbnails=thumbnails,
+        author_name=item.author_name,
+        university=item.university or "不明",
+        contact_method=item.contact_method,
+        is_available=item.is_available,
+        created_at=item.created_at.isoformat(),
+        updated_at=item.updated_at.isoformat(),
+        view_count=market_views.view_count(item, pending_views),
+        like_count=item.like_count,
+        is_liked=item.id in (liked_ids or ()),
+        comment_count=int(item.comment_count or 0),
+        can_edit=bool(current_user and item.author_id == current_user.id)
+    )
+
+def sync_seller_university(db: Session, user_id: int, university: Optional[str]) -> None:
+    """出品者の大学の変更を出品へ反映する（プロフィール更新時。コミットは呼び出し側）"""
+    db.query(models.MarketItem).filter(models.MarketItem.author_id == user_id).update(
+        {models.MarketItem.university: university or None}, synchronize_session=False
+    )
 
 @router.get("/items", response_model=List[schemas.MarketItemResponse])
 def get_market_items(
     request: Request,
+    response: Response,
     type: Optional[str] = Query(None, description="商品タイプ (buy, sell, free)"),
     category: Optional[str] = Query(None, description="カテゴリ"),
     min_price: Optional[int] = Query(None, description="最低価格"),
@@ -93,86 +117,88 @@ def get_market_items(
     search: Optional[str] = Query(None, description="検索クエリ"),
     limit: int = Query(20, description="取得件数"),
     offset: int = Query(0, description="オフセット"),
+    current_user: Optional[identity.Viewer] = Depends(identity.get_viewer),
     db: Session = Depends(database.get_db)
 ):
     """市場商品一覧を取得"""
+    not_modified = http_cache.conditional(request, response, db, ("market",))
+    if not_modified is not None:
+        return not_modified
     
-    # クエリを構築
-    query = db.query(models.MarketItem).filter(models.MarketItem.is_available == True)
-    
-    # フィルター適用
-    if type:
-        query = query.filter(models.MarketItem.type == type)
-    if category:
-        query = query.filter(models.MarketItem.category == category)
-    if min_price is not None:
-        query = query.filter(models.MarketItem.price >= min_price)
-    if max_price is not None:
-        query = query.filter(models.MarketItem.price <= max_price)
-    if condition:
-        query = query.filter(models.MarketItem.condition == condition)
-    if university:
-        query = query.filter(models.MarketItem.author.has(models.User.university == university))
-    if search:
-        query = query.filter(
-            or_(
-                models.MarketItem.title.contains(search),
-                models.MarketItem.description.contains(search),
-                models.MarketItem.category.contains(search)
-            )
-        )
+    # クエリを構築（フィルターは /market/search と共通）
+    query = market_search.apply_base_filters(db, db.query(models.MarketItem), university, search)
+    query = market_search.apply_facet_filters(query, type, category, condition, min_price, max_price)
     
     # 並び順とページネーション
     items = query.order_by(desc(models.MarketItem.created_at)).offset(offset).limit(limit).all()
     
     # レスポンス形式に変換
-    result = []
-    # 現在ユーザーの取得（can_edit 判定用）
-    current_user_email = get_current_user_email(request)
-    current_user = get_user_by_email(db, current_user_email) if current_user_email else None
-    for item in items:
-        # 画像をJSONから配列に変換
-        images = []
-        if item.images:
-            try:
-                images = json.loads(item.images)
-            except:
-                images = []
-        # コメント数を集計
-        try:
-            comment_count = db.query(models.MarketItemComment.id).filter(models.MarketItemComment.item_id == item.id).count()
-        except Exception:
-            comment_count = 0
-        can_edit = bool(current_user and item.author_id == current_user.id)
-        
-        result.append(schemas.MarketItemResponse(
-            id=str(item.id),
-            title=item.title,
-            description=item.description,
-            type=item.type,
-            price=item.price,
-            condition=item.condition,
-            category=item.category,
-            images=images,
-            author_name=item.author_name,
-            university=item.author.university or "不明",
-            contact_method=item.contact_method,
-            is_available=item.is_available,
-            created_at=item.created_at.isoformat(),
-            updated_at=item.updated_at.isoformat(),
-            view_count=item.view_count,
-            like_count=item.like_count,
-            is_liked=False,  # TODO: 現在のユーザーのいいね状態を確認
-            comment_count=int(comment_count),
-            can_edit=can_edit
-        ))
-    
-    return result
+    pending_views = market_views.pending(item.id for item in items)
+    liked_ids = load_liked_item_ids(db, [item.id for item in items], current_user)
+    return [build_item_response(item, current_user, pending_views, liked_ids) for item in items]
+
+@router.get("/search")
+def search_market_items(
+    request: Request,
+    response: Response,
+    q: Optional[str] = Query(None, description="検索キーワード"),
+    type: Optional[str] = Query(None, description="商品タイプ (buy, sell, free)"),
+    category: Optional[str] = Query(None, description="カテゴリ"),
+    condition: Optional[str] = Query(None, description="商品状態"),
+    price_band: Optional[str] = Query(None, description="価格帯（facets.price_band の value）"),
+    min_price: Optional[int] = Query(None, description="最低価格"),
+    max_price: Optional[int] = Query(None, description="最高価格"),
+    university: Optional[str] = Query(None, description="大学名"),
+    sort: str = Query("newest", description="newest: 新着順 / price_asc: 安い順 / price_desc: 高い順"),
+    limit: int = Query(20, ge=1, le=100, description="取得件数"),
+    cursor: Optional[str] = Query(None, description="次ページ用カーソル（next_cursor / X-Next-Cursorの値）"),
+    current_user: Optional[identity.Viewer] = Depends(identity.get_viewer),
+    db: Session = Depends(database.get_db)
+):
+    """商品の検索（1ページ分の商品＋現在の条件でのファセット件数）
+
+    ファセット件数（カテゴリ/タイプ/状態/価格帯）は1回の GROUP BY で求める。各ファセットの件数は
+    そのファセット自身の選択を外した条件で数えるため、別の値に切り替えた場合の件数として表示できる。
+    """
+    if sort not in market_search.SORTS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="sortは newest / price_asc / price_desc のいずれかを指定してください")
+    not_modified = http_cache.conditional(request, response, db, ("market",))
+    if not_modified is not None:
+        return not_modified
+
+    search = (q or "").strip() or None
+    min_price, max_price = market_search.price_bounds(min_price, max_price, price_band)
+    base_query = market_search.apply_base_filters(db, db.query(models.MarketItem), university, search)
+
+    # ファセット件数（先頭ページのみ。続きのページでは変わらないため省略）
+    facets = None
+    total = None
+    if not cursor:
+        counted = market_search.facet_counts(base_query, type, category, condition, min_price, max_price)
+        facets, total = counted["facets"], counted["total"]
+
+    query = market_search.apply_facet_filters(base_query, type, category, condition, min_price, max_price)
+    items = market_search.apply_sort(query, sort, cursor).limit(limit + 1).all()
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = market_search.encode_cursor(sort, items[-1]) if has_more and items else None
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    pending_views = market_views.pending(item.id for item in items)
+    liked_ids = load_liked_item_ids(db, [item.id for item in items], current_user)
+    return {
+        "items": [build_item_response(item, current_user, pending_views, liked_ids) for item in items],
+        "facets": facets,
+        "total": total,
+        "next_cursor": next_cursor,
+    }
 
 @router.get("/items/{item_id}", response_model=schemas.MarketItemResponse)
 def get_market_item(
     item_id: int,
     request: Request,
+    current_user: Optional[identity.Viewer] = Depends(identity.get_viewer),
     db: Session = Depends(database.get_db)
 ):
     """特定の市場商品を取得"""
@@ -184,25 +210,13 @@ def get_market_item(
             detail="商品が見つかりません"
         )
     
-    # 閲覧数を増加
-    item.view_count += 1
-    db.commit()
+    # 閲覧数を加算（バッファに積み、一定間隔でまとめて書き込む。同じ閲覧者の再訪は数えない）
+    viewer_key = f"user:{current_user.id}" if current_user else f"ip:{request.client.host}" if request.client else None
+    market_views.record_view(item.id, viewer_key)
     
     # 画像をJSONから配列に変換
-    images = []
-    if item.images:
-        try:
-            images = json.loads(item.images)
-        except:
-            images = []
-    # コメント数
-    try:
-        comment_count = db.query(models.MarketItemComment.id).filter(models.MarketItemComment.item_id == item.id).count()
-    except Exception:
-        comment_count = 0
+    images = item_images(item)
     # can_edit
-    current_user_email = get_current_user_email(request)
-    current_user = get_user_by_email(db, current_user_email) if current_user_email else None
     can_edit = bool(current_user and item.author_id == current_user.id)
     
     return schemas.MarketItemResponse(
@@ -214,16 +228,17 @@ def get_market_item(
         condition=item.condition,
         category=item.category,
         images=images,
+        thumbnails=item_images(item, thumbnails=True),
         author_name=item.author_name,
-        university=item.author.university or "不明",
+        university=item.university or "不明",
         contact_method=item.contact_method,
         is_available=item.is_available,
         created_at=item.created_at.isoformat(),
         updated_at=item.updated_at.isoformat(),
-        view_count=item.view_count,
+        view_count=market_views.view_count(item),
         like_count=item.like_count,
-        is_liked=False,  # TODO: 現在のユーザーのいいね状態を確認
-        comment_count=int(comment_count),
+        is_liked=item.id in load_liked_item_ids(db, [item.id], current_user),
+        comment_count=int(item.comment_count or 0),
         can_edit=can_edit
     )
 
@@ -231,51 +246,16 @@ def get_market_item(
 def create_market_item(
     item_data: schemas.MarketItemCreate,
     request: Request,
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
     """新しい市場商品を作成"""
     
-    # 現在のユーザーを取得
-    current_user_email = get_current_user_email(request)
-    current_user = get_user_by_email(db, current_user_email)
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="ユーザーが見つかりません"
-        )
-    
     # ユーザーの固定匿名名を取得または生成
     anonymous_name = get_or_create_anonymous_name(current_user, db)
     
-    # 画像は最大3枚 + 簡易バリデーション（拡張子/MIME相当）
-    allowed_ext = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
-    images = item_data.images[:3] if item_data.images else []
-    # DataURLが来る想定のため、拡張子チェックは限定的（先頭のMIMEを推定）
-    validated: list[str] = []
-    for url in images:
-        if url.startswith("data:image/"):
-            # data:image/png;base64,... から拡張子相当を抽出
-            try:
-                mime = url.split(";")[0].split(":",1)[1]  # image/png
-                ext = "." + mime.split("/")[1]
-            except Exception:
-                ext = ""
-        else:
-            # URL/ファイル名から拡張子を抽出
-            lower = url.lower()
-            ext = None
-            for e in allowed_ext:
-                if lower.endswith(e):
-                    ext = e
-                    break
-            if ext is None:
-                ext = ""
-        if ext in allowed_ext:
-            # セキュリティ: data URL長の制限（約4MB相当）
-            if url.startswith("data:") and len(url) > 6_000_000:
-                continue
-            validated.append(url)
-    images = validated[:3]
+    # 画像は最大3枚（DataURLは blob に保存して参照に置き換える）
+    images = store_images(db, item_data.images)
     images_json = json.dumps(images) if images else json.dumps([])
     
     # 新しい商品を作成
@@ -289,16 +269,20 @@ def create_market_item(
         images=images_json,
         author_id=current_user.id,
         author_name=anonymous_name,
+        university=current_user.university or None,
         contact_method=item_data.contact_method,
         is_available=True
     )
     
     db.add(new_item)
+    db.flush()
+    ngram_index.index_row(db, "market_item", new_item)
     db.commit()
+    market_stats.invalidate()
     db.refresh(new_item)
     
     # レスポンス形式に変換
-    images = images
+    images = item_images(new_item)
     
     return schemas.MarketItemResponse(
         id=str(new_item.id),
@@ -309,8 +293,9 @@ def create_market_item(
         condition=new_item.condition,
         category=new_item.category,
         images=images,
+        thumbnails=item_images(new_item, thumbnails=True),
         author_name=new_item.author_name,
-        university=current_user.university or "不明",
+        university=new_item.university or "不明",
         contact_method=new_item.contact_method,
         is_available=new_item.is_available,
         created_at=new_item.created_at.isoformat(),
@@ -321,7 +306,12 @@ def create_market_item(
     )
 
 @router.get("/items/{item_id}/comments", response_model=List[schemas.MarketItemCommentResponse])
-def get_item_comments(item_id: int, response: Response, db: Session = Depends(database.get_db)):
+def get_item_comments(
+    item_id: int,
+    response: Response,
+    current_user: Optional[identity.Viewer] = Depends(identity.get_viewer),
+    db: Session = Depends(database.get_db),
+):
     # テーブル存在エラー等を考慮して一度例外時にテーブル作成を試行
     try:
         comments = db.query(models.MarketItemComment).filter(models.MarketItemComment.item_id == item_id).order_by(models.MarketItemComment.created_at).all()
@@ -331,6 +321,12 @@ def get_item_comments(item_id: int, response: Response, db: Session = Depends(da
     # 明示的にCORSヘッダーを付与（GETは認証不要のため*で許可）
     response.headers["Access-Control-Allow-Origin"] = "*"
     response.headers["Vary"] = "Origin"
+    # いいね数と閲覧者のいいね状態はコメント分をまとめて取得（各1クエリ）
+    comment_ids = [c.id for c in comments]
+    like_counts = like_service.count_likes(db, models.MarketItemCommentLike, "comment_id", comment_ids)
+    liked_ids = like_service.liked_ids(
+        db, models.MarketItemCommentLike, "comment_id", comment_ids, current_user.id if current_user else None
+    )
     return [
         schemas.MarketItemCommentResponse(
             id=c.id,
@@ -338,16 +334,14 @@ def get_item_comments(item_id: int, response: Response, db: Session = Depends(da
             author_id=c.author_id,
             content=c.content,
             author_name=c.author_name,
-            created_at=c.created_at.isoformat()
+            created_at=c.created_at.isoformat(),
+            like_count=like_counts.get(c.id, 0),
+            is_liked=c.id in liked_ids,
         ) for c in comments
     ]
 
 @router.post("/items/{item_id}/comments", response_model=schemas.MarketItemCommentResponse)
-def create_item_comment(item_id: int, data: schemas.MarketItemCommentCreate, request: Request, response: Response, db: Session = Depends(database.get_db)):
-    current_user_email = get_current_user_email(request)
-    current_user = get_user_by_email(db, current_user_email)
-    if not current_user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
+def create_item_comment(item_id: int, data: schemas.MarketItemCommentCreate, request: Request, response: Response, current_user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(database.get_db)):
     item = db.query(models.MarketItem).filter(models.MarketItem.id == item_id).first()
     if not item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="商品が見つかりません")
@@ -359,12 +353,12 @@ def create_item_comment(item_id: int, data: schemas.MarketItemCommentCreate, req
         content=data.content.strip()
     )
     db.add(comment)
-    db.commit()
-    db.refresh(comment)
-    # 通知: 出品者にコメント通知
+    like_service.bump_counter(db, models.MarketItem, item_id, "comment_count", 1, target=item)
+    # 通知: 出品者にコメント通知（コミット後に配信）
     try:
         if item.author_id and item.author_id != current_user.id:
-            notif = models.Notification(
+            notifications.enqueue(
+                db,
                 user_id=item.author_id,
                 actor_id=current_user.id,
                 type="market_comment_added",
@@ -373,10 +367,10 @@ def create_item_comment(item_id: int, data: schemas.MarketItemCommentCreate, req
                 title="あなたの出品にコメントがありました",
                 message=comment.content[:120]
             )
-            db.add(notif)
-            db.commit()
     except Exception:
         pass
+    db.commit()
+    db.refresh(comment)
     # 明示的にCORSヘッダーを付与（POSTも許可、プリフライトはOPTIONSで対応）
     response.headers["Access-Control-Allow-Origin"] = "*"
     response.headers["Vary"] = "Origin"
@@ -390,30 +384,20 @@ def create_item_comment(item_id: int, data: schemas.MarketItemCommentCreate, req
     )
 
 @router.post("/items/{item_id}/comments/{comment_id}/like")
-def toggle_comment_like(item_id: int, comment_id: int, request: Request, db: Session = Depends(database.get_db)):
-    current_user_email = get_current_user_email(request)
-    current_user = get_user_by_email(db, current_user_email)
-    if not current_user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
+def toggle_comment_like(item_id: int, comment_id: int, request: Request, current_user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(database.get_db)):
     comment = db.query(models.MarketItemComment).filter(models.MarketItemComment.id == comment_id, models.MarketItemComment.item_id == item_id).first()
     if not comment:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="コメントが見つかりません")
-    existing = db.query(models.MarketItemCommentLike).filter(
-        and_(
-            models.MarketItemCommentLike.comment_id == comment_id,
-            models.MarketItemCommentLike.user_id == current_user.id
-        )
-    ).first()
-    if existing:
-        db.delete(existing)
-        is_liked = False
-    else:
-        db.add(models.MarketItemCommentLike(comment_id=comment_id, user_id=current_user.id))
-        is_liked = True
+    # コメントには件数カラムがないため、いいね行の追加/削除のみ
+    is_liked = like_service.toggle_like(
+        db, models.MarketItemCommentLike, "comment_id", comment_id, current_user.id
+    )["is_liked"]
+    if is_liked:
         # 通知: コメント作者にいいね通知（遷移先の都合で item に紐づけ）
         try:
             if comment.author_id and comment.author_id != current_user.id:
-                notif = models.Notification(
+                notifications.enqueue(
+                    db,
                     user_id=comment.author_id,
                     actor_id=current_user.id,
                     type="market_comment_liked",
@@ -422,19 +406,37 @@ def toggle_comment_like(item_id: int, comment_id: int, request: Request, db: Ses
                     title="あなたのコメントがいいねされました",
                     message=comment.content[:120]
                 )
-                db.add(notif)
         except Exception:
             pass
     db.commit()
     return {"message": "ok", "is_liked": is_liked}
 
+def _parse_since(since: str) -> datetime:
+    """since（ISO 8601）を解釈する。タイムゾーンなしは日本時間とみなす"""
+    try:
+        value = datetime.fromisoformat(since.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="sinceの形式が不正です（ISO 8601）")
+    if value.tzinfo is None:
+        return value.replace(tzinfo=models.JST)
+    return value.astimezone(models.JST)
+
 @router.get("/notifications", response_model=List[schemas.NotificationResponse])
-def get_notifications(request: Request, db: Session = Depends(database.get_db)):
-    current_user_email = get_current_user_email(request)
-    current_user = get_user_by_email(db, current_user_email)
-    if not current_user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
-    notifs = db.query(models.Notification).filter(models.Notification.user_id == current_user.id).order_by(desc(models.Notification.created_at)).limit(50).all()
+def get_notifications(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=100, description="取得件数"),
+    before: Optional[str] = Query(None, description="次ページ用カーソル（X-Next-Cursorの値）"),
+    since: Optional[str] = Query(None, description="この時刻（ISO 8601）より新しい通知だけを返す"),
+    current_user: identity.Viewer = Depends(identity.require_viewer),
+    db: Session = Depends(database.get_db)
+):
+    """通知一覧（新しい順）。続きは X-Next-Cursor を before に指定して取得する"""
+    query = db.query(models.Notification).filter(models.Notification.user_id == current_user.id)
+    if since:
+        query = query.filter(models.Notification.created_at > _parse_since(since))
+    notifs = apply_keyset(query, models.Notification.created_at, models.Notification.id, before).limit(limit).all()
+    set_next_cursor(response, notifs, limit)
     return [
         schemas.NotificationResponse(
             id=n.id,
@@ -448,38 +450,30 @@ def get_notifications(request: Request, db: Session = Depends(database.get_db)):
         ) for n in notifs
     ]
 
+@router.get("/notifications/unread-count")
+def get_unread_notification_count(current_user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(database.get_db)):
+    """未読通知数（ヘッダーのバッジ用。notification_counters の1行を読むだけ）"""
+    return notifications.unread_counts(db, current_user.id)
+
 @router.post("/notifications/{notification_id}/read")
-def mark_notification_read(notification_id: int, request: Request, db: Session = Depends(database.get_db)):
-    current_user_email = get_current_user_email(request)
-    current_user = get_user_by_email(db, current_user_email)
-    if not current_user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
+def mark_notification_read(notification_id: int, request: Request, current_user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(database.get_db)):
     notif = db.query(models.Notification).filter(models.Notification.id == notification_id, models.Notification.user_id == current_user.id).first()
     if not notif:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="通知が見つかりません")
-    notif.is_read = True
+    notifications.mark_read(db, notif)
     db.commit()
     return {"message": "read"}
 
 @router.post("/notifications/mark-all-read")
-def mark_all_notifications_read(request: Request, db: Session = Depends(database.get_db)):
+def mark_all_notifications_read(request: Request, current_user: identity.Viewer = Depends(identity.require_viewer), db: Session = Depends(database.get_db)):
     """ユーザーの未読通知を全て既読化する"""
-    current_user_email = get_current_user_email(request)
-    current_user = get_user_by_email(db, current_user_email)
-    if not current_user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ユーザーが見つかりません")
-    db.query(models.Notification).filter(
-        models.Notification.user_id == current_user.id,
-        models.Notification.is_read == False
-    ).update({models.Notification.is_read: True}, synchronize_session=False)
+    notifications.mark_all_read(db, current_user.id)
     db.commit()
     return {"message": "all_read"}
 
 # コメント削除（本人/管理者）
 @router.delete("/items/{item_id}/comments/{comment_id}")
-def delete_item_comment(item_id: int, comment_id: int, request: Request, db: Session = Depends(database.get_db)):
-    email = get_current_user_email(request)
-    user = get_user_by_email(db, email)
+def delete_item_comment(item_id: int, comment_id: int, request: Request, viewer: Optional[identity.Viewer] = Depends(identity.get_viewer), db: Session = Depends(database.get_db)):
     comment = db.query(models.MarketItemComment).filter(
         and_(
             models.MarketItemComment.id == comment_id,
@@ -488,10 +482,11 @@ def delete_item_comment(item_id: int, comment_id: int, request: Request, db: Ses
     ).first()
     if not comment:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="コメントが見つかりません")
-    is_admin = bool(email and ADMIN_EMAIL_PATTERN.match(email.strip().lower()))
-    if not (is_admin or (user and user.id == comment.author_id)):
+    is_admin = bool(viewer and viewer.is_admin)
+    if not (is_admin or (viewer and viewer.id == comment.author_id)):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="削除権限がありません")
     db.delete(comment)
+    like_service.bump_counter(db, models.MarketItem, item_id, "comment_count", -1)
     db.commit()
     return {"message": "コメントを削除しました"}
 
@@ -509,19 +504,11 @@ def update_market_item(
     item_id: int,
     item_data: schemas.MarketItemUpdate,
     request: Request,
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
     """市場商品を更新"""
     
-    # 現在のユーザーを取得
-    current_user_email = get_current_user_email(request)
-    current_user = get_user_by_email(db, current_user_email)
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="ユーザーが見つかりません"
-        )
-    
     # 商品を取得
     item = db.query(models.MarketItem).filter(models.MarketItem.id == item_id).first()
     if not item:
@@ -549,23 +536,21 @@ def update_market_item(
     if item_data.category is not None:
         item.category = item_data.category
     if item_data.images is not None:
-        item.images = json.dumps(item_data.images) if item_data.images else None
+        images = store_images(db, item_data.images)
+        item.images = json.dumps(images) if images else None
     if item_data.contact_method is not None:
         item.contact_method = item_data.contact_method
     if item_data.is_available is not None:
         item.is_available = item_data.is_available
     
     item.updated_at = models.jst_now()
+    ngram_index.index_row(db, "market_item", item)
     db.commit()
+    market_stats.invalidate()
     db.refresh(item)
     
     # レスポンス形式に変換
-    images = []
-    if item.images:
-        try:
-            images = json.loads(item.images)
-        except:
-            images = []
+    images = item_images(item)
     
     return schemas.MarketItemResponse(
         id=str(item.id),
@@ -576,34 +561,28 @@ def update_market_item(
         condition=item.condition,
         category=item.category,
         images=images,
+        thumbnails=item_images(item, thumbnails=True),
         author_name=item.author_name,
-        university=item.author.university or "不明",
+        university=item.university or "不明",
         contact_method=item.contact_method,
         is_available=item.is_available,
         created_at=item.created_at.isoformat(),
         updated_at=item.updated_at.isoformat(),
-        view_count=item.view_count,
+        view_count=market_views.view_count(item),
         like_count=item.like_count,
-        is_liked=False
+        is_liked=item.id in load_liked_item_ids(db, [item.id], current_user),
+        comment_count=int(item.comment_count or 0)
     )
 
 @router.delete("/items/{item_id}")
 def delete_market_item(
     item_id: int,
     request: Request,
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
     """市場商品を削除"""
     
-    # 現在のユーザーを取得
-    current_user_email = get_current_user_email(request)
-    current_user = get_user_by_email(db, current_user_email)
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="ユーザーが見つかりません"
-        )
-    
     # 商品を取得
     item = db.query(models.MarketItem).filter(models.MarketItem.id == item_id).first()
     if not item:
@@ -620,8 +599,10 @@ def delete_market_item(
         )
     
     # 削除
+    ngram_index.remove_document(db, "market_item", item.id)
     db.delete(item)
     db.commit()
+    market_stats.invalidate()
     
     return {"message": "商品を削除しました"}
 
@@ -630,9 +611,9 @@ def delete_market_item(
 def admin_cancel_item(
     item_id: int,
     request: Request,
+    admin: identity.Viewer = Depends(identity.require_admin_viewer),
     db: Session = Depends(database.get_db)
 ):
-    require_admin(request)
     item = db.query(models.MarketItem).filter(models.MarketItem.id == item_id).first()
     if not item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="商品が見つかりません")
@@ -640,6 +621,7 @@ def admin_cancel_item(
     item.is_deleted = True
     item.updated_at = models.jst_now()
     db.commit()
+    market_stats.invalidate()
     return {"message": "出品を取り消しました", "item_id": item_id, "is_available": item.is_available}
 
 # 管理者: 出品を物理削除
@@ -647,9 +629,9 @@ def admin_cancel_item(
 def admin_delete_item(
     item_id: int,
     request: Request,
+    admin: identity.Viewer = Depends(identity.require_admin_viewer),
     db: Session = Depends(database.get_db)
 ):
-    require_admin(request)
     item = db.query(models.MarketItem).filter(models.MarketItem.id == item_id).first()
     if not item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="商品が見つかりません")
@@ -666,32 +648,27 @@ def admin_delete_item(
     db.query(models.MarketItemLike).filter(models.MarketItemLike.item_id == item_id).delete(synchronize_session=False)
     # 通知（itemに紐づくもの）
     if hasattr(models, 'Notification'):
-        db.query(models.Notification).filter(
+        notifications.delete_matching(
+            db,
             models.Notification.entity_type.in_(["market_item", "market_item_comment"]),
-            models.Notification.entity_id == item_id
-        ).delete(synchronize_session=False)
+            models.Notification.entity_id == item_id,
+        )
     # 本体を削除
+    ngram_index.remove_document(db, "market_item", item_id)
     db.delete(item)
     db.commit()
+    market_stats.invalidate()
     return {"message": "商品を削除しました(管理者)", "item_id": item_id}
 
 @router.post("/items/{item_id}/like")
 def toggle_like(
     item_id: int,
     request: Request,
+    current_user: identity.Viewer = Depends(identity.require_viewer),
     db: Session = Depends(database.get_db)
 ):
     """商品のいいねを切り替え"""
     
-    # 現在のユーザーを取得
-    current_user_email = get_current_user_email(request)
-    current_user = get_user_by_email(db, current_user_email)
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="ユーザーが見つかりません"
-        )
-    
     # 商品を取得
     item = db.query(models.MarketItem).filter(models.MarketItem.id == item_id).first()
     if not item:
@@ -700,67 +677,27 @@ def toggle_like(
             detail="商品が見つかりません"
         )
     
-    # 既存のいいねをチェック
-    existing_like = db.query(models.MarketItemLike).filter(
-        and_(
-            models.MarketItemLike.item_id == item_id,
-            models.MarketItemLike.user_id == current_user.id
-        )
-    ).first()
-    
-    if existing_like:
-        # いいねを削除
-        db.delete(existing_like)
-        item.like_count = max(0, item.like_count - 1)
-        is_liked = False
-    else:
-        # いいねを追加
-        new_like = models.MarketItemLike(
-            item_id=item_id,
-            user_id=current_user.id
-        )
-        db.add(new_like)
-        item.like_count += 1
-        is_liked = True
+    # いいねの追加/削除と like_count の加減算をDB側で行う
+    result = like_service.toggle_like(
+        db, models.MarketItemLike, "item_id", item_id, current_user.id,
+        target_model=models.MarketItem, target=item,
+    )
     
     db.commit()
     
     return {
         "message": "いいねを更新しました",
-        "is_liked": is_liked,
-        "like_count": item.like_count
+        "is_liked": result["is_liked"],
+        "like_count": result["like_count"]
     }
 
 @router.get("/stats")
-def get_market_stats(db: Session = Depends(database.get_db)):
-    """市場の統計情報を取得"""
-    
-    # 基本統計
-    total_items = db.query(models.MarketItem).filter(models.MarketItem.is_available == True).count()
-    buy_items = db.query(models.MarketItem).filter(
-        and_(models.MarketItem.is_available == True, models.MarketItem.type == "buy")
-    ).count()
-    sell_items = db.query(models.MarketItem).filter(
-        and_(models.MarketItem.is_available == True, models.MarketItem.type == "sell")
-    ).count()
-    free_items = db.query(models.MarketItem).filter(
-        and_(models.MarketItem.is_available == True, models.MarketItem.type == "free")
-    ).count()
-    
-    # カテゴリ別統計
-    categories = {}
-    category_items = db.query(
-        models.MarketItem.category,
-        func.count(models.MarketItem.id).label('count')
-    ).filter(models.MarketItem.is_available == True).group_by(models.MarketItem.category).all()
-    
-    for category, count in category_items:
-        categories[category] = count
-    
-    return {
-        "total_items": total_items,
-        "buy_items": buy_items,
-        "sell_items": sell_items,
-        "free_items": free_items,
-        "categories": categories
-    }
+def get_market_stats(request: Request, response: Response, db: Session = Depends(database.get_db)):
+    """市場の統計情報を取得（1クエリで集計し、短時間スナップショットを返す）
+
+    総数・タイプ別・カテゴリ別の件数に加えて、タイプ×カテゴリの件数とカテゴリ別の価格統計（最小/中央値/90%点）を返す。
+    """
+    not_modified = http_cache.conditional(request, response, db, ("market",), http_cache.PUBLIC_STATS, per_viewer=False)
+    if not_modified is not None:
+        return not_modified
+    return market_stats.get_stats(db)
@@ -0,0 +1,190 @@
+"""
+フリマ商品の絞り込み・ファセット集計・カーソルページング（/market/items, /market/search 用）
+
+- ファセット（カテゴリ/タイプ/状態/価格帯）は、ファセット対象外の条件（大学・キーワード）だけで絞った商品を
+  (category, type, condition, price) でまとめる1回の GROUP BY から求める
+- 各ファセットの件数は「他のファセットの選択条件」を満たす組み合わせだけを合計する
+  （選択中のファセット自身の条件は外すので、別の値に切り替えた場合の件数が分かる）
+- 並び順は (並びのキー, id) で一意にし、カーソルはその組を不透明な文字列にしたもの
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_, desc, func
+from sqlalchemy.orm import Session
+import models
+import ngram_index
+
+# 価格帯（円。max は含む。None は上限なし）。price が NULL の商品は 0 円として扱う
+PRICE_BANDS = [
+    {"value": "free", "label": "無料", "min": 0, "max": 0},
+    {"value": "under_1000", "label": "1〜999円", "min": 1, "max": 999},
+    {"value": "1000_2999", "label": "1,000〜2,999円", "min": 1000, "max": 2999},
+    {"value": "3000_4999", "label": "3,000〜4,999円", "min": 3000, "max": 4999},
+    {"value": "5000_9999", "label": "5,000〜9,999円", "min": 5000, "max": 9999},
+    {"value": "10000_plus", "label": "10,000円以上", "min": 10000, "max": None},
+]
+PRICE_BAND_BY_VALUE = {band["value"]: band for band in PRICE_BANDS}
+
+SORTS = ("newest", "price_asc", "price_desc")
+
+def price_band_of(price: Optional[int]) -> str:
+    price = int(price or 0)
+    for band in PRICE_BANDS:
+        if price >= band["min"] and (band["max"] is None or price <= band["max"]):
+            return band["value"]
+    return PRICE_BANDS[0]["value"]
+
+def _price_column():
+    return func.coalesce(models.MarketItem.price, 0)
+
+# -----------------------------
+# 絞り込み
+# -----------------------------
+
+def apply_base_filters(db: Session, query, university: Optional[str] = None, search: Optional[str] = None):
+    """ファセット以外の条件（出品中・大学・キーワード）"""
+    query = query.filter(models.MarketItem.is_available == True)
+    if university:
+        # 出品に複製した大学で絞り込む（idx_market_items_university_available_created）
+        query = query.filter(models.MarketItem.university == university)
+    if search:
+        # バイグラム索引で候補を絞ってから部分一致で確認する（1文字の検索は従来どおり部分一致のみ）
+        candidates = ngram_index.candidate_filter(db, "market_item", search, models.MarketItem.id)
+        if candidates is not None:
+            query = query.filter(candidates)
+        query = query.filter(
+            or_(
+                models.MarketItem.title.contains(search),
+                models.MarketItem.description.contains(search),
+                models.MarketItem.category.contains(search)
+            )
+        )
+    return query
+
+def price_bounds(min_price: Optional[int], max_price: Optional[int], price_band: Optional[str]):
+    """min_price/max_price と価格帯の指定を1つの範囲にまとめる（価格帯が不正なら400）"""
+    if price_band:
+        band = PRICE_BAND_BY_VALUE.get(price_band)
+        if band is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="価格帯が不正です")
+        min_price = band["min"] if min_price is None else max(min_price, band["min"])
+        if band["max"] is not None:
+            max_price = band["max"] if max_price is None else min(max_price, band["max"])
+    return min_price, max_price
+
+def apply_facet_filters(
+    query,
+    type: Optional[str] = None,
+    category: Optional[str] = None,
+    condition: Optional[str] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+):
+    if type:
+        query = query.filter(models.MarketItem.type == type)
+    if category:
+        query = query.filter(models.MarketItem.category == category)
+    if condition:
+        query = query.filter(models.MarketItem.condition == condition)
+    if min_price is not None:
+        query = query.filter(_price_column() >= min_price)
+    if max_price is not None:
+        query = query.filter(_price_column() <= max_price)
+    return query
+
+# -----------------------------
+# ファセット集計
+# -----------------------------
+
+def facet_counts(base_query, type=None, category=None, condition=None, min_price=None, max_price=None) -> dict:
+    """基本条件で絞ったクエリから、各ファセットの件数と全条件での総数を1回の GROUP BY で求める"""
+    price = _price_column()
+    rows = base_query.with_entities(
+        models.MarketItem.category,
+        models.MarketItem.type,
+        models.MarketItem.condition,
+        price.label("price"),
+        func.count(models.MarketItem.id),
+    ).group_by(models.MarketItem.category, models.MarketItem.type, models.MarketItem.condition, price).all()
+
+    def price_ok(value: int) -> bool:
+        return (min_price is None or value >= min_price) and (max_price is None or value <= max_price)
+
+    selected = {"category": category, "type": type, "condition": condition}
+    counts = {"category": {}, "type": {}, "condition": {}, "price_band": {}}
+    total = 0
+    for row_category, row_type, row_condition, row_price, count in rows:
+        values = {"category": row_category, "type": row_type, "condition": row_condition}
+        matches = {name: not want or values[name] == want for name, want in selected.items()}
+        matches["price_band"] = price_ok(int(row_price or 0))
+        for facet in counts:
+            # 自分以外のファセット条件をすべて満たす組み合わせだけを数える
+            if all(ok for name, ok in matches.items() if name != facet):
+                key = price_band_of(row_price) if facet == "price_band" else values[facet]
+                counts[facet][key] = counts[facet].get(key, 0) + int(count)
+        if all(matches.values()):
+            total += int(count)
+
+    def ordered(facet: str):
+        return [
+            {"value": value, "count": count}
+            for value, count in sorted(counts[facet].items(), key=lambda kv: (-kv[1], str(kv[0])))
+        ]
+
+    return {
+        "total": total,
+        "facets": {
+            "category": ordered("category"),
+            "type": ordered("type"),
+            "condition": ordered("condition"),
+            "price_band": [
+                {**band, "count": counts["price_band"].get(band["value"], 0)} for band in PRICE_BANDS
+            ],
+        },
+    }
+
+# -----------------------------
+# 並び順とカーソル
+# -----------------------------
+
+def _sort_key(item: models.MarketItem, sort: str):
+    if sort == "newest":
+        return item.created_at.isoformat()
+    return int(item.price or 0)
+
+def encode_cursor(sort: str, item: models.MarketItem) -> str:
+    raw = json.dumps([sort, _sort_key(item, sort), int(item.id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, sort: str):
+    """カーソルを (並びのキー, id) に戻す。不正・並び順違いは400"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, key, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        if cursor_sort != sort:
+            raise ValueError("sort mismatch")
+        key = datetime.fromisoformat(key) if sort == "newest" else int(key)
+        return key, int(row_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="カーソルが不正です")
+
+def apply_sort(query, sort: str, cursor: Optional[str] = None):
+    """(並びのキー, id) で一意に並べ、cursor があればその続きに絞り込む"""
+    id_col = models.MarketItem.id
+    if sort == "newest":
+        key_col, ascending = models.MarketItem.created_at, False
+    else:
+        key_col, ascending = _price_column(), sort == "price_asc"
+    if cursor:
+        key, row_id = decode_cursor(cursor, sort)
+        if ascending:
+            query = query.filter(or_(key_col > key, and_(key_col == key, id_col > row_id)))
+        else:
+            query = query.filter(or_(key_col < key, and_(key_col == key, id_col < row_id)))
+    if ascending:
+        return query.order_by(key_col.asc(), id_col.asc())
+    return query.order_by(desc(key_col), desc(id_col))
@@ -0,0 +1,108 @@
+"""
+フリマの統計（/market/stats）の集計とプロセス内スナップショット
+
+- 出品中の商品を (type, category, price) でまとめる1回の GROUP BY から、
+  総数・タイプ別・カテゴリ別・タイプ×カテゴリの件数（ROLLUP相当の小計）と
+  カテゴリ別の価格統計（最小/中央値/90パーセンタイル）を求める
+  （ROLLUP は SQLite にないため、小計は取得した行から Python で合算する）
+- 結果は短いTTLのスナップショットとして保持し、出品の作成/更新/削除/取り消し時に invalidate() する
+  （他ワーカーの分は TTL で期限切れにする）
+"""
+
+import math
+import threading
+import time
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+import models
+
+TTL_SECONDS = 30
+TYPES = ("buy", "sell", "free")
+
+_lock = threading.Lock()
+_snapshot = None  # (stats, 作成時刻)
+_generation = 0   # invalidate のたびに進める（集計中に無効化された結果を保存しないため）
+
+def _percentile(histogram: list[tuple[int, int]], q: float) -> int | None:
+    """(価格, 件数) の昇順ヒストグラムから最近傍順位法でパーセンタイルを求める"""
+    total = sum(count for _, count in histogram)
+    if total == 0:
+        return None
+    rank = max(1, math.ceil(q * total))
+    seen = 0
+    for price, count in histogram:
+        seen += count
+        if seen >= rank:
+            return price
+    return histogram[-1][0]
+
+def compute(db: Session) -> dict:
+    """統計を集計する（1クエリ）"""
+    rows = db.query(
+        models.MarketItem.type,
+        models.MarketItem.category,
+        models.MarketItem.price,
+        func.count(models.MarketItem.id),
+    ).filter(
+        models.MarketItem.is_available == True
+    ).group_by(
+        models.MarketItem.type, models.MarketItem.category, models.MarketItem.price
+    ).all()
+
+    total = 0
+    by_type = {t: 0 for t in TYPES}
+    categories: dict[str, int] = {}
+    category_types: dict[str, dict[str, int]] = {}
+    price_histograms: dict[str, dict[int, int]] = {}
+    for item_type, category, price, count in rows:
+        count = int(count)
+        total += count
+        by_type[item_type] = by_type.get(item_type, 0) + count
+        categories[category] = categories.get(category, 0) + count
+        per_type = category_types.setdefault(category, {})
+        per_type[item_type] = per_type.get(item_type, 0) + count
+        if price is not None:
+            histogram = price_histograms.setdefault(category, {})
+            histogram[int(price)] = histogram.get(int(price), 0) + count
+
+    price_stats = {}
+    for category, histogram in price_histograms.items():
+        ordered = sorted(histogram.items())
+        price_stats[category] = {
+            "count": sum(histogram.values()),
+            "min": ordered[0][0],
+            "median": _percentile(ordered, 0.5),
+            "p90": _percentile(ordered, 0.9),
+        }
+
+    return {
+        "total_items": total,
+        "buy_items": by_type.get("buy", 0),
+        "sell_items": by_type.get("sell", 0),
+        "free_items": by_type.get("free", 0),
+        "by_type": by_type,
+        "categories": categories,
+        "category_types": category_types,
+        "price_stats": price_stats,
+        "generated_at": models.jst_now().isoformat(),
+    }
+
+def get_stats(db: Session) -> dict:
+    """スナップショットを返す（期限切れ・無効化後は集計し直す）"""
+    global _snapshot
+    with _lock:
+        if _snapshot is not None and time.monotonic() - _snapshot[1] <= TTL_SECONDS:
+            return _snapshot[0]
+        generation = _generation
+    stats = compute(db)
+    with _lock:
+        if generation == _generation:
+            _snapshot = (stats, time.monotonic())
+    return stats
+
+def invalidate() -> None:
+    """出品の作成/更新/削除/取り消しのコミット後に呼ぶ"""
+    global _snapshot, _generation
+    with _lock:
+        _snapshot = None
+        _generation += 1
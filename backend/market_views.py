@@ -0,0 +1,110 @@
+"""
+フリマ商品の閲覧数（market_items.view_count）の書き込み遅延バッファ
+
+商品詳細の GET のたびに view_count を加算＋コミットしていた処理をメモリ上の集計に置き換える。
+- 商品ごとの加算数をまとめ、一定間隔（FLUSH_INTERVAL_SECONDS）と終了時に
+  UPDATE ... SET view_count = view_count + CASE id WHEN ... END の一括更新で書き込む
+- 同じ閲覧者（ユーザーID / 未ログインは接続元IP）による同じ商品の閲覧は DEDUP_TTL_SECONDS の間1回と数える
+  （閲覧者キーはメモリ上の TTL 付き集合で、上限 DEDUP_MAX_KEYS を超えたら古いものから捨てる）
+- 未反映の加算数は pending() で参照でき、同じワーカー内では即座にレスポンスへ反映できる
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import case, func, update
+import http_cache
+import models
+
+FLUSH_INTERVAL_SECONDS = 10
+DEDUP_TTL_SECONDS = 30 * 60
+DEDUP_MAX_KEYS = 100_000
+# 1回の UPDATE 文に含める商品数
+UPDATE_CHUNK = 500
+
+_lock = threading.Lock()
+_counts: dict[int, int] = {}  # item_id -> 未反映の加算数
+_seen: "OrderedDict[tuple[str, int], float]" = OrderedDict()  # (閲覧者キー, item_id) -> 期限
+
+def _remember(key: tuple[str, int], now: float) -> bool:
+    """閲覧者キーを記録する。TTL 内に記録済みなら False"""
+    expires = _seen.get(key)
+    if expires is not None and expires > now:
+        return False
+    _seen[key] = now + DEDUP_TTL_SECONDS
+    _seen.move_to_end(key)
+    # 期限切れ（先頭ほど古い）と上限超過分を捨てる
+    while _seen:
+        oldest_key, oldest_expires = next(iter(_seen.items()))
+        if oldest_expires > now and len(_seen) <= DEDUP_MAX_KEYS:
+            break
+        del _seen[oldest_key]
+    return True
+
+def record_view(item_id: int, viewer_key: str | None = None) -> bool:
+    """閲覧を1件記録する（viewer_key を渡すと重複を除く）。数えた場合は True"""
+    item_id = int(item_id)
+    with _lock:
+        if viewer_key and not _remember((str(viewer_key), item_id), time.monotonic()):
+            return False
+        _counts[item_id] = _counts.get(item_id, 0) + 1
+    return True
+
+def pending(item_ids) -> dict[int, int]:
+    """未反映の加算数 {item_id: 件数}"""
+    with _lock:
+        return {int(i): _counts[int(i)] for i in item_ids if int(i) in _counts}
+
+def view_count(item: models.MarketItem, pending_counts: dict[int, int] | None = None) -> int:
+    """DBの値と未反映の加算数の合計"""
+    if pending_counts is None:
+        pending_counts = pending([item.id])
+    return int(item.view_count or 0) + pending_counts.get(item.id, 0)
+
+# -----------------------------
+# flush
+# -----------------------------
+
+def flush(session_factory) -> int:
+    """加算数をDBへ書き込む。更新した商品数を返す（失敗した分はバッファへ戻す）"""
+    global _counts
+    with _lock:
+        counts, _counts = _counts, {}
+    if not counts:
+        return 0
+
+    db = session_factory()
+    try:
+        column = models.MarketItem.view_count
+        rows = list(counts.items())
+        for i in range(0, len(rows), UPDATE_CHUNK):
+            chunk = dict(rows[i:i + UPDATE_CHUNK])
+            db.execute(
+                update(models.MarketItem)
+                .where(models.MarketItem.id.in_(chunk.keys()))
+                .values(
+                    view_count=func.coalesce(column, 0) + case(chunk, value=models.MarketItem.id, else_=0),
+                    # 閲覧は商品の更新ではないので updated_at（onupdate）は据え置く
+                    updated_at=models.MarketItem.updated_at,
+                )
+                # 閲覧数だけの更新では一覧のETagを変えない
+                .execution_options(synchronize_session=False, **{http_cache.SKIP_OPTION: True})
+            )
+        db.commit()
+        return len(counts)
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ 閲覧数の書き込みに失敗（次回に再試行）: {e}")
+        with _lock:
+            for item_id, count in counts.items():
+                _counts[item_id] = _counts.get(item_id, 0) + count
+        return 0
+    finally:
+        db.close()
+
+async def flush_loop(session_factory) -> None:
+    """FLUSH_INTERVAL_SECONDS ごとに flush（DB処理はスレッドで実行）"""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+        await asyncio.to_thread(flush, session_factory)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, UniqueConstraint, Index
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Float, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime, timezone, timedelta
 
@@ -50,6 +50,8 @@ class MarketItem(Base):
         Index('idx_market_items_category_created', 'category', 'created_at'),
         # 複合インデックス：価格範囲検索用
         Index('idx_market_items_price_available', 'price', 'is_available'),
+        # 複合インデックス：大学別の新着一覧用
+        Index('idx_market_items_university_available_created', 'university', 'is_available', 'created_at'),
     )
     
     id = Column(Integer, primary_key=True, index=True)
@@ -62,11 +64,13 @@ class MarketItem(Base):
     images = Column(Text, nullable=True)  # 画像URL（JSON形式）
     author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     author_name = Column(String(100), nullable=False)  # 匿名表示名
+    university = Column(String(100), nullable=True)  # 出品者の大学（users.university の複製。プロフィール変更時に同期）
     contact_method = Column(String(20), nullable=False)  # 連絡方法
     is_available = Column(Boolean, default=True, index=True)  # 取引可能かどうか
     is_deleted = Column(Boolean, default=False)  # 論理削除フラグ
     view_count = Column(Integer, default=0)  # 閲覧数
     like_count = Column(Integer, default=0)  # いいね数
+    comment_count = Column(Integer, default=0)  # コメント数（コメントの追加/削除時に更新）
     created_at = Column(DateTime(timezone=True), default=jst_now, index=True)
     updated_at = Column(DateTime(timezone=True), default=jst_now, onupdate=jst_now)
     
@@ -129,6 +133,11 @@ class BoardPost(Base):
         Index('idx_board_posts_board_created', 'board_id', 'created_at'),
         # 複合インデックス：掲示板IDといいね数（人気順表示用）
         Index('idx_board_posts_board_likes', 'board_id', 'like_count'),
+        # 複合インデックス：投稿者と作成日時（ユーザー別タイムラインのカーソルページング用）
+        Index('idx_board_posts_author_created', 'author_id', 'created_at'),
+        # 全体フィードの人気順/トレンド順（board_ranking.py の時間減衰スコア）
+        Index('idx_board_posts_popular_score', 'popular_score'),
+        Index('idx_board_posts_trending_score', 'trending_score'),
     )
     
     id = Column(Integer, primary_key=True, index=True)
@@ -140,6 +149,8 @@ class BoardPost(Base):
     like_count = Column(Integer, default=0, index=True)  # いいね数
     reply_count = Column(Integer, default=0)  # 返信数
     is_deleted = Column(Boolean, default=False, index=True)  # 論理削除フラグ
+    popular_score = Column(Float, nullable=True)  # 人気順スコア（いいね重視・緩やかな減衰）
+    trending_score = Column(Float, nullable=True)  # トレンド順スコア（返信重視・速い減衰）
     created_at = Column(DateTime(timezone=True), default=jst_now, index=True)
     updated_at = Column(DateTime(timezone=True), default=jst_now, onupdate=jst_now)
     
@@ -230,6 +241,14 @@ class Notification(Base):
     user = relationship("User", foreign_keys=[user_id])
     actor = relationship("User", foreign_keys=[actor_id])
 
+# 未読通知数（notifications.py で通知の追加/既読化と同じトランザクションで更新する。ヘッダーのバッジ用）
+class NotificationCounter(Base):
+    __tablename__ = "notification_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    unread_count = Column(Integer, default=0, nullable=False)  # DM以外の未読数
+    dm_unread_count = Column(Integer, default=0, nullable=False)  # DM（type='dm_message'）の未読数
+
 # シンプルなページビューの記録テーブル（アナリティクス用）
 class PageView(Base):
     __tablename__ = "page_views"
@@ -272,6 +291,91 @@ class BoardVisit(Base):
     board_id = Column(String(50), nullable=False, index=True)
     last_seen = Column(DateTime(timezone=True), default=jst_now, index=True)
 
+# 掲示板ごとの統計ロールアップ（/board/stats 用。書き込み時に差分更新）
+class BoardStats(Base):
+    __tablename__ = "board_stats"
+
+    board_id = Column(String(50), primary_key=True)  # 掲示板ID
+    post_count = Column(Integer, default=0, nullable=False)  # 投稿数
+    reply_count = Column(Integer, default=0, nullable=False)  # 返信数（各投稿のreply_count合計）
+    like_count = Column(Integer, default=0, nullable=False)  # いいね数（各投稿のlike_count合計）
+    participant_count = Column(Integer, default=0, nullable=False)  # 訪問したユーザー数
+    last_activity = Column(DateTime(timezone=True), nullable=True)  # 最終投稿時刻
+    updated_at = Column(DateTime(timezone=True), default=jst_now, onupdate=jst_now)
+
+# フィードのランキングパラメータ（board_ranking.py。管理者APIから変更し、定期スイープで各ワーカーに反映）
+class BoardRankingParams(Base):
+    __tablename__ = "board_ranking_params"
+
+    mode = Column(String(20), primary_key=True)  # popular / trending
+    like_weight = Column(Float, nullable=False)  # いいね1件の重み
+    reply_weight = Column(Float, nullable=False)  # 返信1件の重み
+    half_life_hours = Column(Float, nullable=False)  # この時間だけ新しい投稿と並ぶには反応が2倍必要
+    updated_at = Column(DateTime(timezone=True), default=jst_now, onupdate=jst_now)
+
+# 公開一覧系APIのバージョン番号（http_cache.py。対象テーブルを書き換えたトランザクションのコミット後に加算し、ETagに使う）
+class ResourceVersion(Base):
+    __tablename__ = "resource_versions"
+
+    resource = Column(String(50), primary_key=True)  # board / market / courses / circles
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=jst_now, onupdate=jst_now)
+
+# 正規化したハッシュタグ（board_hashtags.py が投稿の作成/編集/削除時に同期）
+class Hashtag(Base):
+    __tablename__ = "hashtags"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, nullable=False, index=True)  # 正規化済み（#なし・NFKC・小文字）
+    display_name = Column(String(101), nullable=False)  # 表示用（#付き）
+    post_count = Column(Integer, default=0, nullable=False)  # 付与されている投稿数
+    created_at = Column(DateTime(timezone=True), default=jst_now)
+
+# 投稿とハッシュタグの対応（タグ別の投稿一覧用に投稿の掲示板・作成時刻を複製）
+class PostHashtag(Base):
+    __tablename__ = "post_hashtags"
+    __table_args__ = (
+        # タグ別の投稿一覧（新しい順・キーセット）
+        Index('idx_post_hashtags_tag_created', 'hashtag_id', 'created_at', 'post_id'),
+        Index('idx_post_hashtags_tag_board_created', 'hashtag_id', 'board_id', 'created_at'),
+        UniqueConstraint('post_id', 'hashtag_id', name='uq_post_hashtags_post_tag'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    post_id = Column(Integer, ForeignKey("board_posts.id", ondelete="CASCADE"), nullable=False, index=True)
+    hashtag_id = Column(Integer, ForeignKey("hashtags.id", ondelete="CASCADE"), nullable=False)
+    board_id = Column(String(50), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)  # 投稿の作成時刻
+
+# ハッシュタグの時間別利用数（トレンド算出用。投稿作成時刻の1時間単位で集計）
+class HashtagBucket(Base):
+    __tablename__ = "hashtag_buckets"
+    __table_args__ = (
+        UniqueConstraint('hashtag_id', 'board_id', 'bucket_start', name='uq_hashtag_buckets_key'),
+        Index('idx_hashtag_buckets_start', 'bucket_start'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    hashtag_id = Column(Integer, ForeignKey("hashtags.id", ondelete="CASCADE"), nullable=False)
+    board_id = Column(String(50), nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)  # JSTの正時
+    count = Column(Integer, default=0, nullable=False)
+
+# 部分一致検索用の文字バイグラム転置インデックス（ngram_index.py が書き込み時に差分更新）
+class SearchNgram(Base):
+    __tablename__ = "search_ngrams"
+    __table_args__ = (
+        # ポスティングリストの取得用
+        Index('idx_search_ngrams_scope_gram_doc', 'scope', 'gram', 'doc_id'),
+        # 文書単位の張り替え・削除用
+        Index('idx_search_ngrams_scope_doc', 'scope', 'doc_id'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String(30), nullable=False)  # board_post / board_reply / market_item / course_summary / circle_summary
+    gram = Column(String(8), nullable=False)  # 正規化済みの2文字
+    doc_id = Column(Integer, nullable=False)  # 対象テーブルのID
+
 # =====================
 # DM（Direct Message）
 # =====================
@@ -439,3 +543,13 @@ class CircleSummaryComment(Base):
 
     summary = relationship("CircleSummary", backref="comments")
     author = relationship("User")
+
+# 画像などのバイナリ（内容のSHA-256で識別。実体は blob_store のディレクトリに保存）
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    content_type = Column(String(100), nullable=False)
+    size = Column(Integer, nullable=False)
+    thumb_sha256 = Column(String(64), nullable=True)  # サムネイル（生成できた場合のみ）
+    created_at = Column(DateTime(timezone=True), default=jst_now)
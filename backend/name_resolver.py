@@ -0,0 +1,35 @@
+"""
+匿名表示名（users.anonymous_name）→ ユーザーID の解決キャッシュ（メンション通知用）
+
+- プロセス内のLRU。存在しない名前も「なし」としてキャッシュし、同じ誤記での再検索を防ぐ
+- 表示名の登録・変更・削除時に invalidate を呼ぶ（他ワーカーの分は TTL で期限切れにする）
+"""
+
+from sqlalchemy.orm import Session
+import models
+from ttl_cache import TTLCache
+
+MAX_ENTRIES = 5000
+TTL_SECONDS = 300
+
+_cache = TTLCache(MAX_ENTRIES, TTL_SECONDS)  # name -> user_id or None
+
+def resolve_names(db: Session, names) -> dict[str, int]:
+    """表示名の集合を {表示名: user_id} に解決（存在しない名前は含めない）"""
+    hits, misses = _cache.get_many(set(names))
+    resolved: dict[str, int] = {name: user_id for name, user_id in hits.items() if user_id is not None}
+    if misses:
+        rows = db.query(models.User.anonymous_name, models.User.id).filter(
+            models.User.anonymous_name.in_(misses)
+        ).all()
+        found = {name: user_id for name, user_id in rows}
+        _cache.put_many((name, found.get(name)) for name in misses)
+        resolved.update(found)
+    return resolved
+
+def invalidate(*names) -> None:
+    """表示名の追加・変更・削除時に呼ぶ（旧名・新名の両方を渡す）"""
+    _cache.pop(*(name for name in names if name))
+
+def clear() -> None:
+    _cache.clear()
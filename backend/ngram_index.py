@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+日本語向けの文字バイグラム転置インデックス（search_ngrams テーブル）
+
+空白で分かち書きされない日本語でも部分一致の候補を索引から引けるようにする。
+外部の検索サービスは使わず、既存DBのテーブルだけで完結する。
+
+- 書き込み時に index_document / remove_document で差分更新する
+- candidate_ids は語ごとのバイグラムのポスティングリストを、件数の少ない順に積集合していく
+- バイグラムが揃っていても連続しているとは限らないため、呼び出し側で LIKE などで最終確認する
+
+使い方: python ngram_index.py [scope ...]   # 指定スコープ（省略時は全て）を再構築
+"""
+
+import unicodedata
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+import models
+
+GRAM_SIZE = 2
+# 候補集合がこの件数以下なら IN で絞り込み、超える場合はポスティング全体を取得して積集合をとる
+IN_CLAUSE_LIMIT = 1000
+# candidate_filter が IDリストを直接 IN に渡す上限（超える場合は search_ngrams へのサブクエリで絞る）
+CANDIDATE_IN_LIMIT = 2000
+# 一括INSERTのチャンクサイズ
+INSERT_CHUNK = 5000
+
+# スコープ名 -> (モデル, 索引対象のカラム名)
+SCOPES = {
+    "board_post": (models.BoardPost, ("content", "hashtags")),
+    "board_reply": (models.BoardReply, ("content",)),
+    "market_item": (models.MarketItem, ("title", "description", "category")),
+    "course_summary": (models.CourseSummary, ("title", "course_name", "instructor")),
+    "circle_summary": (models.CircleSummary, ("title", "circle_name")),
+}
+
+def normalize(value: str | None) -> str:
+    """全角/半角の揺れと大文字小文字を吸収"""
+    if not value:
+        return ""
+    return unicodedata.normalize("NFKC", value).lower()
+
+def tokens(value: str | None) -> list[str]:
+    """空白で区切った語（空白をまたぐn-gramは作らない）"""
+    return [t for t in normalize(value).split() if t]
+
+def term_grams(term: str) -> set[str]:
+    if len(term) < GRAM_SIZE:
+        return set()
+    return {term[i:i + GRAM_SIZE] for i in range(len(term) - GRAM_SIZE + 1)}
+
+def document_grams(*texts) -> set[str]:
+    grams: set[str] = set()
+    for value in texts:
+        for term in tokens(value):
+            grams |= term_grams(term)
+    return grams
+
+def _row_texts(scope: str, row) -> list:
+    _model, fields = SCOPES[scope]
+    return [getattr(row, f, None) for f in fields]
+
+# -----------------------------
+# 差分更新
+# -----------------------------
+
+def remove_documents(db: Session, scope: str, doc_ids) -> None:
+    ids = [int(i) for i in doc_ids]
+    if not ids:
+        return
+    db.query(models.SearchNgram).filter(
+        models.SearchNgram.scope == scope,
+        models.SearchNgram.doc_id.in_(ids),
+    ).delete(synchronize_session=False)
+
+def remove_document(db: Session, scope: str, doc_id: int) -> None:
+    remove_documents(db, scope, [doc_id])
+
+def index_document(db: Session, scope: str, doc_id: int, *texts) -> None:
+    """文書の索引を張り替える（コミットは呼び出し側のトランザクションに任せる）"""
+    remove_document(db, scope, doc_id)
+    grams = document_grams(*texts)
+    if grams:
+        db.execute(insert(models.SearchNgram), [
+            {"scope": scope, "gram": g, "doc_id": int(doc_id)} for g in grams
+        ])
+
+def index_row(db: Session, scope: str, row) -> None:
+    """モデルのインスタンスから索引を張り替える"""
+    index_document(db, scope, row.id, *_row_texts(scope, row))
+
+# -----------------------------
+# 検索
+# -----------------------------
+
+def candidate_ids(db: Session, scope: str, query: str) -> set[int] | None:
+    """クエリの全ての語を含みうる文書IDの集合を返す。
+
+    どの語も索引で引けない（全て1文字）場合は None を返すので、呼び出し側は従来の検索にフォールバックする。
+    """
+    grams: set[str] = set()
+    for term in tokens(query):
+        grams |= term_grams(term)
+    if not grams:
+        return None
+
+    # ポスティングリストの長さ（文書頻度）を一度に取得し、短い順に積集合をとる
+    freq_rows = db.query(models.SearchNgram.gram, func.count(models.SearchNgram.id)).filter(
+        models.SearchNgram.scope == scope,
+        models.SearchNgram.gram.in_(list(grams)),
+    ).group_by(models.SearchNgram.gram).all()
+    freqs = {gram: count for gram, count in freq_rows}
+    if len(freqs) < len(grams):
+        return set()
+
+    candidates: set[int] | None = None
+    for gram in sorted(grams, key=lambda g: freqs[g]):
+        q = db.query(models.SearchNgram.doc_id).filter(
+            models.SearchNgram.scope == scope,
+            models.SearchNgram.gram == gram,
+        )
+        if candidates is not None and len(candidates) <= IN_CLAUSE_LIMIT:
+            q = q.filter(models.SearchNgram.doc_id.in_(list(candidates)))
+        ids = {doc_id for (doc_id,) in q.all()}
+        candidates = ids if candidates is None else candidates & ids
+        if not candidates:
+            return set()
+    return candidates or set()
+
+def candidate_filter(db: Session, scope: str, query: str, id_column):
+    """id_column を候補に絞り込む条件式を返す（索引で引けない場合は None）
+
+    候補が CANDIDATE_IN_LIMIT 件を超える場合はIDを列挙せず、全てのバイグラムを持つ文書を
+    search_ngrams から集計するサブクエリにする。
+    """
+    ids = candidate_ids(db, scope, query)
+    if ids is None:
+        return None
+    if len(ids) <= CANDIDATE_IN_LIMIT:
+        return id_column.in_(sorted(ids))
+    grams: set[str] = set()
+    for term in tokens(query):
+        grams |= term_grams(term)
+    subquery = db.query(models.SearchNgram.doc_id).filter(
+        models.SearchNgram.scope == scope,
+        models.SearchNgram.gram.in_(list(grams)),
+    ).group_by(models.SearchNgram.doc_id).having(
+        func.count(func.distinct(models.SearchNgram.gram)) == len(grams)
+    )
+    return id_column.in_(subquery.subquery().select())
+
+# -----------------------------
+# 再構築
+# -----------------------------
+
+def rebuild(db: Session, scope: str) -> int:
+    """スコープの索引を元テーブルから作り直す。索引した文書数を返す"""
+    model, fields = SCOPES[scope]
+    db.query(models.SearchNgram).filter(models.SearchNgram.scope == scope).delete(synchronize_session=False)
+    columns = [model.id] + [getattr(model, f) for f in fields]
+    count = 0
+    buffer = []
+    for row in db.query(*columns).yield_per(1000):
+        doc_id, texts = row[0], row[1:]
+        buffer.extend({"scope": scope, "gram": g, "doc_id": doc_id} for g in document_grams(*texts))
+        count += 1
+        if len(buffer) >= INSERT_CHUNK:
+            db.execute(insert(models.SearchNgram), buffer)
+            buffer = []
+    if buffer:
+        db.execute(insert(models.SearchNgram), buffer)
+    return count
+
+def ensure_index(db: Session) -> None:
+    """起動時の初期化: 索引が空で元データがあるスコープだけ構築する"""
+    for scope, (model, _fields) in SCOPES.items():
+        indexed = db.query(models.SearchNgram.id).filter(models.SearchNgram.scope == scope).first() is not None
+        if indexed or db.query(model.id).first() is None:
+            continue
+        count = rebuild(db, scope)
+        db.commit()
+        print(f"✅ n-gram索引を構築しました: {scope}（{count}件）")
+
+if __name__ == "__main__":
+    import sys
+    import database
+    models.Base.metadata.create_all(bind=database.engine)
+    targets = sys.argv[1:] or list(SCOPES.keys())
+    session = database.SessionLocal()
+    try:
+        for target in targets:
+            if target not in SCOPES:
+                print(f"❌ 不明なスコープ: {target}（{', '.join(SCOPES)}）")
+                continue
+            count = rebuild(session, target)
+            session.commit()
+            print(f"✅ n-gram索引を再構築しました: {target}（{count}件）")
+    finally:
+        session.close()
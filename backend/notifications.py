@@ -0,0 +1,338 @@
+"""
+通知の追加（アウトボックス経由の非同期書き込み）・既読化と未読数カウンタ（notification_counters）
+
+- リクエスト処理からは enqueue / enqueue_many で通知イベントをセッションに積むだけにする
+  （INSERT や追加のコミットを書き込み経路に載せない）
+- セッションのコミット後にプロセス内のアウトボックスへ移し（ロールバックされたら捨てる）、
+  バックグラウンドの flush_loop が一定間隔（FLUSH_INTERVAL_SECONDS）でまとめて deliver する
+- deliver はバッチ内の同じ通知を1件にまとめ、いいね系は未読の同じ通知が既にあれば追加せず、
+  残りを一括 INSERT して受信者ごとの未読数を加算する
+- NOTIFICATION_DELIVERY=sync（または set_sync(True)）では enqueue がその場で deliver する
+  （同じトランザクションで書き込むため、テストではリクエスト直後に通知を確認できる）
+- 終了時は flush でアウトボックスを書き出す。まとめての書き込みに失敗したら1件ずつ書き込み直し、
+  失敗した行だけアウトボックスへ戻す（MAX_ATTEMPTS 回失敗した行は捨ててログに残す。
+  DB接続の障害（OperationalError）は行の不良ではないので回数に数えない）
+- アウトボックスは OUTBOX_LIMIT 件までで、超えた分は古いものから捨てる
+- 既読化（1件 / すべて）は実際に未読から既読に変わった行数だけ減算する
+- ヘッダーのバッジは unread_counts（主キーでの1行読み込み）で取得する
+- 通知をまとめて削除する場合は delete_matching を使い、影響した受信者の未読数を数え直す
+DMの通知（type='dm_message'）はバッジを分けて表示するため別の列で数える。
+flush 以外のコミットはいずれも呼び出し側に任せる。
+"""
+
+import asyncio
+import os
+import threading
+from sqlalchemy import case, event, func, insert, tuple_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+import database
+import models
+
+DM_TYPE = "dm_message"
+# 同じ通知が未読で残っていれば追加しない種類（いいねの付け外しの繰り返しで通知を増やさない）
+DEDUP_UNREAD_TYPES = {"reply_liked", "market_comment_liked"}
+
+FLUSH_INTERVAL_SECONDS = 2
+# 1回の INSERT 文に含める行数
+INSERT_CHUNK = 500
+# 1行の書き込みを試みる回数の上限（超えたら捨てる）
+MAX_ATTEMPTS = 5
+# アウトボックスに溜める件数の上限（DB障害が続いてもメモリを使い切らない）
+OUTBOX_LIMIT = 50_000
+
+_INFO_KEY = "notification_outbox"
+_sync = os.getenv("NOTIFICATION_DELIVERY", "async").lower() == "sync"
+_lock = threading.Lock()
+_outbox: list[tuple[dict, int]] = []  # (通知の行, 失敗回数)
+
+def _added(column, delta: int):
+    """0未満にしない加減算"""
+    if delta >= 0:
+        return column + delta
+    return case((column + delta < 0, 0), else_=column + delta)
+
+def bump(db: Session, user_id: int, unread: int = 0, dm: int = 0) -> None:
+    """受信者の未読数をDB側で加減算する（行がなければ作成）"""
+    if not user_id or not (unread or dm):
+        return
+    table = models.NotificationCounter.__table__
+    insert_fn = database.dialect_insert(db)
+    if insert_fn is not None:
+        stmt = insert_fn(table).values(user_id=user_id, unread_count=max(unread, 0), dm_unread_count=max(dm, 0))
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={
+                "unread_count": _added(table.c.unread_count, unread),
+                "dm_unread_count": _added(table.c.dm_unread_count, dm),
+            },
+        ))
+        return
+    if db.get(models.NotificationCounter, user_id) is None:
+        db.add(models.NotificationCounter(user_id=user_id, unread_count=0, dm_unread_count=0))
+        db.flush()
+    db.query(models.NotificationCounter).filter(models.NotificationCounter.user_id == user_id).update({
+        models.NotificationCounter.unread_count: _added(models.NotificationCounter.unread_count, unread),
+        models.NotificationCounter.dm_unread_count: _added(models.NotificationCounter.dm_unread_count, dm),
+    }, synchronize_session=False)
+
+def _bump_for_types(db: Session, user_id: int, types, sign: int = 1) -> None:
+    dm = sum(1 for t in types if t == DM_TYPE)
+    bump(db, user_id, unread=sign * (len(types) - dm), dm=sign * dm)
+
+# -----------------------------
+# 追加（アウトボックス）
+# -----------------------------
+
+def set_sync(enabled: bool) -> None:
+    """同期モードの切り替え（テスト用。有効な間は enqueue がその場で書き込む）"""
+    global _sync
+    _sync = bool(enabled)
+
+def enqueue(
+    db: Session,
+    user_id: int,
+    actor_id: int | None,
+    type: str,
+    entity_type: str,
+    entity_id: int,
+    title: str | None = None,
+    message: str | None = None,
+) -> None:
+    """通知を1件積む（セッションのコミット後に配信される）"""
+    enqueue_many(db, [{
+        "user_id": user_id,
+        "actor_id": actor_id,
+        "type": type,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "title": title,
+        "message": message,
+    }])
+
+def enqueue_many(db: Session, rows: list[dict]) -> None:
+    """通知をまとめて積む（rows は Notification の列名の dict。created_at は書き込み時に付ける）"""
+    rows = [{**row, "is_read": False} for row in rows if row.get("user_id")]
+    if not rows:
+        return
+    if _sync:
+        deliver(db, rows)
+        return
+    db.info.setdefault(_INFO_KEY, []).extend(rows)
+
+def _key(row: dict) -> tuple:
+    return (row["user_id"], row.get("actor_id"), row["type"], row["entity_type"], row["entity_id"], row.get("message"))
+
+def _unread_duplicates(db: Session, rows: list[dict]) -> set[tuple]:
+    """DEDUP_UNREAD_TYPES の通知のうち、未読の同じ通知が既にあるもののキー"""
+    candidates = [row for row in rows if row["type"] in DEDUP_UNREAD_TYPES]
+    if not candidates:
+        return set()
+    n = models.Notification
+    existing = db.query(n.user_id, n.actor_id, n.type, n.entity_type, n.entity_id, n.message).filter(
+        n.is_read == False,
+        n.type.in_(sorted({row["type"] for row in candidates})),
+        tuple_(n.user_id, n.entity_type, n.entity_id).in_(
+            sorted({(row["user_id"], row["entity_type"], row["entity_id"]) for row in candidates})
+        ),
+    ).all()
+    return {tuple(row) for row in existing}
+
+def _drop_deleted_users(db: Session, rows: list[dict]) -> list[dict]:
+    """積んでから書き込むまでに削除されたユーザー宛ての通知を除く（行為者が削除済みなら actor_id を外す）"""
+    user_ids = {row["user_id"] for row in rows} | {row["actor_id"] for row in rows if row.get("actor_id")}
+    live = {user_id for (user_id,) in db.query(models.User.id).filter(models.User.id.in_(user_ids)).all()}
+    return [
+        {**row, "actor_id": row.get("actor_id") if row.get("actor_id") in live else None}
+        for row in rows if row["user_id"] in live
+    ]
+
+def deliver(db: Session, rows: list[dict]) -> int:
+    """通知を重複を除いて一括 INSERT し、受信者ごとの未読数を加算する。追加した件数を返す"""
+    unique: dict[tuple, dict] = {}
+    for row in _drop_deleted_users(db, rows):
+        unique.setdefault(_key(row), row)
+    duplicates = _unread_duplicates(db, list(unique.values()))
+    rows = [row for key, row in unique.items() if key not in duplicates]
+    if not rows:
+        return 0
+    # created_at は積んだ時刻ではなく書き込む時刻にする（再試行で遅れて書き込まれた通知が、
+    # 既に取得済みの通知より古い時刻になって since での取得から漏れないように）
+    now = models.jst_now()
+    rows = [{**row, "created_at": now} for row in rows]
+    for i in range(0, len(rows), INSERT_CHUNK):
+        db.execute(insert(models.Notification), rows[i:i + INSERT_CHUNK])
+    by_user: dict[int, list[str]] = {}
+    for row in rows:
+        by_user.setdefault(row["user_id"], []).append(row["type"])
+    for user_id, types in by_user.items():
+        _bump_for_types(db, user_id, types)
+    return len(rows)
+
+def _push(entries: list[tuple[dict, int]], front: bool = False) -> None:
+    """アウトボックスへ入れる（_lock の中で呼ぶ）。OUTBOX_LIMIT を超えた分は古いものから捨てる"""
+    global _outbox
+    _outbox = entries + _outbox if front else _outbox + entries
+    overflow = len(_outbox) - OUTBOX_LIMIT
+    if overflow > 0:
+        del _outbox[:overflow]
+        print(f"❌ 通知のアウトボックスが上限（{OUTBOX_LIMIT}件）を超えたため古い{overflow}件を破棄")
+
+def _deliver_committed(session_factory, rows: list[dict]) -> int:
+    db = session_factory()
+    try:
+        delivered = deliver(db, rows)
+        db.commit()
+        return delivered
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def flush(session_factory) -> int:
+    """アウトボックスの通知を書き込む。追加した件数を返す（失敗した分はアウトボックスへ戻す）"""
+    global _outbox
+    with _lock:
+        entries, _outbox = _outbox, []
+    if not entries:
+        return 0
+
+    try:
+        return _deliver_committed(session_factory, [row for row, _ in entries])
+    except OperationalError as e:
+        print(f"⚠️ 通知の書き込みに失敗（次回に再試行）: {e}")
+        with _lock:
+            _push(entries, front=True)
+        return 0
+    except Exception as e:
+        print(f"⚠️ 通知の一括書き込みに失敗（1件ずつ再試行）: {e}")
+
+    # 書き込めない行（不正な値など）がほかの通知を止めないよう1件ずつ書き込む
+    delivered = 0
+    retry: list[tuple[dict, int]] = []
+    for index, (row, attempts) in enumerate(entries):
+        try:
+            delivered += _deliver_committed(session_factory, [row])
+        except OperationalError as e:
+            print(f"⚠️ 通知の書き込みに失敗（次回に再試行）: {e}")
+            retry.extend(entries[index:])
+            break
+        except Exception as e:
+            attempts += 1
+            if attempts >= MAX_ATTEMPTS:
+                print(f"❌ 通知を破棄（{attempts}回失敗）: user_id={row.get('user_id')} type={row.get('type')}: {e}")
+            else:
+                retry.append((row, attempts))
+    if retry:
+        with _lock:
+            _push(retry, front=True)
+    return delivered
+
+async def flush_loop(session_factory) -> None:
+    """FLUSH_INTERVAL_SECONDS ごとに flush（DB処理はスレッドで実行）"""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+        await asyncio.to_thread(flush, session_factory)
+
+def _after_commit(session):
+    # セーブポイントの解放でも呼ばれるため、外側のトランザクションのコミットだけを扱う
+    if session.in_nested_transaction():
+        return
+    rows = session.info.pop(_INFO_KEY, None)
+    if rows:
+        with _lock:
+            _push([(row, 0) for row in rows])
+
+def _after_transaction_end(session, transaction):
+    # ロールバックされた（コミットされなかった）通知は捨てる
+    if transaction.parent is None:
+        session.info.pop(_INFO_KEY, None)
+
+def install(session_factory) -> None:
+    """sessionmaker にイベントを登録する"""
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_transaction_end", _after_transaction_end)
+
+# -----------------------------
+# 既読化と件数
+# -----------------------------
+
+def mark_read(db: Session, notif: models.Notification) -> bool:
+    """1件を既読にする（未読だった場合だけ減算。並行した既読化でも二重に減らさない）"""
+    updated = db.query(models.Notification).filter(
+        models.Notification.id == notif.id,
+        models.Notification.is_read == False,
+    ).update({models.Notification.is_read: True}, synchronize_session=False)
+    if updated:
+        _bump_for_types(db, notif.user_id, [notif.type], sign=-1)
+    notif.is_read = True
+    return bool(updated)
+
+def mark_all_read(db: Session, user_id: int) -> int:
+    """受信者の未読通知をすべて既読にして、既読にした件数を返す"""
+    base = db.query(models.Notification).filter(
+        models.Notification.user_id == user_id,
+        models.Notification.is_read == False,
+    )
+    dm = base.filter(models.Notification.type == DM_TYPE).update(
+        {models.Notification.is_read: True}, synchronize_session=False
+    )
+    others = base.filter(models.Notification.type != DM_TYPE).update(
+        {models.Notification.is_read: True}, synchronize_session=False
+    )
+    bump(db, user_id, unread=-others, dm=-dm)
+    return dm + others
+
+def unread_counts(db: Session, user_id: int) -> dict:
+    counter = db.get(models.NotificationCounter, user_id)
+    unread = int(counter.unread_count or 0) if counter else 0
+    dm = int(counter.dm_unread_count or 0) if counter else 0
+    return {"unread_count": unread, "dm_unread_count": dm, "total": unread + dm}
+
+# -----------------------------
+# 削除と数え直し
+# -----------------------------
+
+def recount(db: Session, user_ids=None) -> int:
+    """通知テーブルから未読数を数え直す（user_ids=None は全員）。数え直した受信者数を返す"""
+    is_dm = models.Notification.type == DM_TYPE
+    query = db.query(
+        models.Notification.user_id,
+        func.sum(case((is_dm, 0), else_=1)),
+        func.sum(case((is_dm, 1), else_=0)),
+    ).filter(models.Notification.is_read == False)
+    counters = db.query(models.NotificationCounter)
+    if user_ids is not None:
+        ids = list({int(i) for i in user_ids if i})
+        if not ids:
+            return 0
+        query = query.filter(models.Notification.user_id.in_(ids))
+        counters = counters.filter(models.NotificationCounter.user_id.in_(ids))
+    rows = query.group_by(models.Notification.user_id).all()
+    counters.delete(synchronize_session=False)
+    db.add_all([
+        models.NotificationCounter(user_id=user_id, unread_count=int(unread or 0), dm_unread_count=int(dm or 0))
+        for user_id, unread, dm in rows
+    ])
+    db.flush()
+    return len(rows)
+
+def delete_matching(db: Session, *criteria) -> int:
+    """条件に合う通知を削除し、未読が含まれていた受信者の未読数を数え直す"""
+    affected = [user_id for (user_id,) in db.query(models.Notification.user_id).filter(
+        *criteria, models.Notification.is_read == False
+    ).distinct().all()]
+    deleted = db.query(models.Notification).filter(*criteria).delete(synchronize_session=False)
+    if affected:
+        recount(db, affected)
+    return deleted
+
+def ensure_counters(db: Session) -> None:
+    """起動時の初期化: カウンタが空で通知がある場合は全員分を数え直す"""
+    has_counters = db.query(models.NotificationCounter.user_id).first() is not None
+    has_notifications = db.query(models.Notification.id).first() is not None
+    if not has_counters and has_notifications:
+        count = recount(db)
+        print(f"✅ 未読通知数を初期構築しました（{count}ユーザー）")
+    db.commit()
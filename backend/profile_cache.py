@@ -0,0 +1,95 @@
+"""
+ユーザーの公開プロフィール（一覧の投稿者欄・/users/public 用）のプロセス内キャッシュ
+
+- 一覧では表示分の投稿者IDをまとめて get_profiles() に渡し、未キャッシュ分だけ1クエリで読み込む
+  （post.author などのリレーションを行ごとに遅延ロードしない）
+- 容量上限付きのLRU＋TTL。プロフィール変更・匿名名の付与・アカウント削除時は invalidate() を呼ぶ
+  （他ワーカーの分は TTL で期限切れにする）
+- プロフィール画像は参照（URL等の短い値）だけを保持する。DataURL のような大きな値は has_image のみ記録し、
+  必要なときに profile_image() で個別に読み込む
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+import models
+from ttl_cache import TTLCache
+
+MAX_ENTRIES = 5000
+TTL_SECONDS = 300
+# これより長い profile_image はキャッシュに載せない（DataURL 等）
+IMAGE_REF_MAX_LENGTH = 512
+
+@dataclass(frozen=True)
+class Profile:
+    id: int
+    anonymous_name: Optional[str]
+    university: Optional[str]
+    year: Optional[str]
+    department: Optional[str]
+    bio: Optional[str]
+    profile_image_ref: Optional[str]  # 短い参照（URL等）のみ
+    has_image: bool
+
+_cache = TTLCache(MAX_ENTRIES, TTL_SECONDS)  # user_id -> Profile
+
+def _load(db: Session, user_ids: list[int]) -> list[Profile]:
+    image = models.User.profile_image
+    rows = db.query(
+        models.User.id,
+        models.User.anonymous_name,
+        models.User.university,
+        models.User.year,
+        models.User.department,
+        models.User.bio,
+        case((func.length(image) <= IMAGE_REF_MAX_LENGTH, image), else_=None).label("image_ref"),
+        image.isnot(None).label("has_image"),
+    ).filter(models.User.id.in_(user_ids)).all()
+    return [
+        Profile(
+            id=row.id,
+            anonymous_name=row.anonymous_name,
+            university=row.university,
+            year=row.year,
+            department=row.department,
+            bio=row.bio,
+            profile_image_ref=row.image_ref,
+            has_image=bool(row.has_image),
+        )
+        for row in rows
+    ]
+
+def get_profiles(db: Session, user_ids) -> dict[int, Profile]:
+    """ユーザーIDの集合を {user_id: Profile} に解決（存在しないIDは含めない）"""
+    profiles, misses = _cache.get_many({int(i) for i in user_ids if i is not None})
+    if misses:
+        loaded = _load(db, misses)
+        _cache.put_many((p.id, p) for p in loaded)
+        profiles.update({p.id: p for p in loaded})
+    return profiles
+
+def get_profile(db: Session, user_id) -> Optional[Profile]:
+    if user_id is None:
+        return None
+    return get_profiles(db, [user_id]).get(int(user_id))
+
+def profile_image(db: Session, profile: Profile) -> Optional[str]:
+    """プロフィール画像の値（キャッシュにない大きな値はここで読み込む）"""
+    if profile.profile_image_ref is not None or not profile.has_image:
+        return profile.profile_image_ref
+    return db.query(models.User.profile_image).filter(models.User.id == profile.id).scalar()
+
+def author_fields(profile: Optional[Profile]) -> dict:
+    """一覧レスポンスの投稿者欄（退会済みなどで見つからなければ None）"""
+    return {
+        "author_year": profile.year if profile else None,
+        "author_department": profile.department if profile else None,
+    }
+
+def invalidate(*user_ids) -> None:
+    """プロフィール変更・匿名名の付与・削除時に呼ぶ"""
+    _cache.pop(*(int(user_id) for user_id in user_ids if user_id is not None))
+
+def clear() -> None:
+    _cache.clear()
@@ -0,0 +1,178 @@
+"""
+既読マーカー（返信一覧の最終閲覧 board_replies_view / 掲示板の最終訪問 board_visits）の書き込み遅延バッファ
+
+GET のたびに upsert＋コミットしていた処理をメモリ上のバッファに置き換える。
+- キー（ユーザー×投稿 / ユーザー×掲示板）ごとに最大の時刻だけを保持して合流させる
+- 一定間隔（FLUSH_INTERVAL_SECONDS）と終了時に一括 upsert する
+- 新規の訪問行は flush 時に判定し、board_stats の参加者数を加算する
+- 未反映の値は pending_* で参照でき、同じワーカー内では即座に読み取りへ反映できる
+"""
+
+import asyncio
+import threading
+from sqlalchemy.orm import Session
+import database
+import models
+import board_stats
+
+FLUSH_INTERVAL_SECONDS = 5
+# 1回の INSERT 文に含める行数
+UPSERT_CHUNK = 500
+
+_lock = threading.Lock()
+_reply_views: dict[tuple[int, int], object] = {}  # (user_id, post_id) -> last_viewed_at
+_visits: dict[tuple[int, str], object] = {}  # (user_id, board_id) -> last_seen
+
+def _aware(dt):
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=models.JST)
+    return dt
+
+def _keep_max(buffer: dict, key, at) -> None:
+    current = buffer.get(key)
+    if current is None or at > current:
+        buffer[key] = at
+
+def mark_replies_viewed(user_id: int, post_id: int, at=None) -> None:
+    if not user_id:
+        return
+    at = _aware(at) or models.jst_now()
+    with _lock:
+        _keep_max(_reply_views, (int(user_id), int(post_id)), at)
+
+def mark_board_visited(user_id: int, board_id, at=None) -> None:
+    if not user_id:
+        return
+    at = _aware(at) or models.jst_now()
+    with _lock:
+        _keep_max(_visits, (int(user_id), str(board_id)), at)
+
+def pending_reply_views(user_id: int | None, post_ids) -> dict[int, object]:
+    """未反映の最終閲覧時刻 {post_id: 時刻}"""
+    if not user_id:
+        return {}
+    with _lock:
+        return {pid: _reply_views[(int(user_id), pid)] for pid in post_ids if (int(user_id), pid) in _reply_views}
+
+def pending_visit(user_id: int | None, board_id):
+    if not user_id:
+        return None
+    with _lock:
+        return _visits.get((int(user_id), str(board_id)))
+
+def effective_time(stored, pending):
+    """DBの値と未反映の値の新しい方"""
+    stored = _aware(stored)
+    if pending is None:
+        return stored
+    if stored is None or pending > stored:
+        return pending
+    return stored
+
+# -----------------------------
+# flush
+# -----------------------------
+
+def _chunks(rows: list, size: int = UPSERT_CHUNK):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def _upsert_reply_views(db: Session, rows: list[dict]) -> None:
+    insert, greatest = database.dialect_insert(db), database.dialect_greatest(db)
+    table = models.BoardRepliesView.__table__
+    if insert is None:
+        for row in rows:
+            view = db.query(models.BoardRepliesView).filter(
+                models.BoardRepliesView.user_id == row["user_id"],
+                models.BoardRepliesView.post_id == row["post_id"],
+            ).first()
+            if view:
+                view.last_viewed_at = effective_time(view.last_viewed_at, row["last_viewed_at"])
+            else:
+                db.add(models.BoardRepliesView(**row))
+        return
+    for chunk in _chunks(rows):
+        stmt = insert(table).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.post_id],
+            set_={"last_viewed_at": greatest(table.c.last_viewed_at, stmt.excluded.last_viewed_at)},
+        )
+        db.execute(stmt)
+
+def _upsert_visits(db: Session, rows: list[dict]) -> dict[str, int]:
+    """訪問記録を upsert し、新規に作成した行数を掲示板ごとに返す"""
+    insert, greatest = database.dialect_insert(db), database.dialect_greatest(db)
+    table = models.BoardVisit.__table__
+    created: dict[str, int] = {}
+    if insert is None:
+        for row in rows:
+            visit = db.query(models.BoardVisit).filter(
+                models.BoardVisit.user_id == row["user_id"],
+                models.BoardVisit.board_id == row["board_id"],
+            ).first()
+            if visit:
+                visit.last_seen = effective_time(visit.last_seen, row["last_seen"])
+            else:
+                db.add(models.BoardVisit(**row))
+                created[row["board_id"]] = created.get(row["board_id"], 0) + 1
+        return created
+    for chunk in _chunks(rows):
+        # まず新規分だけ挿入して、作成された行を RETURNING で確定させる（並行ワーカーとの二重加算を防ぐ）
+        inserted = db.execute(
+            insert(table).values(chunk).on_conflict_do_nothing(
+                index_elements=[table.c.user_id, table.c.board_id]
+            ).returning(table.c.user_id, table.c.board_id)
+        ).fetchall()
+        inserted_keys = {(u, b) for u, b in inserted}
+        for _user_id, board_id in inserted_keys:
+            created[board_id] = created.get(board_id, 0) + 1
+        existing = [r for r in chunk if (r["user_id"], r["board_id"]) not in inserted_keys]
+        if existing:
+            stmt = insert(table).values(existing)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.user_id, table.c.board_id],
+                set_={"last_seen": greatest(table.c.last_seen, stmt.excluded.last_seen)},
+            )
+            db.execute(stmt)
+    return created
+
+def flush(session_factory) -> int:
+    """バッファの内容をDBへ書き込む。書き込んだキー数を返す（失敗した分はバッファへ戻す）"""
+    global _reply_views, _visits
+    with _lock:
+        reply_views, _reply_views = _reply_views, {}
+        visits, _visits = _visits, {}
+    if not reply_views and not visits:
+        return 0
+
+    db = session_factory()
+    try:
+        if reply_views:
+            _upsert_reply_views(db, [
+                {"user_id": u, "post_id": p, "last_viewed_at": at} for (u, p), at in reply_views.items()
+            ])
+        if visits:
+            created = _upsert_visits(db, [
+                {"user_id": u, "board_id": b, "last_seen": at} for (u, b), at in visits.items()
+            ])
+            for board_id, count in created.items():
+                board_stats.bump(db, board_id, participants=count)
+        db.commit()
+        return len(reply_views) + len(visits)
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ 既読マーカーの書き込みに失敗（次回に再試行）: {e}")
+        with _lock:
+            for key, at in reply_views.items():
+                _keep_max(_reply_views, key, at)
+            for key, at in visits.items():
+                _keep_max(_visits, key, at)
+        return 0
+    finally:
+        db.close()
+
+async def flush_loop(session_factory) -> None:
+    """FLUSH_INTERVAL_SECONDS ごとに flush（DB処理はスレッドで実行）"""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+        await asyncio.to_thread(flush, session_factory)
@@ -66,6 +66,7 @@ class MarketItemResponse(BaseModel):
     condition: str
     category: str
     images: List[str]
+    thumbnails: List[str] = []  # images と同じ順のサムネイルURL（blob 以外の画像は元のURL）
     author_name: str
     university: str
     contact_method: str
@@ -96,6 +97,8 @@ class MarketItemCommentResponse(BaseModel):
     content: str
     author_name: str
     created_at: str
+    like_count: int = 0
+    is_liked: bool = False
 
 class NotificationResponse(BaseModel):
     id: int
@@ -133,6 +136,11 @@ class BoardPostUpdate(BaseModel):
     content: Optional[str] = None
     hashtags: Optional[str] = None
 
+class BoardRankingParamsUpdate(BaseModel):
+    like_weight: Optional[float] = None  # いいね1件の重み（0以上）
+    reply_weight: Optional[float] = None  # 返信1件の重み（0以上）
+    half_life_hours: Optional[float] = None  # 減衰の半減期（時間、0より大きい）
+
 class BoardReplyCreate(BaseModel):
     content: str
 
@@ -0,0 +1,21 @@
+import os
+import sys
+
+# backend/ のモジュール（models, like_service など）をそのまま import できるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import models
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """テストごとのファイル SQLite（全テーブル作成済み）の sessionmaker"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    models.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
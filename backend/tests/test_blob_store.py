@@ -0,0 +1,122 @@
+"""
+blob_store / blob_routes のテスト
+
+- 配信の Range 対応（206 / 416 / 解釈できない指定は全体）
+- 起動時の DataURL 移行（market_items.images / users.profile_image）
+- サムネイル生成（Pillow がない環境ではスキップ）
+
+実行: cd backend && python -m pytest tests
+"""
+
+import base64
+import io
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import models
+import database
+import blob_store
+import blob_routes
+
+DATA = bytes(range(10))
+
+@pytest.fixture
+def blob_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(blob_store, "PUBLIC_BASE_URL", "")
+
+@pytest.fixture
+def client(session_factory, blob_dir):
+    app = FastAPI()
+    app.include_router(blob_routes.router)
+
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+    app.dependency_overrides[database.get_db] = get_db
+    return TestClient(app)
+
+def _put(session_factory, data: bytes = DATA, content_type: str = "image/gif") -> str:
+    with session_factory() as db:
+        blob = blob_store.put_bytes(db, data, content_type)
+        db.commit()
+        return blob.sha256
+
+def _data_url(data: bytes, content_type: str = "image/gif") -> str:
+    return f"data:{content_type};base64,{base64.b64encode(data).decode()}"
+
+@pytest.mark.parametrize("range_header, start, end", [
+    ("bytes=0-3", 0, 3),
+    ("bytes=4-", 4, 9),
+    ("bytes=-2", 8, 9),
+    ("bytes=5-100", 5, 9),
+])
+def test_range_returns_partial_content(client, session_factory, range_header, start, end):
+    sha = _put(session_factory)
+    res = client.get(f"/blobs/{sha}", headers={"Range": range_header})
+    assert res.status_code == 206
+    assert res.content == DATA[start:end + 1]
+    assert res.headers["content-range"] == f"bytes {start}-{end}/{len(DATA)}"
+    assert res.headers["accept-ranges"] == "bytes"
+
+def test_range_beyond_end_is_not_satisfiable(client, session_factory):
+    sha = _put(session_factory)
+    res = client.get(f"/blobs/{sha}", headers={"Range": "bytes=10-"})
+    assert res.status_code == 416
+    assert res.headers["content-range"] == f"bytes */{len(DATA)}"
+
+@pytest.mark.parametrize("range_header", ["bytes=0-1,4-5", "items=0-1", "bytes=a-b"])
+def test_unparsable_range_returns_whole_blob(client, session_factory, range_header):
+    sha = _put(session_factory)
+    res = client.get(f"/blobs/{sha}", headers={"Range": range_header})
+    assert res.status_code == 200
+    assert res.content == DATA
+
+def test_extract_data_urls_moves_images_to_the_store(session_factory, blob_dir):
+    other = b"other image"
+    with session_factory() as db:
+        user = models.User(email="b@example.ac.jp", anonymous_name="b", profile_image=_data_url(other, "image/png"))
+        broken = models.User(email="c@example.ac.jp", anonymous_name="c", profile_image="data:image/png;base64")
+        db.add_all([user, broken])
+        db.flush()
+        item = models.MarketItem(
+            title="item", description="d", type="sell", condition="good", category="教科書",
+            author_id=user.id, author_name="b", contact_method="dm",
+            images=json.dumps([_data_url(DATA), "https://example.com/a.jpg", _data_url(b"x", "text/plain")]),
+        )
+        db.add(item)
+        db.commit()
+        item_id, user_id, broken_id = item.id, user.id, broken.id
+
+    moved = blob_store.extract_data_urls(session_factory)
+    assert moved == {"market_items": 1, "users": 2}
+
+    with session_factory() as db:
+        images = json.loads(db.get(models.MarketItem, item_id).images)
+        # 変換できない DataURL は除外し、外部URLはそのまま残す
+        assert images[1:] == ["https://example.com/a.jpg"]
+        assert blob_store.read_bytes(blob_store.sha_of_ref(images[0])) == DATA
+        profile = db.get(models.User, user_id).profile_image
+        assert blob_store.read_bytes(blob_store.sha_of_ref(profile)) == other
+        assert db.get(models.User, broken_id).profile_image is None
+
+    # 移行済みなら対象なし
+    assert blob_store.extract_data_urls(session_factory) == {"market_items": 0, "users": 0}
+
+def test_put_bytes_creates_thumbnail(client, session_factory):
+    Image = pytest.importorskip("PIL.Image")
+    out = io.BytesIO()
+    Image.new("RGB", (800, 600), "red").save(out, format="JPEG")
+    sha = _put(session_factory, out.getvalue(), "image/jpeg")
+
+    with session_factory() as db:
+        thumb = db.get(models.Blob, db.get(models.Blob, sha).thumb_sha256)
+        assert thumb is not None and thumb.content_type == "image/jpeg"
+    res = client.get(f"/blobs/{sha}/thumb")
+    assert res.status_code == 200
+    with Image.open(io.BytesIO(res.content)) as img:
+        assert max(img.size) == blob_store.THUMB_MAX_PX
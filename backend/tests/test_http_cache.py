@@ -0,0 +1,57 @@
+"""
+http_cache のバージョン加算のテスト
+
+書き込みのトランザクションの中では resource_versions を更新せず、
+コミットの後に別のトランザクションで加算することを確かめる。
+
+実行: cd backend && python -m pytest tests
+"""
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+import models
+import http_cache
+
+def _versions(db) -> dict:
+    return dict(db.query(models.ResourceVersion.resource, models.ResourceVersion.version).all())
+
+def test_versions_are_bumped_after_the_write_commits(session_factory):
+    http_cache.install(session_factory)
+    with session_factory() as db:
+        http_cache.ensure_versions(db)
+        before = _versions(db)
+
+    engine = session_factory.kw["bind"]
+    log: list[str] = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: log.append(statement))
+    event.listen(engine, "commit", lambda conn: log.append("COMMIT"))
+
+    with session_factory() as db:
+        db.add(models.BoardPost(board_id="1", content="post", author_id=1, author_name="a"))
+        db.commit()
+        after = _versions(db)
+
+    assert after["board"] == before["board"] + 1
+    assert after["market"] == before["market"]
+    insert_at = next(i for i, s in enumerate(log) if s.startswith("INSERT INTO board_posts"))
+    bump_at = next(i for i, s in enumerate(log) if s.startswith("UPDATE resource_versions"))
+    assert "COMMIT" in log[insert_at:bump_at]
+
+def test_bump_does_not_need_a_second_connection(tmp_path):
+    # 接続1本のプールでも、書き込みの接続を返してから加算するので待ち合わせにならない
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool, pool_size=1, max_overflow=0, pool_timeout=1,
+    )
+    models.Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    http_cache.install(factory)
+    try:
+        with factory() as db:
+            http_cache.ensure_versions(db)
+            before = _versions(db)
+            db.add(models.BoardPost(board_id="1", content="post", author_id=1, author_name="a"))
+            db.commit()
+            assert _versions(db)["board"] == before["board"] + 1
+    finally:
+        engine.dispose()
@@ -0,0 +1,114 @@
+"""
+like_service.toggle_like の並行実行テスト
+
+ファイルの SQLite に対して複数スレッドから同時にいいねを切り替え、
+最終的な like_count がいいね行の件数と一致すること（加減算の取りこぼし・二重計上がないこと）を確かめる。
+TEST_DATABASE_URL を指定すると、そのDB（PostgreSQL など。テーブルは作成・削除される）で実行する。
+
+実行: cd backend && python -m pytest tests
+"""
+
+import os
+import threading
+import pytest
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+import models
+import like_service
+
+USERS = 6
+THREADS_PER_USER = 2  # 同じユーザーの切り替えも競合させる
+TOGGLES = 15
+
+# (対象モデル, いいねモデル, いいね側の列名)
+TARGETS = [
+    (models.BoardPost, models.BoardPostLike, "post_id"),
+    (models.BoardReply, models.BoardReplyLike, "reply_id"),
+    (models.MarketItem, models.MarketItemLike, "item_id"),
+    (models.CourseSummary, models.CourseSummaryLike, "summary_id"),
+]
+
+@pytest.fixture
+def session_factory(tmp_path):
+    url = os.getenv("TEST_DATABASE_URL")
+    if url:
+        engine = create_engine(url, pool_size=USERS * THREADS_PER_USER)
+    else:
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'likes.db'}",
+            connect_args={"check_same_thread": False, "timeout": 30},
+        )
+    models.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    if url:
+        models.Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+def _seed(db) -> tuple[list[int], dict]:
+    users = [models.User(email=f"user{i}@example.ac.jp", anonymous_name=f"user{i}") for i in range(USERS)]
+    db.add_all(users)
+    db.flush()
+    author = users[0]
+    post = models.BoardPost(board_id="1", content="post", author_id=author.id, author_name="a")
+    db.add(post)
+    db.flush()
+    reply = models.BoardReply(post_id=post.id, content="reply", author_id=author.id, author_name="a")
+    item = models.MarketItem(
+        title="item", description="d", type="sell", condition="good", category="教科書",
+        author_id=author.id, author_name="a", contact_method="dm",
+    )
+    summary = models.CourseSummary(title="summary", content="c", author_id=author.id, author_name="a")
+    db.add_all([reply, item, summary])
+    db.commit()
+    targets = {models.BoardPost: post.id, models.BoardReply: reply.id, models.MarketItem: item.id, models.CourseSummary: summary.id}
+    return [u.id for u in users], targets
+
+def _toggle_with_retry(session_factory, like_model, column, target_model, target_id, user_id) -> None:
+    # SQLite の書き込みロック待ちが timeout を超えた場合はロールバックしてやり直す
+    for _attempt in range(20):
+        db = session_factory()
+        try:
+            like_service.toggle_like(db, like_model, column, target_id, user_id, target_model=target_model)
+            db.commit()
+            return
+        except OperationalError:
+            db.rollback()
+        finally:
+            db.close()
+    raise AssertionError("書き込みロックが解放されませんでした")
+
+def test_parallel_toggles_keep_like_count_exact(session_factory):
+    with session_factory() as db:
+        user_ids, target_ids = _seed(db)
+
+    errors: list[BaseException] = []
+    start = threading.Barrier(USERS * THREADS_PER_USER)
+
+    def worker(user_id: int) -> None:
+        try:
+            start.wait()
+            for _ in range(TOGGLES):
+                for target_model, like_model, column in TARGETS:
+                    _toggle_with_retry(session_factory, like_model, column, target_model, target_ids[target_model], user_id)
+        except BaseException as e:  # スレッド内の失敗をテスト本体へ伝える
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=worker, args=(user_id,))
+        for user_id in user_ids
+        for _ in range(THREADS_PER_USER)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+
+    with session_factory() as db:
+        for target_model, like_model, column in TARGETS:
+            target_id = target_ids[target_model]
+            like_count = db.query(target_model.like_count).filter(target_model.id == target_id).scalar()
+            rows = db.query(func.count(like_model.id)).filter(getattr(like_model, column) == target_id).scalar()
+            assert like_count == rows, f"{target_model.__tablename__}: like_count={like_count} rows={rows}"
+            assert 0 <= rows <= USERS
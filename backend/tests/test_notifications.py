@@ -0,0 +1,102 @@
+"""
+notifications のアウトボックスと重複除外のテスト
+
+- 同期モード（set_sync）で未読の同じいいね通知を重複させないこと
+- flush の再試行: 書き込めない行が他の通知を止めず、MAX_ATTEMPTS 回で捨てられること
+- 再試行で遅れて書き込まれた通知の created_at が、先に書き込まれた通知より新しいこと
+
+実行: cd backend && python -m pytest tests
+"""
+
+import pytest
+from sqlalchemy.exc import OperationalError
+import models
+import notifications
+
+@pytest.fixture
+def outbox(session_factory, monkeypatch):
+    monkeypatch.setattr(notifications, "_outbox", [])
+    notifications.install(session_factory)
+    yield session_factory
+    notifications.set_sync(False)
+
+def _users(db, count: int = 2) -> list[int]:
+    users = [models.User(email=f"n{i}@example.ac.jp", anonymous_name=f"n{i}") for i in range(count)]
+    db.add_all(users)
+    db.commit()
+    return [u.id for u in users]
+
+def _liked(db, user_id: int, actor_id: int) -> None:
+    notifications.enqueue(db, user_id, actor_id, "reply_liked", "board_reply", 1, title="いいね", message="liked")
+
+def _rows(db, user_id: int) -> list[models.Notification]:
+    return db.query(models.Notification).filter(models.Notification.user_id == user_id).order_by(models.Notification.id).all()
+
+def test_sync_delivery_skips_duplicate_unread_likes(outbox):
+    notifications.set_sync(True)
+    with outbox() as db:
+        owner, actor = _users(db)
+        _liked(db, owner, actor)
+        db.commit()
+        _liked(db, owner, actor)
+        db.commit()
+        assert len(_rows(db, owner)) == 1
+        assert notifications.unread_counts(db, owner)["unread_count"] == 1
+
+        # 既読にした後の同じ通知は新しく追加する
+        notifications.mark_read(db, _rows(db, owner)[0])
+        db.commit()
+        _liked(db, owner, actor)
+        db.commit()
+        assert len(_rows(db, owner)) == 2
+        assert notifications.unread_counts(db, owner)["unread_count"] == 1
+
+def test_flush_drops_poison_row_after_max_attempts(outbox):
+    with outbox() as db:
+        owner, actor = _users(db)
+        _liked(db, owner, actor)
+        # entity_type は NOT NULL のため書き込めない
+        notifications.enqueue(db, owner, actor, "post_replied", None, 1, message="bad")
+        notifications.enqueue(db, owner, actor, "post_replied", "board_post", 2, message="ok")
+        db.commit()
+    assert len(notifications._outbox) == 3
+
+    assert notifications.flush(outbox) == 2
+    assert [(row["message"], attempts) for row, attempts in notifications._outbox] == [("bad", 1)]
+    for _ in range(notifications.MAX_ATTEMPTS - 1):
+        assert notifications.flush(outbox) == 0
+    assert notifications._outbox == []
+
+    with outbox() as db:
+        assert sorted(n.message for n in _rows(db, owner)) == ["liked", "ok"]
+        assert notifications.unread_counts(db, owner)["unread_count"] == 2
+
+def test_retried_rows_are_stamped_when_written(outbox, monkeypatch):
+    with outbox() as db:
+        owner, actor = _users(db)
+        notifications.enqueue(db, owner, actor, "post_replied", "board_post", 1, message="late")
+        db.commit()
+
+    # DB障害（OperationalError）では回数に数えずに戻す
+    def unavailable(db, rows):
+        raise OperationalError("INSERT", {}, Exception("database is unavailable"))
+    with monkeypatch.context() as m:
+        m.setattr(notifications, "deliver", unavailable)
+        assert notifications.flush(outbox) == 0
+    assert [attempts for _, attempts in notifications._outbox] == [0]
+
+    # 再試行までの間に別の通知が書き込まれ、クライアントが取得したとする
+    notifications.set_sync(True)
+    with outbox() as db:
+        notifications.enqueue(db, owner, actor, "post_replied", "board_post", 2, message="seen")
+        db.commit()
+        seen_at = _rows(db, owner)[-1].created_at
+    notifications.set_sync(False)
+
+    assert notifications.flush(outbox) == 1
+    with outbox() as db:
+        late = db.query(models.Notification).filter(
+            models.Notification.user_id == owner,
+            models.Notification.created_at > seen_at,
+        ).all()
+        assert [n.message for n in late] == ["late"]
@@ -0,0 +1,105 @@
+"""
+read_markers（既読マーカーの書き込み遅延バッファ）のテスト
+
+- 未反映の閲覧記録を基準に load_viewer_states の新着返信数を数えること
+- 同じキーへの複数回の閲覧が flush で新しい方の時刻に合流すること
+- flush 後の参加者数（新規の訪問行だけを数える）
+
+実行: cd backend && python -m pytest tests
+"""
+
+from datetime import timedelta
+import pytest
+import models
+import read_markers
+import board_routes
+
+BASE = models.jst_now().replace(microsecond=0) - timedelta(hours=1)
+
+@pytest.fixture(autouse=True)
+def buffers(monkeypatch):
+    monkeypatch.setattr(read_markers, "_reply_views", {})
+    monkeypatch.setattr(read_markers, "_visits", {})
+
+def _post_with_replies(db, minutes: list[int]) -> tuple[int, int]:
+    """返信を BASE + minutes 分の時刻で作成し (閲覧者ID, 投稿ID) を返す"""
+    author = models.User(email="a@example.ac.jp", anonymous_name="a")
+    viewer = models.User(email="v@example.ac.jp", anonymous_name="v")
+    db.add_all([author, viewer])
+    db.flush()
+    post = models.BoardPost(board_id="1", content="post", author_id=author.id, author_name="a")
+    db.add(post)
+    db.flush()
+    db.add_all([
+        models.BoardReply(post_id=post.id, content=f"r{m}", author_id=author.id, author_name="a",
+                          created_at=BASE + timedelta(minutes=m))
+        for m in minutes
+    ])
+    db.commit()
+    return viewer.id, post.id
+
+def _new_replies(db, viewer_id: int, post_id: int) -> int:
+    return board_routes.load_viewer_states(db, [post_id], viewer_id)[post_id]["new_replies_since_my_last_reply"]
+
+def test_pending_view_is_the_threshold_for_new_replies(session_factory):
+    with session_factory() as db:
+        viewer_id, post_id = _post_with_replies(db, [10, 20, 30])
+        db.add(models.BoardRepliesView(user_id=viewer_id, post_id=post_id, last_viewed_at=BASE + timedelta(minutes=5)))
+        db.commit()
+        assert _new_replies(db, viewer_id, post_id) == 3
+
+        # まだDBに書き込まれていない閲覧の時刻を基準にする
+        read_markers.mark_replies_viewed(viewer_id, post_id, BASE + timedelta(minutes=25))
+        assert _new_replies(db, viewer_id, post_id) == 1
+
+    assert read_markers.flush(session_factory) == 1
+    with session_factory() as db:
+        assert _new_replies(db, viewer_id, post_id) == 1
+
+def test_flush_merges_views_to_the_latest_time(session_factory):
+    with session_factory() as db:
+        viewer_id, post_id = _post_with_replies(db, [10, 20, 30])
+        db.add(models.BoardRepliesView(user_id=viewer_id, post_id=post_id, last_viewed_at=BASE + timedelta(minutes=5)))
+        db.commit()
+
+    read_markers.mark_replies_viewed(viewer_id, post_id, BASE + timedelta(minutes=25))
+    read_markers.mark_replies_viewed(viewer_id, post_id, BASE + timedelta(minutes=15))
+    assert read_markers.pending_reply_views(viewer_id, [post_id]) == {post_id: BASE + timedelta(minutes=25)}
+    assert read_markers.flush(session_factory) == 1
+    assert read_markers.pending_reply_views(viewer_id, [post_id]) == {}
+
+    # DBの値より古い閲覧は、DB側の新しい時刻を上書きしない
+    read_markers.mark_replies_viewed(viewer_id, post_id, BASE + timedelta(minutes=1))
+    assert read_markers.flush(session_factory) == 1
+    with session_factory() as db:
+        views = db.query(models.BoardRepliesView).filter(models.BoardRepliesView.user_id == viewer_id).all()
+        assert len(views) == 1
+        assert read_markers.effective_time(views[0].last_viewed_at, None) == BASE + timedelta(minutes=25)
+        assert _new_replies(db, viewer_id, post_id) == 1
+
+def test_flush_counts_only_new_visitors(session_factory):
+    with session_factory() as db:
+        users = [models.User(email=f"u{i}@example.ac.jp", anonymous_name=f"u{i}") for i in range(3)]
+        db.add_all(users)
+        db.commit()
+        alice, bob, carol = (u.id for u in users)
+
+    def participants(board_id: str) -> int:
+        with session_factory() as db:
+            stats = db.get(models.BoardStats, board_id)
+            return stats.participant_count if stats else 0
+
+    read_markers.mark_board_visited(alice, 1)
+    read_markers.mark_board_visited(alice, 1)
+    read_markers.mark_board_visited(bob, 1)
+    read_markers.mark_board_visited(alice, 2)
+    assert read_markers.flush(session_factory) == 3
+    assert (participants("1"), participants("2")) == (2, 1)
+
+    # 再訪問は数えず、新しい訪問者だけを加算する
+    read_markers.mark_board_visited(alice, 1)
+    read_markers.mark_board_visited(carol, 1)
+    assert read_markers.flush(session_factory) == 2
+    assert (participants("1"), participants("2")) == (3, 1)
+    with session_factory() as db:
+        assert db.query(models.BoardVisit).filter(models.BoardVisit.board_id == "1").count() == 3
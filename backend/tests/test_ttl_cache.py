@@ -0,0 +1,35 @@
+"""
+ttl_cache.TTLCache のテスト（LRU の追い出し・TTL の期限切れ・None のキャッシュ）
+
+実行: cd backend && python -m pytest tests
+"""
+
+import ttl_cache
+from ttl_cache import TTLCache
+
+def test_least_recently_used_entry_is_evicted():
+    evicted = []
+    cache = TTLCache(2, 60, on_evict=lambda key, value: evicted.append(key))
+    cache.put_many([("a", 1), ("b", 2)])
+    assert cache.get("a") == 1  # a を使ったので b が最も古い
+    cache.put("c", 3)
+    assert evicted == ["b"]
+    assert cache.get_many(["a", "b", "c"]) == ({"a": 1, "c": 3}, ["b"])
+
+def test_expired_entries_are_dropped(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    cache = TTLCache(10, 60)
+    cache.put("a", 1)
+    now[0] += 60
+    assert cache.get("a") == 1
+    now[0] += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_cached_none_counts_as_hit():
+    cache = TTLCache(10, 60)
+    cache.put("missing", None)
+    assert cache.get_many(["missing", "other"]) == ({"missing": None}, ["other"])
+    cache.pop("missing")
+    assert cache.get_many(["missing"]) == ({}, ["missing"])
@@ -0,0 +1,81 @@
+"""
+容量上限付きのLRU＋TTLキャッシュ（プロセス内・スレッドセーフ）
+
+profile_cache / name_resolver / identity で共用する。
+- 上限を超えたら最も長く使われていないものから捨て、TTL を過ぎたものは参照時に捨てる
+- 他ワーカーへの無効化は行わない（各モジュールの invalidate() と TTL で整合を取る）
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+class TTLCache:
+    def __init__(self, max_entries: int, ttl_seconds: float,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        """on_evict: 期限切れ・追い出し・pop で値が外れたときに (key, value) で呼ぶ（ロック内）"""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._on_evict = on_evict
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple[Any, float]]" = OrderedDict()  # key -> (値, 格納時刻)
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None and self._on_evict:
+            self._on_evict(key, entry[0])
+
+    def _get(self, key: Hashable):
+        """(見つかったか, 値)。値が None でもキャッシュされていれば見つかった扱い"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        value, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            self._drop(key)
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            hit, value = self._get(key)
+        return value if hit else default
+
+    def get_many(self, keys: Iterable[Hashable]) -> tuple[dict, list]:
+        """({キー: 値}, 未キャッシュのキー)"""
+        hits: dict = {}
+        misses: list = []
+        with self._lock:
+            for key in keys:
+                hit, value = self._get(key)
+                if hit:
+                    hits[key] = value
+                else:
+                    misses.append(key)
+        return hits, misses
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[tuple[Hashable, Any]]) -> None:
+        with self._lock:
+            for key, value in items:
+                self._drop(key)
+                self._entries[key] = (value, time.monotonic())
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def pop(self, *keys: Hashable) -> None:
+        with self._lock:
+            for key in keys:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -9,6 +9,7 @@ import { Heart, MessageCircle } from "lucide-react"
 // import Link from "next/link"
 import { useRouter } from "next/navigation"
 import { useCachedFetch } from "@/lib/api-cache"
+import { fetchReplyPage } from "@/lib/board-api"
 import { LoadingProgress } from "@/components/loading-progress"
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
@@ -59,10 +60,12 @@ export function PostFeed() {
   const [submittingReply, setSubmittingReply] = useState<number | null>(null)
   const [repliesByPost, setRepliesByPost] = useState<Record<number, any[]>>({})
   const [loadingRepliesPostId, setLoadingRepliesPostId] = useState<number | null>(null)
+  const [replyCursorByPost, setReplyCursorByPost] = useState<Record<number, string | null>>({})
+  const [loadingMoreRepliesPostId, setLoadingMoreRepliesPostId] = useState<number | null>(null)
   const [editingPostId, setEditingPostId] = useState<number | null>(null)
   const [editingContentByPost, setEditingContentByPost] = useState<Record<number, string>>({})
   const [savingEdit, setSavingEdit] = useState<number | null>(null)
-  const { fetchWithCache, getCached, invalidateCache } = useCachedFetch()
+  const { fetchWithCache, getCached, setCached, invalidateCache } = useCachedFetch()
 
   useEffect(() => {
     fetchFeed()
@@ -128,17 +131,24 @@ export function PostFeed() {
 
   const fetchRepliesForPost = async (postId: number) => {
     try {
+      const cacheKey = `replies-${postId}`
+      const cursorKey = `${cacheKey}:cursor`
+      const cached = getCached(cacheKey)
+      if (cached) {
+        setRepliesByPost(prev => ({ ...prev, [postId]: cached }))
+        setReplyCursorByPost(prev => ({ ...prev, [postId]: getCached(cursorKey) }))
+        return
+      }
       setLoadingRepliesPostId(postId)
       const userId = typeof window !== 'undefined' ? localStorage.getItem('user_id') : null
       const headers: any = {}
       if (userId) headers['X-User-Id'] = userId
-      const data = await fetchWithCache(
-        `${API_BASE_URL}/board/posts/${postId}/replies`,
-        { headers },
-        `replies-${postId}`,
-        600000 // 10分
-      )
-      setRepliesByPost(prev => ({ ...prev, [postId]: data || [] }))
+      // 1ページ目だけ取得し、続きは「さらに表示」でカーソルをたどる
+      const page = await fetchReplyPage(postId, headers)
+      setCached(cacheKey, page.replies, 600000) // 10分
+      setCached(cursorKey, page.nextCursor, 600000)
+      setRepliesByPost(prev => ({ ...prev, [postId]: page.replies }))
+      setReplyCursorByPost(prev => ({ ...prev, [postId]: page.nextCursor }))
     } catch {
       setRepliesByPost(prev => ({ ...prev, [postId]: [] }))
     } finally {
@@ -146,6 +156,27 @@ export function PostFeed() {
     }
   }
 
+  const loadMoreReplies = async (postId: number) => {
+    const cursor = replyCursorByPost[postId]
+    if (!cursor) return
+    try {
+      setLoadingMoreRepliesPostId(postId)
+      const userId = typeof window !== 'undefined' ? localStorage.getItem('user_id') : null
+      const headers: any = {}
+      if (userId) headers['X-User-Id'] = userId
+      const page = await fetchReplyPage(postId, headers, cursor)
+      const merged = [...(repliesByPost[postId] || []), ...page.replies]
+      setRepliesByPost(prev => ({ ...prev, [postId]: merged }))
+      setReplyCursorByPost(prev => ({ ...prev, [postId]: page.nextCursor }))
+      setCached(`replies-${postId}`, merged, 600000)
+      setCached(`replies-${postId}:cursor`, page.nextCursor, 600000)
+    } catch {
+      // noop
+    } finally {
+      setLoadingMoreRepliesPostId(null)
+    }
+  }
+
   // ナビゲーションは行わないためプリフェッチは無効化
 
   const getTimeDiff = (createdAt: string): string => {
@@ -425,6 +456,15 @@ export function PostFeed() {
                                     <div className="text-[13px] text-foreground whitespace-pre-wrap">{r.content}</div>
                                   </div>
                                 ))}
+                                {replyCursorByPost[post.id] && (
+                                  <button
+                                    className="w-full text-center text-[11px] text-muted-foreground hover:text-foreground"
+                                    onClick={() => loadMoreReplies(post.id)}
+                                    disabled={loadingMoreRepliesPostId === post.id}
+                                  >
+                                    {loadingMoreRepliesPostId === post.id ? '読み込み中...' : 'さらに返信を表示'}
+                                  </button>
+                                )}
                               </div>
                             ) : (
                               <div className="text-xs text-muted-foreground mb-2">まだ返信がありません</div>
@@ -527,6 +567,15 @@ export function PostFeed() {
                                   <div className="text-[13px] text-foreground whitespace-pre-wrap">{r.content}</div>
                                 </div>
                               ))}
+                              {replyCursorByPost[row.post.id] && (
+                                <button
+                                  className="w-full text-center text-[11px] text-muted-foreground hover:text-foreground"
+                                  onClick={() => loadMoreReplies(row.post.id)}
+                                  disabled={loadingMoreRepliesPostId === row.post.id}
+                                >
+                                  {loadingMoreRepliesPostId === row.post.id ? '読み込み中...' : 'さらに返信を表示'}
+                                </button>
+                              )}
                             </div>
                           ) : (
                             <div className="text-xs text-muted-foreground mb-2">まだ返信がありません</div>
@@ -647,6 +696,15 @@ export function PostFeed() {
                                     <div className="text-[13px] text-foreground whitespace-pre-wrap">{r.content}</div>
                                   </div>
                                 ))}
+                                {replyCursorByPost[post.id] && (
+                                  <button
+                                    className="w-full text-center text-[11px] text-muted-foreground hover:text-foreground"
+                                    onClick={() => loadMoreReplies(post.id)}
+                                    disabled={loadingMoreRepliesPostId === post.id}
+                                  >
+                                    {loadingMoreRepliesPostId === post.id ? '読み込み中...' : 'さらに返信を表示'}
+                                  </button>
+                                )}
                               </div>
                             ) : (
                               <div className="text-xs text-muted-foreground mb-2">まだ返信がありません</div>
@@ -6,6 +6,7 @@ import { MentionTextarea } from "@/components/ui/forms/mention-textarea"
 import { Heart, MessageCircle, Send, Loader2 } from "lucide-react"
 import { LoadingProgress } from "@/components/loading-progress"
 import { useCachedFetch } from "@/lib/api-cache"
+import { fetchReplyPage } from "@/lib/board-api"
 import { isAdminEmail } from "@/lib/utils"
 import { AvatarWithPopover } from "@/components/ui/avatar-with-popover"
 
@@ -102,9 +103,11 @@ export function PostList({ boardId, refreshKey, highlightPostId }: PostListProps
   const [replyContent, setReplyContent] = useState<{ [key: number]: string }>({})
   const [submittingReply, setSubmittingReply] = useState<number | null>(null)
   const [loadingReplies, setLoadingReplies] = useState<number | null>(null)
+  const [replyCursors, setReplyCursors] = useState<{ [key: number]: string | null }>({})
+  const [loadingMoreReplies, setLoadingMoreReplies] = useState<number | null>(null)
   const [isAdmin, setIsAdmin] = useState(false)
   
-  const { fetchWithCache, getCached, invalidateCache } = useCachedFetch()
+  const { fetchWithCache, getCached, setCached, invalidateCache } = useCachedFetch()
 
   useEffect(() => {
     const email = typeof window !== 'undefined' ? localStorage.getItem('user_email') : null
@@ -170,13 +173,15 @@ export function PostList({ boardId, refreshKey, highlightPostId }: PostListProps
   const fetchReplies = async (postId: number) => {
     try {
       const cacheKey = `replies-${postId}`
+      const cursorKey = `${cacheKey}:cursor`
       const cached = getCached(cacheKey)
       if (cached) {
         setReplies(prev => ({ ...prev, [postId]: cached }))
+        setReplyCursors(prev => ({ ...prev, [postId]: getCached(cursorKey) }))
         setLoadingReplies(null)
-      } else {
-        setLoadingReplies(postId)
+        return
       }
+      setLoadingReplies(postId)
       const userId = localStorage.getItem('user_id')
       
       const headers: any = {}
@@ -184,14 +189,13 @@ export function PostList({ boardId, refreshKey, highlightPostId }: PostListProps
         headers['X-User-Id'] = userId
       }
       
-      const data = await fetchWithCache(
-        `${API_BASE_URL}/board/posts/${postId}/replies`,
-        { headers },
-        cacheKey,
-        -1 // sticky
-      )
+      // 1ページ目だけ取得し、続きは「さらに表示」でカーソルをたどる
+      const page = await fetchReplyPage<Reply>(postId, headers)
+      setCached(cacheKey, page.replies, -1) // sticky
+      setCached(cursorKey, page.nextCursor, -1)
 
-      setReplies(prev => ({ ...prev, [postId]: data }))
+      setReplies(prev => ({ ...prev, [postId]: page.replies }))
+      setReplyCursors(prev => ({ ...prev, [postId]: page.nextCursor }))
     } catch (err: any) {
       console.error('返信取得エラー:', err)
     } finally {
@@ -199,6 +203,27 @@ export function PostList({ boardId, refreshKey, highlightPostId }: PostListProps
     }
   }
 
+  const loadMoreReplies = async (postId: number) => {
+    const cursor = replyCursors[postId]
+    if (!cursor) return
+    try {
+      setLoadingMoreReplies(postId)
+      const userId = localStorage.getItem('user_id')
+      const headers: any = {}
+      if (userId) headers['X-User-Id'] = userId
+      const page = await fetchReplyPage<Reply>(postId, headers, cursor)
+      const merged = [...(replies[postId] || []), ...page.replies]
+      setReplies(prev => ({ ...prev, [postId]: merged }))
+      setReplyCursors(prev => ({ ...prev, [postId]: page.nextCursor }))
+      setCached(`replies-${postId}`, merged, -1)
+      setCached(`replies-${postId}:cursor`, page.nextCursor, -1)
+    } catch (err: any) {
+      console.error('返信取得エラー:', err)
+    } finally {
+      setLoadingMoreReplies(null)
+    }
+  }
+
   const toggleReplies = async (postId: number) => {
     if (expandedPostId === postId) {
       // 閉じる
@@ -475,6 +500,15 @@ export function PostList({ boardId, refreshKey, highlightPostId }: PostListProps
                           </div>
                         </div>
                       ))}
+                      {replyCursors[post.id] && (
+                        <button
+                          className="w-full text-center py-1 text-[12px] text-muted-foreground hover:text-foreground"
+                          onClick={() => loadMoreReplies(post.id)}
+                          disabled={loadingMoreReplies === post.id}
+                        >
+                          {loadingMoreReplies === post.id ? '読み込み中...' : 'さらに返信を表示'}
+                        </button>
+                      )}
                     </div>
                   ) : (
                     <div className="text-center py-2 text-muted-foreground text-[12px]">
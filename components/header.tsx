@@ -45,7 +45,8 @@ export function Header() {
       try {
         const userId = typeof window !== 'undefined' ? localStorage.getItem('user_id') : null
         const email = typeof window !== 'undefined' ? localStorage.getItem('user_email') : null
-        const res = await fetch(`${API_BASE_URL}/market/notifications`, {
+        // 未読数だけを取得（サーバー側のカウンタを読むだけで一覧は取得しない）
+        const res = await fetch(`${API_BASE_URL}/market/notifications/unread-count`, {
           headers: {
             ...(userId ? { 'X-User-Id': userId } : {}),
             ...(email ? { 'X-Dev-Email': email } : {}),
@@ -54,11 +55,8 @@ export function Header() {
         })
         if (!res.ok) return
         const data = await res.json()
-        const list = Array.isArray(data) ? data : []
-        const dmUnread = list.filter((n:any) => n?.type === 'dm_message' && !n?.is_read).length
-        const otherUnread = list.filter((n:any) => n?.type !== 'dm_message' && !n?.is_read).length
-        setDmUnreadCount(dmUnread)
-        setUnreadCount(otherUnread)
+        setDmUnreadCount(Number(data?.dm_unread_count) || 0)
+        setUnreadCount(Number(data?.unread_count) || 0)
       } catch {}
     }
     fetchNotifications()
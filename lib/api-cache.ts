@@ -159,6 +159,12 @@ export function useCachedFetch() {
     }
   }, [])
 
+  const setCached = useCallback((cacheKey: string, data: any, ttl: number = 30000) => {
+    try {
+      apiCache.set(cacheKey, data, ttl)
+    } catch {}
+  }, [])
+
   const invalidateCache = useCallback((pattern?: string) => {
     if (pattern) {
       // パターンにマッチするキャッシュを削除
@@ -173,7 +179,7 @@ export function useCachedFetch() {
     }
   }, [])
   
-  return { fetchWithCache, getCached, invalidateCache, loading }
+  return { fetchWithCache, getCached, setCached, invalidateCache, loading }
 }
 
 // 並列API呼び出し用のフック
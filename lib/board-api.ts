@@ -0,0 +1,33 @@
+// 掲示板のAPIクライアント（返信のカーソルページング）
+
+const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
+
+export interface ReplyPage<T = any> {
+  replies: T[]
+  nextCursor: string | null
+}
+
+// 投稿の返信を1ページ取得（続きは X-Next-Cursor のカーソルで取得する）
+export const fetchReplyPage = async <T = any>(
+  postId: number,
+  headers: HeadersInit = {},
+  cursor?: string | null
+): Promise<ReplyPage<T>> => {
+  const params = new URLSearchParams()
+  if (cursor) params.set('cursor', cursor)
+  const query = params.toString()
+  const response = await fetch(
+    `${API_BASE_URL}/board/posts/${postId}/replies${query ? `?${query}` : ''}`,
+    {
+      headers: {
+        'Cache-Control': 'no-store',
+        ...headers,
+      },
+    }
+  )
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`)
+  }
+  const replies = await response.json()
+  return { replies, nextCursor: response.headers.get('X-Next-Cursor') }
+}
@@ -55,12 +55,23 @@ export interface MarketFilter {
   offset?: number
 }
 
+export interface MarketPriceStats {
+  count: number
+  min: number
+  median: number
+  p90: number
+}
+
 export interface MarketStats {
   total_items: number
   buy_items: number
   sell_items: number
   free_items: number
   categories: { [key: string]: number }
+  by_type?: { [type: string]: number }
+  category_types?: { [category: string]: { [type: string]: number } }
+  price_stats?: { [category: string]: MarketPriceStats }
+  generated_at?: string
 }
 
 // 市場商品一覧を取得
@@ -199,12 +210,15 @@ export interface MarketItemComment {
   content: string
   author_name: string
   created_at: string
+  like_count?: number
+  is_liked?: boolean
 }
 
 export const getItemComments = async (itemId: string): Promise<MarketItemComment[]> => {
   // Next.js API Route経由でCORS回避
   const response = await fetch(`/api/market/comments/${itemId}`, {
     method: 'GET',
+    headers: getHeaders(),
     cache: 'no-store'
   })
   if (!response.ok) throw new Error('コメント取得に失敗しました')